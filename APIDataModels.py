@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Literal, Annotated
 
-from pydantic import BaseModel, validator, Field, root_validator, field_validator
+from pydantic import BaseModel, validator, Field, root_validator, field_validator, model_validator
 
 
 class CommonResponse(BaseModel):
@@ -31,6 +31,18 @@ def set_response_model(code: int, message: str, response_type: str = None, **kwa
     return data
 
 
+# Размер страницы по умолчанию и максимальный размер страницы для постраничной выдачи
+PAGE_LIMIT_DEFAULT = 100
+PAGE_LIMIT_MAX = 1000
+
+
+class PageRequest(BaseModel):
+    limit: int = Field(description="Максимальное количество записей на странице", ge=1, le=PAGE_LIMIT_MAX,
+                       default=PAGE_LIMIT_DEFAULT, examples=[PAGE_LIMIT_DEFAULT])
+    cursor: str = Field(description="Курсор следующей страницы (next_cursor из предыдущего ответа)", default=None,
+                        max_length=200, examples=["WzEwMF0"])
+
+
 class OrganizationInfo(BaseModel):
     id: int = Field(description="ID организации", examples=[1])
     name: str = Field(description="Название организации", min_length=1, max_length=50, examples=["ООО Рога и Копыта"])
@@ -47,7 +59,7 @@ example_organization_info_2 = OrganizationInfo(id = 2, name = "Автозапч
                                                activities = ["Грузовые", "Легковые"],
                                                address = "г. Москва, ул. Ленина, 1, офис 3").model_dump()
 
-class BuildingSearchOrganization(BaseModel):
+class BuildingSearchOrganization(PageRequest):
     building_id: int = Field(description="ID здания", examples=[1])
 
 
@@ -57,11 +69,12 @@ class BuildingSearchOrganizationResponse(CommonResponse):
                                                      examples=[[example_organization_info_1, example_organization_info_2]],
                                                      default=None)
         qty: int = Field(description="Количество найденных организаций", examples=[2], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
 
     detail: BuildingSearchOrganizationRes
 
 
-class ActivitySearchOrganization(BaseModel):
+class ActivitySearchOrganization(PageRequest):
     activity: str = Field(description="Вид деятельности", min_length=2, max_length=20, examples=["Колбасы"])
 
 
@@ -69,11 +82,12 @@ class ActivitySearchOrganizationResponse(CommonResponse):
     class OrganizationSearchActivityRes(CommonResponseDetail):
         organization: List[OrganizationInfo] = Field(description="Найденные организации", examples=[[example_organization_info_1]], default=None)
         qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
 
     detail: OrganizationSearchActivityRes
 
 
-class OrganizationSearchCoordinateRadius(BaseModel):
+class OrganizationSearchCoordinateRadius(PageRequest):
     latitude: float = Field(description="Широта", ge=-90.0, le=90.0, examples=[43.15])
     longitude: float = Field(description="Долгота", ge=-180.0, le=180.0, examples=[64.20])
     radius: float = Field(description="Радиус области области поиска в километрах", gt=0, le=6371, examples=[1.1])
@@ -82,11 +96,12 @@ class OrganizationSearchCoordinateRadiusResponse(CommonResponse):
     class OrganizationSearchCoordinateRadiusRes(CommonResponseDetail):
         organization: List[OrganizationInfo] = Field(description="Найденные организации", examples=[[example_organization_info_2]], default=None)
         qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
 
     detail: OrganizationSearchCoordinateRadiusRes
 
 
-class OrganizationSearchCoordinateRectangle(BaseModel):
+class OrganizationSearchCoordinateRectangle(PageRequest):
     latitude: float = Field(description="Координата широты стартовой точки поиска (центр области поиска)", ge=-90.0, le=90.0, examples=[43.15])
     longitude: float = Field(description="Координата долготы стартовой точки поиска (центр области поиска)", ge=-180.0, le=180.0, examples=[64.20])
     latitude_offset: float = Field(description="Размер области поиска по широте (запад-восток) в километрах",
@@ -99,10 +114,122 @@ class OrganizationSearchCoordinateRectangleResponse(CommonResponse):
     class OrganizationSearchCoordinateRectangleRes(CommonResponseDetail):
         organization: List[OrganizationInfo] = Field(description="Найденные организации", examples=[[example_organization_info_1, example_organization_info_2]], default=None)
         qty: int = Field(description="Количество найденных организаций", examples=[2], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
 
     detail: OrganizationSearchCoordinateRectangleRes
 
 
+# Количество ближайших организаций по умолчанию и максимальное количество
+NEAREST_LIMIT_DEFAULT = 10
+NEAREST_LIMIT_MAX = PAGE_LIMIT_MAX
+
+
+class OrganizationSearchCoordinateNearest(BaseModel):
+    latitude: float = Field(description="Широта", ge=-90.0, le=90.0, examples=[43.15])
+    longitude: float = Field(description="Долгота", ge=-180.0, le=180.0, examples=[64.20])
+    limit: int = Field(description="Количество ближайших организаций", ge=1, le=NEAREST_LIMIT_MAX,
+                       default=NEAREST_LIMIT_DEFAULT, examples=[NEAREST_LIMIT_DEFAULT])
+
+
+class OrganizationDistanceInfo(OrganizationInfo):
+    distance_km: float = Field(description="Расстояние от точки до здания организации в километрах", examples=[0.35])
+
+
+class OrganizationSearchCoordinateNearestResponse(CommonResponse):
+    class OrganizationSearchCoordinateNearestRes(CommonResponseDetail):
+        organization: List[OrganizationDistanceInfo] = Field(description="Найденные организации в порядке удаления от точки",
+                                                             examples=[[{**example_organization_info_2, "distance_km": 0.35}]],
+                                                             default=None)
+        qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+
+    detail: OrganizationSearchCoordinateNearestRes
+
+
+def check_search_area(data, required: bool):
+    """
+    Проверяет, что область поиска задана целиком: точка и либо радиус, либо оба размера прямоугольника.
+
+    :param data: Запрос с полями latitude, longitude, radius, latitude_offset, longitude_offset
+    :param required: Область поиска обязательна
+    :return: Тот же запрос
+    """
+    rectangle = data.latitude_offset is not None or data.longitude_offset is not None
+    point = data.latitude is not None or data.longitude is not None
+    if not required and not point and data.radius is None and not rectangle:
+        return data
+    if data.latitude is None or data.longitude is None:
+        raise ValueError("Для области поиска нужны обе координаты точки: latitude и longitude")
+    if (data.radius is not None) == rectangle:
+        raise ValueError("Укажите либо radius, либо latitude_offset и longitude_offset")
+    if rectangle and (data.latitude_offset is None or data.longitude_offset is None):
+        raise ValueError("Для прямоугольной области нужны оба размера: latitude_offset и longitude_offset")
+    return data
+
+
+class OrganizationSearchCombined(PageRequest):
+    latitude: float = Field(description="Широта центра области поиска", ge=-90.0, le=90.0, examples=[55.75])
+    longitude: float = Field(description="Долгота центра области поиска", ge=-180.0, le=180.0, examples=[37.62])
+    radius: float = Field(description="Радиус области поиска в километрах (либо размеры прямоугольной области)",
+                          gt=0, le=6371, default=None, examples=[2])
+    latitude_offset: float = Field(description="Размер прямоугольной области поиска по широте в километрах",
+                                   gt=0, le=6371, default=None, examples=[None])
+    longitude_offset: float = Field(description="Размер прямоугольной области поиска по долготе в километрах",
+                                    gt=0, le=6371, default=None, examples=[None])
+    activity: str = Field(description="Вид деятельности (включая вложенные виды)", min_length=2, max_length=20,
+                          examples=["Еда"])
+    building_id: int = Field(description="ID здания (необязательно)", ge=1, default=None, examples=[None])
+
+    @model_validator(mode="after")
+    def check_area(self):
+        return check_search_area(self, required=True)
+
+
+class OrganizationSearchCombinedResponse(CommonResponse):
+    class OrganizationSearchCombinedRes(CommonResponseDetail):
+        organization: List[OrganizationDistanceInfo] = Field(description="Найденные организации в порядке удаления от точки",
+                                                             examples=[[{**example_organization_info_1, "distance_km": 1.2}]],
+                                                             default=None)
+        qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
+
+    detail: OrganizationSearchCombinedRes
+
+
+class ActivityFacets(BaseModel):
+    latitude: float = Field(description="Широта центра области", ge=-90.0, le=90.0, default=None, examples=[55.75])
+    longitude: float = Field(description="Долгота центра области", ge=-180.0, le=180.0, default=None, examples=[37.62])
+    radius: float = Field(description="Радиус области в километрах (либо размеры прямоугольной области)",
+                          gt=0, le=6371, default=None, examples=[None])
+    latitude_offset: float = Field(description="Размер прямоугольной области по широте в километрах",
+                                   gt=0, le=6371, default=None, examples=[2])
+    longitude_offset: float = Field(description="Размер прямоугольной области по долготе в километрах",
+                                    gt=0, le=6371, default=None, examples=[3])
+    activity: str = Field(description="Учитывать только организации этого вида деятельности (включая вложенные виды)",
+                          min_length=2, max_length=20, default=None, examples=[None])
+
+    @model_validator(mode="after")
+    def check_area(self):
+        return check_search_area(self, required=False)
+
+
+class ActivityFacetsResponse(CommonResponse):
+    class ActivityFacetsRes(CommonResponseDetail):
+        class ActivityFacet(BaseModel):
+            id: int = Field(description="ID вида деятельности", examples=[1])
+            name: str = Field(description="Название вида деятельности", examples=["Еда"])
+            parent_id: int = Field(description="ID родительского вида деятельности (null - корневой)", examples=[None],
+                                   default=None)
+            qty: int = Field(description="Количество организаций с этим или вложенным видом деятельности",
+                             examples=[120])
+        activity: List[ActivityFacet] = Field(description="Виды деятельности в порядке убывания количества организаций",
+                                              examples=[[{"id": 1, "name": "Еда", "parent_id": None, "qty": 120},
+                                                         {"id": 2, "name": "Мясная продукция", "parent_id": 1, "qty": 45}]],
+                                              default=None)
+        qty: int = Field(description="Количество видов деятельности", examples=[2], default=None)
+
+    detail: ActivityFacetsRes
+
+
 class OrganizationSearchId(BaseModel):
     organization_id: int = Field(description="ID организации", ge=1, examples=[1])
 
@@ -125,6 +252,97 @@ class OrganizationSearchNameResponse(CommonResponse):
     detail: OrganizationSearchNameRes
 
 
+# Размер выдачи по умолчанию и максимальный размер выдачи для поиска по части названия
+NAME_MATCH_LIMIT_DEFAULT = 10
+NAME_MATCH_LIMIT_MAX = 100
+
+
+class OrganizationSearchNameMatch(BaseModel):
+    organization_name: str = Field(description="Название или часть названия организации", min_length=2, max_length=50,
+                                   examples=["рога копыта"])
+    mode: Literal["fuzzy", "prefix"] = Field(description="Режим поиска: fuzzy - по сходству слов (допускает опечатки и "
+                                                         "пропуски слов), prefix - по началу названия",
+                                             default="fuzzy", examples=["fuzzy"])
+    limit: int = Field(description="Максимальное количество найденных организаций", ge=1, le=NAME_MATCH_LIMIT_MAX,
+                       default=NAME_MATCH_LIMIT_DEFAULT, examples=[NAME_MATCH_LIMIT_DEFAULT])
+
+    @field_validator("organization_name")
+    @classmethod
+    def normalize_name(cls, value: str) -> str:
+        # Пробелы схлопываются до проверки длины, иначе строка из пробелов превратилась бы в пустой шаблон поиска
+        value = " ".join(value.split())
+        if len(value) < 2:
+            raise ValueError("Название должно содержать не менее 2 символов, кроме пробелов")
+        return value
+
+
+class OrganizationMatchInfo(OrganizationInfo):
+    score: float = Field(description="Степень совпадения названия с запросом от 0 до 1", examples=[0.8])
+
+
+class OrganizationSearchNameMatchResponse(CommonResponse):
+    class OrganizationSearchNameMatchRes(CommonResponseDetail):
+        organization: List[OrganizationMatchInfo] = Field(description="Найденные организации в порядке убывания совпадения",
+                                                          examples=[[{**example_organization_info_1, "score": 0.8}]],
+                                                          default=None)
+        qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+
+    detail: OrganizationSearchNameMatchRes
+
+
+# Максимальное количество ID или названий в одном пакетном запросе
+BATCH_MAX_ITEMS = 1000
+
+
+class OrganizationSearchIdBatch(BaseModel):
+    organization_ids: List[Annotated[int, Field(ge=1)]] = Field(description="ID организаций", min_length=1,
+                                                                max_length=BATCH_MAX_ITEMS, examples=[[1, 2, 999]])
+
+
+class OrganizationSearchIdBatchResponse(CommonResponse):
+    class OrganizationSearchIdBatchRes(CommonResponseDetail):
+        class OrganizationIdBatchItem(BaseModel):
+            organization_id: int = Field(description="Запрошенный ID организации", examples=[1])
+            found: bool = Field(description="Организация найдена", examples=[True])
+            organization: OrganizationInfo = Field(description="Найденная организация (null - не найдена)", default=None)
+        organization: List[OrganizationIdBatchItem] = Field(description="Результаты в порядке запрошенных ID",
+                                                            examples=[[{"organization_id": 1, "found": True,
+                                                                        "organization": example_organization_info_1},
+                                                                       {"organization_id": 999, "found": False,
+                                                                        "organization": None}]],
+                                                            default=None)
+        qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+
+    detail: OrganizationSearchIdBatchRes
+
+
+class OrganizationSearchNameBatch(BaseModel):
+    organization_names: List[Annotated[str, Field(min_length=1, max_length=50)]] = Field(
+        description="Названия организаций", min_length=1, max_length=BATCH_MAX_ITEMS,
+        examples=[["ООО Рога и Копыта", "Нет такой"]]
+    )
+
+
+class OrganizationSearchNameBatchResponse(CommonResponse):
+    class OrganizationSearchNameBatchRes(CommonResponseDetail):
+        class OrganizationNameBatchItem(BaseModel):
+            organization_name: str = Field(description="Запрошенное название организации", examples=["ООО Рога и Копыта"])
+            found: bool = Field(description="Организация найдена", examples=[True])
+            organization: OrganizationInfo = Field(description="Найденная организация (null - не найдена). "
+                                                               "Если организаций с таким названием несколько - "
+                                                               "организация с наименьшим ID", default=None)
+        organization: List[OrganizationNameBatchItem] = Field(description="Результаты в порядке запрошенных названий",
+                                                              examples=[[{"organization_name": "ООО Рога и Копыта",
+                                                                          "found": True,
+                                                                          "organization": example_organization_info_1},
+                                                                         {"organization_name": "Нет такой",
+                                                                          "found": False, "organization": None}]],
+                                                              default=None)
+        qty: int = Field(description="Количество найденных организаций", examples=[1], default=None)
+
+    detail: OrganizationSearchNameBatchRes
+
+
 example_building_info_1 = {
     "id": 1,
     "address": "г. Москва, ул. Блюхера, 32/1",
@@ -140,6 +358,61 @@ class BuildingListAllResponse(CommonResponse):
             latitude: float = Field(description="Широта", examples=[42.11])
             longitude: float = Field(description="Долгота", examples=[45.10])
         building: List[BuildingInfo] = Field(description="Найденная организация", examples=[[example_building_info_1]], default=None)
+        next_cursor: str = Field(description="Курсор следующей страницы (null - страница последняя)", default=None)
 
     detail: BuildingListAllRes
 
+
+
+class CacheStatsResponse(CommonResponse):
+    class CacheStatsRes(CommonResponseDetail):
+        class CacheStats(BaseModel):
+            enabled: bool = Field(description="Кэш включен", examples=[True])
+            ttl: float = Field(description="Время жизни записи, сек", examples=[60])
+            entries: int = Field(description="Количество записей", examples=[120])
+            max_entries: int = Field(description="Максимальное количество записей", examples=[10000])
+            bytes: int = Field(description="Объем ответов в кэше, байт", examples=[524288])
+            max_bytes: int = Field(description="Максимальный объем ответов, байт", examples=[67108864])
+            hits: int = Field(description="Количество попаданий", examples=[900])
+            misses: int = Field(description="Количество промахов", examples=[100])
+            hit_ratio: float = Field(description="Доля попаданий", examples=[0.9])
+            evictions: int = Field(description="Количество вытесненных записей", examples=[0])
+            invalidations: int = Field(description="Количество сброшенных записей", examples=[15])
+            stale_skips: int = Field(description="Количество ответов, не сохраненных в кэш, потому что данные "
+                                                 "изменились во время их чтения", examples=[0])
+        cache: CacheStats = Field(description="Счетчики кэша ответов", default=None)
+
+    detail: CacheStatsRes
+
+
+class DatabasePoolStatsResponse(CommonResponse):
+    class DatabasePoolStatsRes(CommonResponseDetail):
+        class PoolStats(BaseModel):
+            pool_size: int = Field(description="Постоянных соединений в пуле", examples=[5])
+            max_overflow: int = Field(description="Максимум соединений сверх пула", examples=[10])
+            checked_in: int = Field(description="Свободных соединений", examples=[3])
+            checked_out: int = Field(description="Выданных соединений", examples=[2])
+            overflow: int = Field(description="Открыто соединений сверх пула", examples=[0])
+            timeout: float = Field(description="Время ожидания свободного соединения, сек", examples=[30])
+            recycle: int = Field(description="Время жизни соединения, сек (-1 - без ограничения)", examples=[1800])
+            pre_ping: bool = Field(description="Проверка соединения перед выдачей", examples=[False])
+            statement_cache_size: int = Field(description="Размер кэша подготовленных выражений", examples=[100])
+            checkouts: int = Field(description="Выдано соединений всего", examples=[1500], default=None)
+            waits: int = Field(description="Выдач с ожиданием соединения", examples=[12], default=None)
+            timeouts: int = Field(description="Отказов по таймауту ожидания", examples=[0], default=None)
+            wait_time_total_ms: float = Field(description="Суммарное время ожидания, мс", examples=[85.2], default=None)
+            wait_time_avg_ms: float = Field(description="Среднее время ожидания, мс", examples=[7.1], default=None)
+            wait_time_max_ms: float = Field(description="Максимальное время ожидания, мс", examples=[23.4], default=None)
+        class ReplicaStats(BaseModel):
+            host: str = Field(description="Адрес реплики", examples=["replica-1:5432/secunda"])
+            healthy: bool = Field(description="Реплика прошла последнюю проверку", examples=[True])
+            lag_s: float = Field(description="Отставание от основного сервера, сек", examples=[0.4], default=None)
+            error: str = Field(description="Ошибка последней проверки", examples=["Connection refused"], default=None)
+            sessions: int = Field(description="Выдано сессий чтения", examples=[1200])
+            pool: "DatabasePoolStatsResponse.DatabasePoolStatsRes.PoolStats" = Field(description="Состояние пула соединений")
+        pool: PoolStats = Field(description="Состояние пула соединений основного сервера", default=None)
+        replicas: List[ReplicaStats] = Field(description="Состояние реплик", default=None)
+        primary_read_sessions: int = Field(description="Сессий чтения, открытых на основном сервере", examples=[3],
+                                           default=None)
+
+    detail: DatabasePoolStatsRes
@@ -0,0 +1,100 @@
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from postgres_init.DBModels import ApiKey
+
+
+# Время жизни результата проверки действующего ключа в секундах. Отзыв ключа вступает в силу не позже, чем через это время
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", default=60))
+
+# Время жизни результата проверки неизвестного или отозванного ключа. Короче, чтобы новый ключ начинал работать быстро
+API_KEY_NEGATIVE_CACHE_TTL = float(os.getenv("API_KEY_NEGATIVE_CACHE_TTL", default=5))
+
+# Максимальное количество ключей в кэше. Ограничивает память при переборе случайных ключей
+API_KEY_CACHE_MAX_ENTRIES = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", default=10000))
+
+
+class AuthorizationFailed(Exception):
+    """Ключ доступа неизвестен или отозван"""
+
+
+class ApiKeyCache:
+    """
+    Процессный кэш результатов проверки ключей доступа: ID действующего ключа или отказ.
+    Ключи хранятся в кэше в виде хеша, как и в БД.
+    """
+
+    def __init__(self, ttl: float = API_KEY_CACHE_TTL, negative_ttl: float = API_KEY_NEGATIVE_CACHE_TTL,
+                 max_entries: int = API_KEY_CACHE_MAX_ENTRIES):
+        """
+        Конструктор класса
+
+        :param ttl: Время жизни результата для действующего ключа в секундах
+        :param negative_ttl: Время жизни результата для неизвестного или отозванного ключа в секундах
+        :param max_entries: Максимальное количество записей
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # Хеш ключа -> (момент истечения, ID ключа или None для отказа)
+        self.entries: OrderedDict[str, tuple[float, int | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def validate(self, key: str, session_factory) -> int | None:
+        """
+        Проверяет ключ доступа. В БД обращается только при отсутствии ключа в кэше или истечении записи.
+
+        :param key: Ключ доступа из заголовка запроса
+        :param session_factory: Фабрика асинхронных сессий БД
+        :return: ID действующего ключа или None, если ключ неизвестен или отозван
+        """
+        key_hash = ApiKey.hash_key(key)
+        entry = self.entries.get(key_hash)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(key_hash)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        async with session_factory() as db:
+            result = await db.execute(
+                select(ApiKey.id).where(ApiKey.key_hash == key_hash, ApiKey.revoked_at.is_(None))
+            )
+            key_id = result.scalar_one_or_none()
+
+        ttl = self.ttl if key_id is not None else self.negative_ttl
+        if ttl > 0 and self.max_entries > 0:
+            self.entries[key_hash] = (time.monotonic() + ttl, key_id)
+            self.entries.move_to_end(key_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return key_id
+
+    async def preload(self, db) -> int:
+        """
+        Заполняет кэш действующими ключами, чтобы первые запросы после запуска не обращались к БД.
+
+        :param db: Асинхронная сессия БД
+        :return: Количество загруженных ключей
+        """
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return 0
+        result = await db.execute(
+            select(ApiKey.key_hash, ApiKey.id).where(ApiKey.revoked_at.is_(None)).limit(self.max_entries)
+        )
+        expires_at = time.monotonic() + self.ttl
+        rows = result.all()
+        for key_hash, key_id in rows:
+            self.entries[key_hash] = (expires_at, key_id)
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+api_key_cache = ApiKeyCache()
@@ -0,0 +1,241 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+from sqlalchemy import event
+
+from ExtLogger import logger
+from postgres_init.DBModels import Organization, Building, Phone, Activity
+
+
+# Время жизни записи кэша ответов в секундах (0 - кэш отключен)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", default=60))
+
+# Ограничения размера кэша: количество записей и суммарный объем ответов в байтах
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", default=10000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", default=64 * 1024 * 1024))
+
+# Теги данных, от которых зависят ответы. По ним сбрасываются записи при изменении таблиц.
+TAG_ORGANIZATIONS = "organizations"
+TAG_BUILDINGS = "buildings"
+TAG_ACTIVITIES = "activities"
+ORGANIZATION_TAGS = (TAG_ORGANIZATIONS, TAG_BUILDINGS, TAG_ACTIVITIES)
+
+
+class CacheEntry:
+    """Запись кэша: готовое тело ответа, момент истечения и теги данных"""
+
+    __slots__ = ("body", "expires_at", "tags", "size")
+
+    def __init__(self, body: bytes, expires_at: float, tags: frozenset, size: int):
+        self.body = body
+        self.expires_at = expires_at
+        self.tags = tags
+        self.size = size
+
+
+class ResponseCache:
+    """Процессный кэш готовых ответов с ограничением времени жизни и вытеснением давно не использованных записей (LRU)"""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        """
+        Конструктор класса
+
+        :param ttl: Время жизни записи в секундах (0 - кэш отключен)
+        :param max_entries: Максимальное количество записей
+        :param max_bytes: Максимальный суммарный объем ответов в байтах
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Номер сброса: увеличивается при каждом сбросе, даже если сбрасывать было нечего
+        self.generation = 0
+        self.stale_skips = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Возвращает тело ответа из кэша.
+
+        :param key: Ключ запроса
+        :return: Тело ответа или None, если записи нет или она устарела
+        """
+        if not self.enabled:
+            return None
+
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.body
+
+    def put(self, key: str, body: bytes, tags=ORGANIZATION_TAGS, generation: int = None) -> None:
+        """
+        Сохраняет тело ответа в кэш, вытесняя давно не использованные записи при превышении ограничений.
+
+        :param key: Ключ запроса
+        :param body: Тело ответа
+        :param tags: Теги данных, при изменении которых запись должна быть сброшена
+        :param generation: Номер сброса (generation) на момент начала чтения данных ответа. Если с тех пор кэш
+                           сбрасывался, ответ мог быть прочитан до изменения данных и не сохраняется
+        """
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation:
+            self.stale_skips += 1
+            return
+
+        size = len(key) + len(body)
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = CacheEntry(body, time.monotonic() + self.ttl, frozenset(tags), size)
+        self.size += size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, *tags: str) -> int:
+        """
+        Сбрасывает записи, зависящие от указанных данных.
+
+        :param tags: Теги измененных данных (без тегов - сбрасываются все записи)
+        :return: Количество сброшенных записей
+        """
+        self.generation += 1
+        if not tags:
+            keys = list(self.entries)
+        else:
+            changed = set(tags)
+            keys = [key for key, entry in self.entries.items() if not changed.isdisjoint(entry.tags)]
+
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        if keys:
+            logger.debug(f"Response cache: invalidated {len(keys)} entries (tags: {', '.join(tags) or 'all'})")
+        return len(keys)
+
+    def stats(self) -> dict:
+        """
+        Возвращает счетчики кэша.
+
+        :return: Словарь со счетчиками попаданий, промахов, вытеснений и текущим размером кэша
+        """
+        requests = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_skips": self.stale_skips,
+        }
+
+
+def request_key(endpoint: str, data: BaseModel = None, **params) -> str:
+    """
+    Формирует ключ кэша из названия метода API и нормализованных параметров запроса.
+
+    :param endpoint: Название метода API
+    :param data: Модель тела запроса (после валидации, со значениями по умолчанию)
+    :param params: Дополнительные параметры запроса (query-параметры)
+    :return: Ключ кэша
+    """
+    values = data.model_dump(mode="json") if data is not None else {}
+    values.update(params)
+    return endpoint + ":" + json.dumps(values, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+# Номер сброса кэша на момент обращения к кэшу в текущем запросе (cached_response), то есть до чтения данных из БД.
+# Ответ, прочитанный до изменения данных, уведомление о котором пришло во время чтения, не сохраняется
+read_generation: ContextVar[int | None] = ContextVar("read_generation", default=None)
+
+
+def cached_response(key: str) -> Response | None:
+    """
+    Возвращает ответ из кэша и запоминает номер сброса кэша для cache_json_response.
+
+    :param key: Ключ запроса
+    :return: Ответ или None, если записи в кэше нет
+    """
+    read_generation.set(response_cache.generation)
+    body = response_cache.get(key)
+    if body is None:
+        return None
+    return Response(content=body, status_code=200, media_type='application/json')
+
+
+def cache_json_response(key: str, content: dict, tags=ORGANIZATION_TAGS) -> ORJSONResponse:
+    """
+    Формирует JSON-ответ и сохраняет его тело в кэш.
+
+    :param key: Ключ запроса
+    :param content: Содержимое ответа
+    :param tags: Теги данных, от которых зависит ответ
+    :return: JSON-ответ
+    """
+    response = ORJSONResponse(status_code=200, content=content, media_type='application/json')
+    response_cache.put(key, bytes(response.body), tags, generation=read_generation.get())
+    return response
+
+
+response_cache = ResponseCache()
+
+
+# Изменения, сделанные через ORM в этом процессе, сразу сбрасывают зависимые записи.
+# Изменения из других процессов перестают быть видны по истечении RESPONSE_CACHE_TTL.
+@event.listens_for(Organization, "after_insert")
+@event.listens_for(Organization, "after_update")
+@event.listens_for(Organization, "after_delete")
+@event.listens_for(Phone, "after_insert")
+@event.listens_for(Phone, "after_update")
+@event.listens_for(Phone, "after_delete")
+def _invalidate_organizations(mapper, connection, target):
+    response_cache.invalidate(TAG_ORGANIZATIONS)
+
+
+@event.listens_for(Building, "after_insert")
+@event.listens_for(Building, "after_update")
+@event.listens_for(Building, "after_delete")
+def _invalidate_buildings(mapper, connection, target):
+    response_cache.invalidate(TAG_BUILDINGS)
+
+
+@event.listens_for(Activity, "after_insert")
+@event.listens_for(Activity, "after_update")
+@event.listens_for(Activity, "after_delete")
+def _invalidate_activities(mapper, connection, target):
+    response_cache.invalidate(TAG_ACTIVITIES)
@@ -0,0 +1,254 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import text
+from starlette.responses import Response
+
+from ExtLogger import logger
+
+
+# Канал уведомлений PostgreSQL, в который триггеры (миграция 0007_data_version) отправляют новую версию данных
+DATA_VERSION_CHANNEL = "data_version"
+
+# Уведомление в канале версии данных о сбросе кэша ответов во всех процессах: "flush" и теги кэша через запятую
+# (без тегов - весь кэш). Версия данных при этом не меняется
+CACHE_FLUSH_PAYLOAD = "flush"
+
+# Пауза перед повторным подключением к БД для получения уведомлений в секундах
+DATA_VERSION_RECONNECT_INTERVAL = float(os.getenv("DATA_VERSION_RECONNECT_INTERVAL", default=5))
+
+# Время ожидания ответа БД при проверке подключения (версия перечитывается раз в DATA_VERSION_RECONNECT_INTERVAL)
+DATA_VERSION_HEARTBEAT_TIMEOUT = float(os.getenv("DATA_VERSION_HEARTBEAT_TIMEOUT", default=5))
+
+# Максимальное время ожидания версии данных при запуске приложения в секундах
+DATA_VERSION_STARTUP_TIMEOUT = 10
+
+# Описание ответа на условный запрос для документации Swagger
+NOT_MODIFIED_RESPONSES = {
+    304: {
+        "description": "Данные не изменились с версии, ETag которой указан в заголовке If-None-Match. "
+                       "Ответ передается без тела и без обращения к БД.",
+    }
+}
+
+
+class NotModified(Exception):
+    """Данные не изменились с версии, указанной клиентом в If-None-Match"""
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+class DataVersion:
+    """
+    Версия справочника в памяти процесса. Триггеры увеличивают ее в БД при любом изменении зданий, организаций,
+    телефонов, деятельностей и связей между ними и сообщают новое значение через NOTIFY, поэтому для проверки
+    актуальности данных клиента обращаться к БД не нужно.
+    """
+
+    def __init__(self, reconnect_interval: float = DATA_VERSION_RECONNECT_INTERVAL):
+        """
+        Конструктор класса
+
+        :param reconnect_interval: Пауза перед повторным подключением в секундах
+        """
+        self.reconnect_interval = reconnect_interval
+        # None - версия неизвестна (нет подключения или миграции), ETag не выдается
+        self.version: int | None = None
+        # Последняя известная версия, в том числе после потери подключения
+        self.last_version: int | None = None
+        self.changed_at = 0.0
+        self.notifications = 0
+        self.listeners: list[Callable[[set[str] | None], None]] = []
+        self.flush_listeners: list[Callable[[tuple[str, ...]], None]] = []
+        self._task = None
+        self._ready = asyncio.Event()
+
+    def add_listener(self, callback: Callable[[set[str] | None], None]) -> None:
+        """
+        Регистрирует обработчик изменения данных.
+
+        :param callback: Функция, которая получает множество измененных таблиц (None - изменения неизвестны)
+        """
+        self.listeners.append(callback)
+
+    def add_flush_listener(self, callback: Callable[[tuple[str, ...]], None]) -> None:
+        """
+        Регистрирует обработчик запроса на сброс кэша ответов, отправленного любым процессом (notify_cache_flush).
+
+        :param callback: Функция, которая получает теги сбрасываемых записей кэша (пустой кортеж - весь кэш)
+        """
+        self.flush_listeners.append(callback)
+
+    def _changed(self, version: int, tables: set[str] | None) -> None:
+        # Уведомления о версиях, которые уже учтены при чтении версии после подключения, пропускаются
+        if self.last_version is not None and version <= self.last_version:
+            self.version = self.last_version
+            return
+        self.version = self.last_version = version
+        self.changed_at = time.monotonic()
+        for callback in self.listeners:
+            try:
+                callback(tables)
+            except Exception as e:
+                logger.error(f"Data version listener failed: {str(e)}")
+
+    def _notified(self, connection, pid: int, channel: str, payload: str) -> None:
+        self.notifications += 1
+        # Версия и таблицы, измененные транзакцией, через запятую
+        version, _, tables = payload.partition(" ")
+        if version == CACHE_FLUSH_PAYLOAD:
+            tags = tuple(tag for tag in tables.split(",") if tag)
+            for callback in self.flush_listeners:
+                try:
+                    callback(tags)
+                except Exception as e:
+                    logger.error(f"Cache flush listener failed: {str(e)}")
+            return
+        self._changed(int(version), set(tables.split(",")) if tables else None)
+
+    @staticmethod
+    async def _read_version(connection) -> int | None:
+        """Версия данных из БД или None, если миграция 0007_data_version не применена"""
+        try:
+            return await connection.fetchval("SELECT version FROM data_version", timeout=DATA_VERSION_HEARTBEAT_TIMEOUT)
+        except asyncpg.UndefinedTableError:
+            return None
+
+    async def _listen(self, url: str) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(url)
+            except Exception as e:
+                logger.error(f"Failed to connect for data version notifications: {str(e)}")
+                self._ready.set()
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+
+            closed = asyncio.get_running_loop().create_future()
+            connection.add_termination_listener(lambda _: closed.done() or closed.set_result(None))
+            try:
+                # Подписка оформляется до чтения версии, чтобы не пропустить изменение между ними
+                await connection.add_listener(DATA_VERSION_CHANNEL, self._notified)
+                version = await self._read_version(connection)
+                if version is not None:
+                    # Изменения, сделанные пока уведомления не доставлялись (или до запуска), неизвестны
+                    self._changed(version, None)
+                    logger.info(f"Data version {version}, listening for changes")
+                else:
+                    # Без версии подключение остается открытым ради уведомлений о сбросе кэша
+                    logger.warning("Data version is not available (migration 0007_data_version is not applied), "
+                                   "ETags are disabled")
+                self._ready.set()
+                # Полуоткрытое соединение (после переключения основного сервера, по таймауту NAT или балансировщика)
+                # драйвер не закрывает, и уведомления просто перестают приходить. Поэтому версия периодически
+                # перечитывается: пропущенные изменения сбрасывают кэш, а ошибка или таймаут - повод переподключиться
+                while not closed.done():
+                    await asyncio.wait([closed], timeout=self.reconnect_interval)
+                    if closed.done():
+                        break
+                    version = await self._read_version(connection)
+                    if version is None:
+                        self.version = None
+                    else:
+                        self._changed(version, None)
+                logger.error("Data version notifications connection lost")
+            except Exception as e:
+                logger.error(f"Data version notifications failed: {str(e) or type(e).__name__}")
+                self._ready.set()
+            finally:
+                if not connection.is_closed():
+                    try:
+                        await connection.close(timeout=DATA_VERSION_HEARTBEAT_TIMEOUT)
+                    except Exception:
+                        connection.terminate()
+
+            self.version = None
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def start(self, url: str) -> None:
+        """
+        Запускает фоновую задачу получения уведомлений об изменении данных и ждет чтения текущей версии,
+        чтобы построенные после этого индексы и кэш не сбрасывались первым же значением версии.
+
+        :param url: Ссылка для подключения к основному серверу БД в формате asyncpg
+        """
+        self._ready.clear()
+        self._task = asyncio.create_task(self._listen(url))
+        try:
+            await asyncio.wait_for(self._ready.wait(), DATA_VERSION_STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Timed out waiting for the data version on startup")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.version = None
+
+    def etag(self, settle: float = 0) -> str | None:
+        """
+        Формирует ETag ответа по версии данных.
+
+        :param settle: Время в секундах после изменения данных, в течение которого ETag не выдается
+                       (например, пока изменение не дошло до реплик)
+        :return: ETag или None, если версия неизвестна
+        """
+        if self.version is None or time.monotonic() - self.changed_at < settle:
+            return None
+        return f'"v{self.version}"'
+
+    def stats(self) -> dict:
+        return {"version": self.version, "notifications": self.notifications}
+
+
+async def notify_cache_flush(db, tags: tuple[str, ...] = ()) -> None:
+    """
+    Просит все процессы приложения, в том числе на других серверах, сбросить кэш ответов.
+    Уведомление доставляется после фиксации транзакции, поэтому сессия фиксируется.
+
+    :param db: Сессия основного сервера БД
+    :param tags: Теги сбрасываемых записей кэша (пустой кортеж - весь кэш)
+    """
+    payload = " ".join((CACHE_FLUSH_PAYLOAD, ",".join(tags))).rstrip()
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": DATA_VERSION_CHANNEL, "payload": payload})
+    await db.commit()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Проверяет, совпадает ли ETag с одним из указанных клиентом в If-None-Match (слабое сравнение).
+
+    :param if_none_match: Значение заголовка If-None-Match
+    :param etag: Текущий ETag
+    :return: True - у клиента актуальные данные
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def with_etag(response: Response, etag: str | None) -> Response:
+    """
+    Добавляет в успешный ответ ETag версии данных.
+
+    :param response: Ответ
+    :param etag: ETag или None, если версия неизвестна
+    :return: Тот же ответ
+    """
+    if etag is not None:
+        response.headers["ETag"] = etag
+        # Потоковая выдача того же адреса (Accept: application/x-ndjson) ETag не получает
+        response.headers["Vary"] = "Accept"
+    return response
+
+
+data_version = DataVersion()
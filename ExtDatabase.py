@@ -0,0 +1,299 @@
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ExtLogger import logger
+
+
+# Постоянные соединения пула и дополнительные соединения сверх него при пиковой нагрузке
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", default=5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", default=10))
+# Время ожидания свободного соединения в секундах, после которого запрос завершается ошибкой
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", default=30))
+# Время жизни соединения в секундах (-1 - без ограничения)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", default=1800))
+# Проверка соединения перед выдачей из пула (дополнительный round-trip, но нет ошибок на разорванных соединениях)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", default="false").lower() in ("1", "true", "yes")
+# Размер кэша подготовленных выражений asyncpg на соединение (0 - отключен, нужно для PgBouncer в режиме transaction)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", default=100))
+# Время жизни подготовленного выражения в кэше asyncpg в секундах (0 - без ограничения)
+DB_STATEMENT_CACHE_LIFETIME = int(os.getenv("DB_STATEMENT_CACHE_LIFETIME", default=300))
+
+# Строки подключения к репликам БД через запятую. Методы чтения распределяются по репликам по кругу
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", default="").split(",") if url.strip()]
+# Интервал проверки доступности реплик в секундах
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", default=5))
+# Время ожидания ответа реплики при проверке в секундах
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", default=2))
+# Максимальное отставание реплики от основного сервера в секундах, при большем отставании чтение идет с основного
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", default=30))
+
+# Отставание реплики: 0, если сервер не реплика или применил все полученные изменения (у простаивающей реплики
+# время последней примененной транзакции устаревает, хотя отставания нет). NULL, если реплика не получает
+# изменения с основного сервера: после отключения WAL receiver полученная и примененная позиции тоже совпадают.
+# Статус WAL receiver виден ролям с правами pg_read_all_stats, остальным - только наличие процесса
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# Выдача соединения дольше этого времени в секундах считается ожиданием (включая открытие нового соединения)
+POOL_WAIT_THRESHOLD = 0.001
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Асинхронный пул соединений SQLAlchemy, который учитывает время получения соединения из пула"""
+
+    def __init__(self, *args, **kwargs):
+        AsyncAdaptedQueuePool.__init__(self, *args, **kwargs)
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def recreate(self):
+        # При пересоздании пула (например, после dispose) счетчики сохраняются
+        pool = AsyncAdaptedQueuePool.recreate(self)
+        pool.checkouts, pool.waits, pool.timeouts = self.checkouts, self.waits, self.timeouts
+        pool.wait_time_total, pool.wait_time_max = self.wait_time_total, self.wait_time_max
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return AsyncAdaptedQueuePool._do_get(self)
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.checkouts += 1
+            if elapsed > POOL_WAIT_THRESHOLD:
+                self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+
+
+def create_pool_engine(url: str, **kwargs) -> AsyncEngine:
+    """
+    Создает асинхронный движок БД с настройками пула соединений и драйвера из переменных окружения.
+
+    :param url: Строка подключения к БД
+    :param kwargs: Дополнительные аргументы create_async_engine
+    :return: Асинхронный движок БД
+    """
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        # prepared_statement_cache_size - кэш диалекта SQLAlchemy, statement_cache_size - кэш самого asyncpg
+        connect_args = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "max_cached_statement_lifetime": DB_STATEMENT_CACHE_LIFETIME,
+        }
+
+    return create_async_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+        **kwargs
+    )
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    """
+    Возвращает состояние и счетчики пула соединений.
+
+    :param engine: Асинхронный движок БД
+    :return: Словарь с размером пула, количеством выданных соединений и временем ожидания соединения
+    """
+    pool = engine.pool
+    # Настройки, для которых у пула нет публичных методов, берутся из конфигурации (create_pool_engine)
+    stats = {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "timeout": pool.timeout(),
+        "recycle": DB_POOL_RECYCLE,
+        "pre_ping": DB_POOL_PRE_PING,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "waits": pool.waits,
+            "timeouts": pool.timeouts,
+            "wait_time_total_ms": round(pool.wait_time_total * 1000, 3),
+            "wait_time_avg_ms": round(pool.wait_time_total * 1000 / pool.waits, 3) if pool.waits else 0.0,
+            "wait_time_max_ms": round(pool.wait_time_max * 1000, 3),
+        })
+
+    return stats
+
+
+async def warm_pool(engine: AsyncEngine, connections: int = DB_POOL_SIZE) -> None:
+    """
+    Заранее открывает постоянные соединения пула, чтобы первые запросы не ждали установки соединения с БД.
+    Соединения удерживаются одновременно, иначе пул выдавал бы одно и то же соединение.
+
+    :param engine: Асинхронный движок БД
+    :param connections: Количество соединений
+    """
+    async with AsyncExitStack() as stack:
+        for _ in range(connections):
+            connection = await stack.enter_async_context(engine.connect())
+            await connection.execute(text("SELECT 1"))
+
+
+class Replica:
+    """Реплика БД: движок, фабрика сессий и результат последней проверки доступности"""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.sessionmaker = async_sessionmaker(bind=engine)
+        # До первой проверки реплика считается недоступной, чтение идет с основного сервера
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.sessions = 0
+
+    @property
+    def name(self) -> str:
+        """Адрес реплики без учетных данных: хост (или каталог Unix-сокета), порт и имя БД"""
+        url = self.engine.url
+        host = url.host or url.query.get("host", "")
+        return f"{host}:{url.port}/{url.database}" if url.port else f"{host}/{url.database}"
+
+
+class ReplicaRouter:
+    """
+    Распределяет сессии только для чтения по доступным репликам по кругу. Если доступных реплик нет
+    (или они не заданы), сессии открываются на основном сервере. Доступность реплик проверяется фоновой задачей.
+    """
+
+    def __init__(self, primary: AsyncEngine, urls: list = DATABASE_REPLICA_URLS, **kwargs):
+        """
+        Конструктор класса
+
+        :param primary: Движок основного сервера БД
+        :param urls: Строки подключения к репликам
+        :param kwargs: Дополнительные аргументы create_pool_engine для движков реплик
+        """
+        self.primary = primary
+        self.primary_sessionmaker = async_sessionmaker(bind=primary)
+        self.replicas = [Replica(create_pool_engine(url, **kwargs)) for url in urls]
+        self.primary_sessions = 0
+        self._next = 0
+        self._task = None
+
+    @property
+    def engines(self) -> list:
+        return [replica.engine for replica in self.replicas]
+
+    def session(self) -> AsyncSession:
+        """
+        Открывает сессию для чтения на следующей по кругу доступной реплике или на основном сервере.
+
+        :return: Асинхронная сессия БД
+        """
+        count = len(self.replicas)
+        for offset in range(count):
+            replica = self.replicas[(self._next + offset) % count]
+            if replica.healthy:
+                self._next = (self._next + offset + 1) % count
+                replica.sessions += 1
+                return replica.sessionmaker()
+
+        self.primary_sessions += 1
+        return self.primary_sessionmaker()
+
+    async def check(self, replica: Replica) -> None:
+        """
+        Проверяет доступность и отставание реплики. Недоступная или отстающая реплика исключается из распределения
+        до следующей успешной проверки.
+
+        :param replica: Реплика
+        """
+        async def probe():
+            async with replica.engine.connect() as connection:
+                return await connection.scalar(REPLICA_LAG_QUERY)
+
+        try:
+            # Таймаут охватывает и установку соединения: недоступный сервер может не отвечать на подключение
+            lag = await asyncio.wait_for(probe(), DB_REPLICA_CHECK_TIMEOUT)
+            if lag is None:
+                raise ConnectionError("WAL receiver is not streaming from the primary")
+            lag = float(lag)
+        except Exception as e:
+            if replica.healthy or replica.error is None:
+                logger.error(f"DB replica {replica.name} is unavailable: {str(e) or type(e).__name__}")
+            replica.healthy, replica.lag, replica.error = False, None, str(e) or type(e).__name__
+            return
+
+        healthy = lag <= DB_REPLICA_MAX_LAG
+        if healthy != replica.healthy:
+            logger.warning(f"DB replica {replica.name} is {'available' if healthy else 'lagging'}, "
+                           f"lag {lag:.1f} s")
+        replica.healthy, replica.lag, replica.error = healthy, lag, None
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+            await self.check_all()
+
+    async def start(self) -> None:
+        """Проверяет реплики и запускает их периодическую проверку"""
+        if not self.replicas:
+            return
+        await self.check_all()
+        self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        """Останавливает проверку реплик и закрывает их соединения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> list:
+        """
+        Возвращает состояние реплик.
+
+        :return: Список словарей с адресом, доступностью, отставанием, количеством выданных сессий и состоянием пула
+        """
+        return [
+            {
+                "host": replica.name,
+                "healthy": replica.healthy,
+                "lag_s": replica.lag,
+                "error": replica.error,
+                "sessions": replica.sessions,
+                "pool": pool_stats(replica.engine),
+            }
+            for replica in self.replicas
+        ]
@@ -1,9 +1,15 @@
-from fastapi import FastAPI
+import hmac
+
+from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import PlainTextResponse
+
+from ExtMetrics import MetricsRegistry, MetricsMiddleware, PROMETHEUS_MEDIA_TYPE
 
 
 class ModFastAPI(FastAPI):
-    def __init__(self, title: str, version: str, description: str, logo: str = None, **kwargs):
+    def __init__(self, title: str, version: str, description: str, logo: str = None, metrics_path: str = "/metrics",
+                 metrics_token: str = None, **kwargs):
         """
         Конструктор класса
 
@@ -11,6 +17,9 @@ class ModFastAPI(FastAPI):
         :param version: Версия приложения. Пример: 'v1.0.2'
         :param description: Поясняющий текст к заголовку документации Swagger
         :param logo: Ссылка на логотип к документации Swagger
+        :param metrics_path: Путь метрик запросов в формате Prometheus (None - метрики не собираются)
+        :param metrics_token: Токен доступа к метрикам в заголовке "Authorization: Bearer <токен>"
+                              (None - метрики доступны без авторизации)
         :param kwargs: Остальные аргументы для инициализации родительского класса FastAPI
         """
         FastAPI.__init__(self, **kwargs)
@@ -22,6 +31,19 @@ class ModFastAPI(FastAPI):
 
         self.openapi = self.custom_openapi
 
+        self.metrics = MetricsRegistry()
+        self.metrics_token = metrics_token
+        if metrics_path is not None:
+            self.add_middleware(MetricsMiddleware, registry=self.metrics)
+            self.add_api_route(metrics_path, self.metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+    async def metrics_endpoint(self, request: Request):
+        if self.metrics_token is not None:
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), self.metrics_token.encode()):
+                return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(self.metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
     def custom_openapi(self):
         if self.openapi_schema:
             return self.openapi_schema
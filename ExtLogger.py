@@ -1,6 +1,9 @@
 import logging
 import logging.config
 import logging.handlers
+import os
+
+from dotenv import load_dotenv
 
 
 config = {
@@ -29,9 +32,22 @@ config = {
   }
 }
 
+# Логгер импортируется раньше остальных модулей, которые читают настройки при импорте,
+# поэтому .env загружается здесь, а не только в app.py
+ENV_VARS = os.getenv("ENV_VARS", default=".env")
+
+try:
+    load_dotenv(ENV_VARS)
+except Exception as err:
+    print(f"Failed to load '{ENV_VARS}' file: {err}")
+
+# Уровень логирования приложения: DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", default="WARNING").upper()
+
+
 def setup_logging(logger_name: str) -> logging.Logger:
     logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.WARNING)
+    logger.setLevel(LOG_LEVEL)
 
     logging.config.dictConfig(config)
 
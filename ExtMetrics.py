@@ -0,0 +1,170 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограммы задержек в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метка маршрута для запросов, не попавших ни в один маршрут (чтобы произвольные пути не раздували число серий)
+UNMATCHED_ROUTE = "unmatched"
+
+# Ответы API начинаются с кода результата: {"code":0,...}
+RESPONSE_CODE_PREFIX = b'{"code":'
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def response_code(body: bytes) -> str:
+    """
+    Извлекает код результата из начала тела ответа API без разбора всего JSON.
+
+    :param body: Первая порция тела ответа
+    :return: Код результата или "none", если тело не является ответом API (ошибка валидации, поток NDJSON)
+    """
+    if not body.startswith(RESPONSE_CODE_PREFIX):
+        return "none"
+    end = body.find(b",", len(RESPONSE_CODE_PREFIX))
+    code = body[len(RESPONSE_CODE_PREFIX):end if end != -1 else None].strip(b"} ")
+    return code.decode() if code.lstrip(b"-").isdigit() else "none"
+
+
+class LatencyHistogram:
+    """Гистограмма задержек одного маршрута"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Метрики запросов процесса: гистограммы задержек по маршрутам, счетчики по кодам результата, запросы в работе"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: dict[tuple[str, str], LatencyHistogram] = {}
+        self.requests: dict[tuple[str, str, int, str], int] = {}
+        self.collectors: list[Callable[[], Iterable[tuple]]] = []
+
+    def observe(self, method: str, route: str, status: int, code: str, seconds: float) -> None:
+        """
+        Учитывает завершенный запрос.
+
+        :param method: HTTP-метод
+        :param route: Шаблон пути маршрута
+        :param status: HTTP-статус ответа
+        :param code: Код результата из тела ответа API
+        :param seconds: Длительность обработки запроса до отправки последней порции ответа
+        """
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = LatencyHistogram()
+        histogram.observe(seconds)
+
+        key = (method, route, status, code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        """
+        Добавляет источник метрик, значения которого снимаются в момент запроса /metrics.
+
+        :param collector: Функция, возвращающая кортежи (имя, тип, описание, значение[, метки])
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Формирует текст метрик в формате Prometheus.
+
+        :return: Текст метрик
+        """
+        lines = [
+            "# HELP http_requests_in_flight Requests being processed",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Completed requests by route, HTTP status and API result code",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status, code), count in sorted(self.requests.items()):
+            labels = format_labels({"method": method, "route": route, "status": status, "code": code})
+            lines.append(f"http_requests_total{labels} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by route",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            labels = {"method": method, "route": route}
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{format_labels(labels | {'le': bound})} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{format_labels(labels)} {histogram.total}")
+            lines.append(f"http_request_duration_seconds_count{format_labels(labels)} {histogram.count}")
+
+        described = set()
+        for collector in self.collectors:
+            for name, metric_type, description, value, *labels in collector():
+                if name not in described:
+                    lines.append(f"# HELP {name} {description}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    described.add(name)
+                lines.append(f"{name}{format_labels(labels[0] if labels else None)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware, которое измеряет длительность запросов и извлекает код результата из ответа"""
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        started = time.perf_counter()
+        status = 500
+        code = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, code
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and code is None:
+                code = response_code(message.get("body", b""))
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            # Маршрут появляется в scope после сопоставления пути роутером FastAPI
+            route = scope.get("route")
+            registry.observe(scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status, code or "none",
+                             time.perf_counter() - started)
@@ -0,0 +1,105 @@
+import os
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ExtLogger import logger
+
+
+# Заголовок Server-Timing с количеством и длительностью SQL-запросов в каждом ответе
+SQL_PROFILING = os.getenv("SQL_PROFILING", default="false").lower() in ("1", "true", "yes")
+
+# Запросы дольше этого времени в миллисекундах пишутся в лог с параметрами (0 - не логировать)
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", default=0))
+
+# Максимальная длина параметров запроса в логе (списки ID могут быть очень длинными)
+SQL_LOG_PARAMETERS_MAX_LENGTH = 1000
+
+
+class RequestProfile:
+    """Статистика SQL-запросов, выполненных при обработке одного HTTP-запроса"""
+
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", self.scope.get("path", ""))
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._profiling_started
+    profile = current_profile.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.db_time += elapsed
+
+    if SQL_SLOW_QUERY_MS > 0 and elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        route = profile.route if profile is not None else "-"
+        params = repr(parameters)
+        if len(params) > SQL_LOG_PARAMETERS_MAX_LENGTH:
+            params = params[:SQL_LOG_PARAMETERS_MAX_LENGTH] + "..."
+        logger.warning(f"Slow query {elapsed * 1000:.1f} ms on route {route}: {' '.join(statement.split())} "
+                       f"parameters: {params}")
+
+
+def install_sql_profiling(engine: Engine) -> None:
+    """
+    Подключает замер SQL-запросов к движку БД, если включен профилировщик или лог медленных запросов.
+
+    :param engine: Синхронный движок БД (для асинхронного - AsyncEngine.sync_engine)
+    """
+    if not (SQL_PROFILING or SQL_SLOW_QUERY_MS > 0):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    logger.info(f"SQL profiling {'enabled' if SQL_PROFILING else 'disabled'}, "
+                f"slow query threshold {SQL_SLOW_QUERY_MS or '-'} ms")
+
+
+class SQLProfilingMiddleware:
+    """
+    ASGI-middleware, которое собирает статистику SQL-запросов HTTP-запроса и добавляет в ответ заголовок
+    Server-Timing. Учитываются запросы, выполненные до начала отправки ответа (для потоковой выдачи - до первой строки).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                total = (time.perf_counter() - started) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries", '
+                                                f'app;dur={total:.2f}')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
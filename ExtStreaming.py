@@ -0,0 +1,56 @@
+from typing import AsyncIterator, Callable
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from APIDataModels import set_response_model
+from ExtLogger import logger
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Описание альтернативного формата ответа для документации Swagger
+NDJSON_RESPONSES = {
+    200: {
+        "description": f"При заголовке 'Accept: {NDJSON_MEDIA_TYPE}' записи передаются потоком, по одной JSON-записи "
+                       f"на строку, без ограничения страницы. Если во время передачи произошла ошибка, "
+                       f"последней строкой передается ответ с кодом ошибки.",
+        "content": {NDJSON_MEDIA_TYPE: {}},
+    }
+}
+
+
+def wants_ndjson(request: Request) -> bool:
+    """
+    Проверяет, запросил ли клиент потоковую выдачу в формате NDJSON.
+
+    :param request: Запрос клиента
+    :return: True - в заголовке Accept указан application/x-ndjson
+    """
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(rows: AsyncIterator, serialize: Callable[[object], dict], error_code: int) -> StreamingResponse:
+    """
+    Формирует потоковый ответ: каждая запись сериализуется и отправляется клиенту отдельной строкой сразу по мере чтения.
+
+    :param rows: Асинхронный итератор записей (должен сам открывать и закрывать сессию БД)
+    :param serialize: Функция преобразования записи в словарь
+    :param error_code: Код ошибки для последней строки, если чтение записей прервется
+    :return: Потоковый ответ
+    """
+    async def body():
+        qty = 0
+        try:
+            async for row in rows:
+                yield orjson.dumps(serialize(row), option=orjson.OPT_APPEND_NEWLINE)
+                qty += 1
+        except Exception as e:
+            logger.error(f"Error streaming NDJSON response after {qty} rows: {str(e)}")
+            response = set_response_model(code=error_code, message=f"Внутренняя ошибка сервера: {str(e)}")
+            yield orjson.dumps(response, option=orjson.OPT_APPEND_NEWLINE)
+            return
+        logger.info(f"Successfully streamed {qty} rows")
+
+    return StreamingResponse(body(), status_code=200, media_type=NDJSON_MEDIA_TYPE)
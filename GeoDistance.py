@@ -0,0 +1,237 @@
+import math
+
+import numpy as np
+
+
+# Радиус Земли в километрах
+EARTH_RADIUS_KM = 6371.0
+
+# Радиус сферы, которую PostGIS использует для geography при use_spheroid = false (средний радиус WGS 84)
+POSTGIS_SPHERE_RADIUS_KM = 6371.0087714
+
+# Верхняя оценка относительного расхождения векторного и поточечного расчета. SIMD-реализации
+# тригонометрии в NumPy (например, для AVX-512) могут отличаться от math на 1-2 ULP.
+DISTANCE_RELATIVE_TOLERANCE = 1e-12
+
+# Относительный запас размеров квадрата вокруг круга поиска на погрешность вычислений в градусах
+BOUNDING_BOX_MARGIN = 1e-9
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Вычисляет расстояние между двумя точками на Земле по формуле гаверсина.
+
+    Args:
+        lat1, lon1: Координаты первой точки (широта, долгота)
+        lat2, lon2: Координаты второй точки (широта, долгота)
+
+    Returns:
+        Расстояние в километрах
+    """
+    # Переводим градусы в радианы
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    # Разности координат
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    # Формула гаверсина
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def calculate_distances(latitude: float, longitude: float, latitudes, longitudes) -> np.ndarray:
+    """
+    Вычисляет расстояния от точки до массива точек по формуле гаверсина за один векторный проход.
+    Порядок операций повторяет calculate_distance, поэтому результаты совпадают с поточечным расчетом.
+
+    Args:
+        latitude, longitude: Координаты исходной точки (широта, долгота)
+        latitudes, longitudes: Последовательности координат точек назначения одинаковой длины
+
+    Returns:
+        Массив расстояний в километрах
+    """
+    lat1_rad = math.radians(latitude)
+    lon1_rad = math.radians(longitude)
+    lat2_rad = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2_rad = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def filter_sort_by_distance(latitude: float, longitude: float, latitudes, longitudes,
+                            radius_km: float = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Отбирает точки в радиусе от исходной и упорядочивает их по расстоянию (ближайшие сначала).
+    При равных расстояниях сохраняется исходный порядок точек.
+
+    Расстояния считаются одним векторным проходом. Точки на границе радиуса и группы почти равных
+    расстояний, где векторный расчет может разойтись с calculate_distance в последних разрядах,
+    пересчитываются поточечно, поэтому отбор и порядок точно совпадают с поточечным расчетом.
+
+    Args:
+        latitude, longitude: Координаты исходной точки (широта, долгота)
+        latitudes, longitudes: Последовательности координат точек одинаковой длины
+        radius_km: Радиус отбора в километрах (граница включается). None - без фильтрации
+
+    Returns:
+        Кортеж (индексы отобранных точек в порядке возрастания расстояния, расстояния в том же порядке)
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    distances = calculate_distances(latitude, longitude, latitudes, longitudes)
+
+    def exact(index: int) -> float:
+        return calculate_distance(latitude, longitude, float(latitudes[index]), float(longitudes[index]))
+
+    if radius_km is not None:
+        for index in np.flatnonzero(np.abs(distances - radius_km) <= radius_km * DISTANCE_RELATIVE_TOLERANCE):
+            distances[index] = exact(index)
+        indices = np.flatnonzero(distances <= radius_km)
+    else:
+        indices = np.arange(distances.shape[0])
+
+    order = indices[np.argsort(distances[indices], kind="stable")]
+    ordered = distances[order]
+
+    # Соседние почти равные расстояния уточняем и переупорядочиваем внутри группы
+    close = np.flatnonzero(np.diff(ordered) <= ordered[1:] * DISTANCE_RELATIVE_TOLERANCE)
+    position = 0
+    while position < close.size:
+        start = close[position]
+        while position + 1 < close.size and close[position + 1] == close[position] + 1:
+            position += 1
+        end = close[position] + 2
+        position += 1
+
+        group = sorted((exact(index), index) for index in order[start:end])
+        ordered[start:end] = [distance for distance, _ in group]
+        order[start:end] = [index for _, index in group]
+
+    return order, ordered
+
+
+def keyset_order(distances, ids, after: tuple[float, int] = None, limit: int = None) -> np.ndarray:
+    """
+    Упорядочивает записи по ключу (расстояние, ID) и отбирает страницу строго после ключа after.
+
+    Args:
+        distances: Последовательность расстояний
+        ids: Последовательность ID той же длины
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+        limit: Максимальное количество записей. None - без ограничения
+
+    Returns:
+        Массив позиций отобранных записей в порядке возрастания ключа
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    ids = np.asarray(ids, dtype=np.int64)
+
+    positions = np.arange(distances.shape[0])
+    if after is not None:
+        after_distance, after_id = after
+        positions = np.flatnonzero((distances > after_distance) | ((distances == after_distance) & (ids > after_id)))
+
+    order = positions[np.lexsort((ids[positions], distances[positions]))]
+
+    return order if limit is None else order[:limit]
+
+
+def km_to_degrees(km: float, latitude: float) -> tuple[float, float]:
+    """
+    Преобразует километры в градусы с учетом широты.
+
+    Args:
+        km: Расстояние в километрах
+        latitude: Широта для корректировки расчета долготы
+
+    Returns:
+        Кортеж (смещение по широте в градусах, смещение по долготе в градусах)
+    """
+    # Один градус широты примерно равен 111.32 км
+    lat_degrees = km / 111.32
+
+    # Один градус долготы зависит от широты
+    # На экваторе 1° долготы = ~111.32 км, но уменьшается к полюсам
+    lon_degrees = km / (111.32 * math.cos(math.radians(latitude))) if math.cos(
+        math.radians(latitude)) != 0 else km / 111.32
+
+    return lat_degrees, lon_degrees
+
+
+def radius_to_degrees(km: float, latitude: float) -> tuple[float, float]:
+    """
+    Вычисляет размеры квадрата вокруг точки, в который гарантированно попадает круг радиуса km
+    (по calculate_distance). В отличие от km_to_degrees, считает по сфере EARTH_RADIUS_KM и учитывает,
+    что на сфере круг шире по долготе, чем дуга параллели той же длины.
+
+    Args:
+        km: Радиус круга в километрах
+        latitude: Широта центра круга
+
+    Returns:
+        Кортеж (смещение по широте в градусах, смещение по долготе в градусах)
+    """
+    angle = km / EARTH_RADIUS_KM * (1 + BOUNDING_BOX_MARGIN)
+    lat_degrees = math.degrees(angle)
+
+    # Круг, содержащий полюс, захватывает все долготы
+    cos_latitude = math.cos(math.radians(latitude))
+    if abs(latitude) + lat_degrees >= 90 or math.sin(angle) >= cos_latitude:
+        return lat_degrees, 180.0
+    return lat_degrees, math.degrees(math.asin(math.sin(angle) / cos_latitude))
+
+
+def rectangle_circumradius_km(lat_offset_degrees: float, lon_offset_degrees: float) -> float:
+    """
+    Оценивает сверху расстояние от центра прямоугольной области до самой дальней ее точки.
+    Путь от центра до любой точки не длиннее дуги по меридиану плюс дуги по параллели.
+
+    Args:
+        lat_offset_degrees: Половина размера области по широте в градусах
+        lon_offset_degrees: Половина размера области по долготе в градусах
+
+    Returns:
+        Расстояние в километрах
+    """
+    return EARTH_RADIUS_KM * math.radians(lat_offset_degrees + lon_offset_degrees)
+
+
+def to_postgis_meters(km: float) -> float:
+    """
+    Переводит расстояние, посчитанное по сфере EARTH_RADIUS_KM, в метры на сфере PostGIS,
+    чтобы ST_DWithin отбирал те же точки, что и calculate_distance.
+
+    Args:
+        km: Расстояние в километрах
+
+    Returns:
+        Расстояние в метрах
+    """
+    return km * POSTGIS_SPHERE_RADIUS_KM / EARTH_RADIUS_KM * 1000
+
+
+def from_postgis_meters(meters: float) -> float:
+    """
+    Переводит расстояние в метрах на сфере PostGIS в километры на сфере EARTH_RADIUS_KM
+    (обратное преобразование к to_postgis_meters).
+
+    Args:
+        meters: Расстояние в метрах
+
+    Returns:
+        Расстояние в километрах
+    """
+    return meters / 1000 * EARTH_RADIUS_KM / POSTGIS_SPHERE_RADIUS_KM
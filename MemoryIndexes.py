@@ -0,0 +1,275 @@
+import asyncio
+import math
+import os
+import time
+
+from sqlalchemy import select, event
+
+from ExtLogger import logger
+from postgres_init.DBModels import Activity, Building
+
+
+# Максимальный уровень вложенности дерева деятельностей (по условию задачи)
+ACTIVITY_MAX_DEPTH = 3
+
+# Период принудительной перестройки индексов в секундах (0 - только по событиям изменения данных)
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", default=300))
+
+# Размер ячейки пространственного индекса зданий в градусах (0.01° по широте - примерно 1.1 км)
+GEO_INDEX_CELL_DEGREES = float(os.getenv("GEO_INDEX_CELL_DEGREES", default=0.01))
+
+
+class RefreshableIndex:
+    """Базовый класс процессного индекса в памяти, который строится по данным из БД"""
+
+    def __init__(self, refresh_interval: float = INDEX_REFRESH_INTERVAL):
+        """
+        Конструктор класса
+
+        :param refresh_interval: Период принудительной перестройки индекса в секундах (0 - не перестраивать по времени)
+        """
+        self.refresh_interval = refresh_interval
+        self.loaded_at = None
+        self.stale = True
+        self._lock = asyncio.Lock()
+
+    async def _build(self, db) -> None:
+        """
+        Строит содержимое индекса. Реализуется в наследниках.
+
+        :param db: Асинхронная сессия БД
+        """
+        raise NotImplementedError
+
+    def is_fresh(self) -> bool:
+        """
+        Проверяет, актуален ли индекс.
+
+        :return: True - индекс построен и не устарел, False - требуется перестройка
+        """
+        if self.stale or self.loaded_at is None:
+            return False
+        if self.refresh_interval <= 0:
+            return True
+        return time.monotonic() - self.loaded_at < self.refresh_interval
+
+    def invalidate(self) -> None:
+        """Помечает индекс устаревшим. Перестройка произойдет при следующем обращении."""
+        self.stale = True
+
+    async def rebuild(self, db) -> None:
+        """
+        Безусловно перестраивает индекс.
+
+        :param db: Асинхронная сессия БД
+        """
+        async with self._lock:
+            await self._rebuild(db)
+
+    async def ensure_fresh(self, db) -> None:
+        """
+        Перестраивает индекс, только если он устарел. Параллельные запросы дожидаются одной перестройки.
+
+        :param db: Асинхронная сессия БД
+        """
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if not self.is_fresh():
+                await self._rebuild(db)
+
+    async def _rebuild(self, db) -> None:
+        # Флаг сбрасываем до построения, чтобы не потерять изменения, пришедшие во время загрузки
+        self.stale = False
+        started = time.monotonic()
+        try:
+            await self._build(db)
+        except Exception:
+            self.stale = True
+            raise
+        self.loaded_at = time.monotonic()
+        logger.info(f"{self.__class__.__name__} rebuilt in {(self.loaded_at - started) * 1000:.1f} ms")
+
+
+class ActivityTreeIndex(RefreshableIndex):
+    """Индекс дерева деятельностей: поиск по названию и раскрытие поддеревьев без обращений к БД"""
+
+    def __init__(self, max_depth: int = ACTIVITY_MAX_DEPTH, **kwargs):
+        """
+        Конструктор класса
+
+        :param max_depth: Максимальная глубина раскрытия поддерева, включая сам узел
+        :param kwargs: Остальные аргументы для инициализации родительского класса
+        """
+        RefreshableIndex.__init__(self, **kwargs)
+        self.max_depth = max_depth
+        self.names: dict[int, str] = {}
+        self.parents: dict[int, int | None] = {}
+        self.subtrees: dict[int, frozenset[int]] = {}
+        self._casefolded: list[tuple[str, int]] = []
+
+    async def _build(self, db) -> None:
+        result = await db.execute(select(Activity.id, Activity.name, Activity.parent_id))
+        rows = result.all()
+
+        names = {}
+        parents = {}
+        children = {}
+        for activity_id, name, parent_id in rows:
+            names[activity_id] = name
+            parents[activity_id] = parent_id
+            children.setdefault(parent_id, []).append(activity_id)
+
+        subtrees = {}
+        for activity_id in names:
+            subtree = {activity_id}
+            level = [activity_id]
+            for _ in range(self.max_depth - 1):
+                level = [child for node in level for child in children.get(node, ())]
+                if not level:
+                    break
+                subtree.update(level)
+            subtrees[activity_id] = frozenset(subtree)
+
+        # Подменяем структуры целиком, чтобы читатели никогда не видели частично построенный индекс
+        self.names, self.parents, self.subtrees = names, parents, subtrees
+        self._casefolded = [(name.casefold(), activity_id) for activity_id, name in names.items()]
+
+    def find_ids(self, activity_name: str) -> set[int]:
+        """
+        Ищет виды деятельности, в названии которых встречается подстрока (без учета регистра).
+
+        :param activity_name: Название или часть названия вида деятельности
+        :return: Множество ID найденных видов деятельности
+        """
+        needle = activity_name.casefold()
+        return {activity_id for name, activity_id in self._casefolded if needle in name}
+
+    def expand(self, activity_ids) -> set[int]:
+        """
+        Раскрывает виды деятельности вместе с дочерними до максимальной глубины.
+
+        :param activity_ids: ID исходных видов деятельности
+        :return: Множество ID исходных и всех дочерних видов деятельности
+        """
+        expanded = set()
+        for activity_id in activity_ids:
+            expanded.update(self.subtrees.get(activity_id, ()))
+        return expanded
+
+    def search(self, activity_name: str) -> set[int]:
+        """
+        Получает ID всех видов деятельности по названию, включая дочерние до максимальной глубины.
+
+        :param activity_name: Название искомого вида деятельности
+        :return: Множество ID всех найденных видов деятельности
+        """
+        return self.expand(self.find_ids(activity_name))
+
+    def name(self, activity_id: int) -> str | None:
+        """
+        Возвращает название вида деятельности по ID.
+
+        :param activity_id: ID вида деятельности
+        :return: Название или None, если вид деятельности не найден
+        """
+        return self.names.get(activity_id)
+
+
+class BuildingGeoIndex(RefreshableIndex):
+    """Пространственный индекс зданий на регулярной сетке: выборка зданий в прямоугольнике без обращений к БД"""
+
+    def __init__(self, cell_degrees: float = GEO_INDEX_CELL_DEGREES, **kwargs):
+        """
+        Конструктор класса
+
+        :param cell_degrees: Размер ячейки сетки в градусах
+        :param kwargs: Остальные аргументы для инициализации родительского класса
+        """
+        RefreshableIndex.__init__(self, **kwargs)
+        self.cell_degrees = cell_degrees
+        self.coordinates: dict[int, tuple[float, float]] = {}
+        self.cells: dict[tuple[int, int], list[int]] = {}
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    async def _build(self, db) -> None:
+        result = await db.execute(select(Building.id, Building.latitude, Building.longitude))
+
+        coordinates = {}
+        cells = {}
+        for building_id, latitude, longitude in result.all():
+            coordinates[building_id] = (latitude, longitude)
+            cells.setdefault(self._cell(latitude, longitude), []).append(building_id)
+
+        self.coordinates, self.cells = coordinates, cells
+
+    def within(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> list[int]:
+        """
+        Ищет здания, координаты которых попадают в прямоугольник (границы включаются).
+
+        :param min_lat: Минимальная широта
+        :param max_lat: Максимальная широта
+        :param min_lon: Минимальная долгота
+        :param max_lon: Максимальная долгота
+        :return: Список ID найденных зданий
+        """
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        cells, coordinates = self.cells, self.coordinates
+
+        # Для очень больших областей дешевле перебрать только занятые ячейки, чем все ячейки области
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(cells):
+            candidate_cells = [
+                (row, col) for row, col in cells if min_row <= row <= max_row and min_col <= col <= max_col
+            ]
+        else:
+            candidate_cells = [
+                (row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)
+            ]
+
+        building_ids = []
+        for row, col in candidate_cells:
+            cell = cells.get((row, col))
+            if not cell:
+                continue
+            # Внутренние ячейки целиком лежат в прямоугольнике, проверка координат нужна только на границе
+            if min_row < row < max_row and min_col < col < max_col:
+                building_ids.extend(cell)
+                continue
+            for building_id in cell:
+                latitude, longitude = coordinates[building_id]
+                if min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon:
+                    building_ids.append(building_id)
+
+        return building_ids
+
+    def location(self, building_id: int) -> tuple[float, float] | None:
+        """
+        Возвращает координаты здания по ID.
+
+        :param building_id: ID здания
+        :return: Кортеж (широта, долгота) или None, если здание не найдено
+        """
+        return self.coordinates.get(building_id)
+
+
+activity_index = ActivityTreeIndex()
+building_geo_index = BuildingGeoIndex()
+
+
+# Изменения, сделанные через ORM в этом процессе, сразу помечают соответствующий индекс устаревшим.
+# Изменения из других процессов подхватываются по истечении INDEX_REFRESH_INTERVAL.
+@event.listens_for(Activity, "after_insert")
+@event.listens_for(Activity, "after_update")
+@event.listens_for(Activity, "after_delete")
+def _invalidate_activity_index(mapper, connection, target):
+    activity_index.invalidate()
+
+
+@event.listens_for(Building, "after_insert")
+@event.listens_for(Building, "after_update")
+@event.listens_for(Building, "after_delete")
+def _invalidate_building_geo_index(mapper, connection, target):
+    building_geo_index.invalidate()
@@ -0,0 +1,71 @@
+import base64
+import binascii
+import json
+import math
+
+
+# Границы целочисленных ключей: ID во всех таблицах справочника - integer (int4) PostgreSQL
+INT4_BOUNDS = (-2 ** 31, 2 ** 31 - 1)
+
+
+class InvalidCursor(ValueError):
+    """Курсор постраничной выдачи поврежден или выдан другим методом API"""
+
+
+def encode_cursor(*key) -> str:
+    """
+    Кодирует ключ последней записи страницы в непрозрачный курсор.
+
+    :param key: Значения ключа сортировки последней записи. Пример: (ID,) или (расстояние, ID)
+    :return: Курсор в виде base64url-строки
+    """
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, *types: type, int_bounds: tuple[int, int] = INT4_BOUNDS) -> tuple | None:
+    """
+    Декодирует курсор и проверяет, что ключ соответствует ожидаемым типам и помещается в колонки ключа.
+
+    :param cursor: Курсор из запроса клиента (None - первая страница)
+    :param types: Ожидаемые типы значений ключа. Пример: (int,) или (float, int)
+    :param int_bounds: Минимальное и максимальное значение целочисленных ключей (тип колонки в БД)
+    :return: Кортеж значений ключа или None для первой страницы
+    """
+    if cursor is None:
+        return None
+
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(key, list) or len(key) != len(types):
+        raise InvalidCursor(cursor)
+
+    values = []
+    for value, value_type in zip(key, types):
+        # bool - подкласс int, но в ключе сортировки не встречается
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidCursor(cursor)
+        if value_type is int and not isinstance(value, int):
+            raise InvalidCursor(cursor)
+        # Значение вне диапазона колонки (или NaN/Infinity, которые допускает json) иначе дошло бы до БД
+        if value_type is int and not int_bounds[0] <= value <= int_bounds[1]:
+            raise InvalidCursor(cursor)
+        if isinstance(value, float) and not math.isfinite(value):
+            raise InvalidCursor(cursor)
+        values.append(value_type(value))
+
+    return tuple(values)
+
+
+def split_page(rows: list, limit: int) -> tuple[list, bool]:
+    """
+    Отделяет страницу от лишней записи, запрошенной для проверки наличия следующей страницы.
+
+    :param rows: Записи, выбранные с ограничением limit + 1
+    :param limit: Размер страницы
+    :return: Кортеж из записей страницы и признака наличия следующей страницы
+    """
+    return rows[:limit], len(rows) > limit
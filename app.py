@@ -1,25 +1,44 @@
 import uvicorn
-from fastapi import Request, Header
-from fastapi.responses import JSONResponse
+from fastapi import Request, Header, Query, Response
+from fastapi.responses import ORJSONResponse
 import os
+from typing import List
 from dotenv import load_dotenv
 from fastapi import Depends
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy import and_
-import math
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import select, func, text, literal_column, true, exists, distinct
+from sqlalchemy import any_, bindparam, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from contextlib import asynccontextmanager
+from difflib import SequenceMatcher
 
 from ExtFastAPI import ModFastAPI
 from ExtLogger import logger
+from GeoDistance import km_to_degrees, radius_to_degrees, filter_sort_by_distance, keyset_order, rectangle_circumradius_km, \
+    to_postgis_meters, from_postgis_meters
+from Pagination import InvalidCursor, encode_cursor, decode_cursor, split_page
+from ExtStreaming import NDJSON_RESPONSES, wants_ndjson, ndjson_response
+from ExtDatabase import create_pool_engine, pool_stats, warm_pool, ReplicaRouter, DB_REPLICA_MAX_LAG
+from ExtProfiling import SQL_PROFILING, SQLProfilingMiddleware, install_sql_profiling
+from ExtAuth import AuthorizationFailed, api_key_cache
+from ExtDataVersion import NotModified, NOT_MODIFIED_RESPONSES, data_version, etag_matches, with_etag, \
+    notify_cache_flush
+from ExtCache import response_cache, request_key, cached_response, cache_json_response, \
+    TAG_ORGANIZATIONS, TAG_BUILDINGS, TAG_ACTIVITIES
 from APIDataModels import set_response_model, \
     ActivitySearchOrganizationResponse, ActivitySearchOrganization, OrganizationSearchCoordinateRadius, \
     OrganizationSearchCoordinateRadiusResponse, BuildingSearchOrganizationResponse, BuildingSearchOrganization, \
     OrganizationSearchCoordinateRectangleResponse, OrganizationSearchCoordinateRectangle, OrganizationSearchIdResponse, \
     OrganizationSearchId, OrganizationSearchName, OrganizationSearchNameResponse, BuildingListAllResponse, \
-    OrganizationInfo
+    OrganizationSearchNameMatch, OrganizationSearchNameMatchResponse, OrganizationSearchIdBatch, \
+    OrganizationSearchIdBatchResponse, OrganizationSearchNameBatch, OrganizationSearchNameBatchResponse, \
+    OrganizationSearchCoordinateNearest, OrganizationSearchCoordinateNearestResponse, OrganizationSearchCombined, \
+    OrganizationSearchCombinedResponse, ActivityFacets, ActivityFacetsResponse, \
+    CacheStatsResponse, DatabasePoolStatsResponse, PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX
 from postgres_init.database import DATABASE_URL
-from postgres_init.DBModels import Organization, Building, Phone, Activity, organization_activities
+from postgres_init.DBModels import Organization, Building, Phone, Activity, organization_phones, organization_activities, \
+    activity_closure, organization_cards
+from MemoryIndexes import activity_index, building_geo_index, ACTIVITY_MAX_DEPTH
 
 
 ENV_VARS = os.getenv("ENV_VARS", default=".env")
@@ -30,108 +49,898 @@ except Exception as err:
     print(f"Failed to load '{ENV_VARS}' file: {err}")
 
 API_HOST = os.getenv("API_HOST", default='0.0.0.0')
-API_PORT = os.getenv("API_PORT", default=8000)
+API_PORT = int(os.getenv("API_PORT", default=8000))
+
+# Режим запуска: development - один процесс с перезагрузкой при изменении кода, production - несколько воркеров
+SERVER_MODE = os.getenv("SERVER_MODE", default="development")
+
+
+def available_cpus() -> int:
+    """
+    Количество ядер, доступных процессу: маска привязки к ядрам, ограниченная квотой CPU cgroup.
+    В контейнере с --cpus маска содержит все ядра сервера, а ограничение задает только квота.
+
+    Returns:
+        Количество ядер (не меньше 1)
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # cgroup v2: "<квота> <период>" или "max <период>"; cgroup v1: квота и период в отдельных файлах
+    for quota_path, period_path in (("/sys/fs/cgroup/cpu.max", None),
+                                    ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")):
+        try:
+            with open(quota_path) as file:
+                values = file.read().split()
+            if period_path is not None:
+                with open(period_path) as file:
+                    values += file.read().split()
+            quota, period = values[0], int(values[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if quota not in ("max", "-1") and period > 0:
+            cpus = min(cpus, -(-int(quota) // period))
+        break
+    return max(cpus, 1)
+
+
+# Количество процессов-воркеров в режиме production (по умолчанию - по числу доступных процессу ядер с учетом
+# квоты CPU контейнера). Каждый воркер открывает до DB_POOL_SIZE + DB_MAX_OVERFLOW соединений с БД
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", default=0)) or available_cpus()
+# Время в секундах, в течение которого при остановке дообрабатываются принятые запросы
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", default=25))
 
 APP_TITLE = os.getenv("APP_TITLE", default='Справочник Организаций, Зданий, Деятельности.')
 APP_VERSION = os.getenv("APP_VERSION", default='v1.0.0')
 APP_DESCRIPTION = os.getenv("APP_DESCRIPTION", default="REST API справочника Организаций, Зданий, Деятельности.")
 APP_LOGO = os.getenv("APP_LOGO", default='https://i.pinimg.com/originals/e8/2e/c4/e82ec4007494891eac542ac464b9ec30.png')
 
-EXAMPLE_ACCESS_TOKEN = "ABC123"
+# Токен доступа к метрикам Prometheus (GET /metrics с заголовком "Authorization: Bearer <токен>").
+# Без токена метрики доступны без авторизации, и адрес /metrics должен быть доступен только из внутренней сети
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# Гео-поиск средствами PostGIS: auto - если в БД есть колонка buildings.location, off - всегда без PostGIS
+POSTGIS_SEARCH = os.getenv("POSTGIS_SEARCH", default="auto")
 
+# Начальный радиус расширяющегося поиска ближайших организаций в километрах (без PostGIS)
+NEAREST_SEARCH_START_RADIUS_KM = float(os.getenv("NEAREST_SEARCH_START_RADIUS_KM", default=1))
 
-app = ModFastAPI(title=APP_TITLE, version=APP_VERSION, description=APP_DESCRIPTION, logo=APP_LOGO)
+# Размер порции, которой записи читаются из БД при потоковой выдаче NDJSON
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", default=500))
 
-async_engine = create_async_engine(DATABASE_URL)
+# Минимальное сходство слов (pg_trgm word_similarity) для поиска организаций по части названия
+NAME_SEARCH_THRESHOLD = float(os.getenv("NAME_SEARCH_THRESHOLD", default=0.5))
+
+# Максимальное количество кандидатов, ранжируемых на стороне приложения, если в БД нет pg_trgm
+NAME_SEARCH_FALLBACK_CANDIDATES = int(os.getenv("NAME_SEARCH_FALLBACK_CANDIDATES", default=1000))
+
+
+async_engine = create_pool_engine(DATABASE_URL)
+install_sql_profiling(async_engine.sync_engine)
 AsyncSessionLocal = async_sessionmaker(bind=async_engine)
 
+# Методы поиска только читают данные, поэтому их сессии открываются на репликах (DATABASE_REPLICA_URLS),
+# а при недоступности реплик - на основном сервере. Запись и миграции выполняются только на основном сервере (get_db)
+replicas = ReplicaRouter(async_engine)
+for replica_engine in replicas.engines:
+    install_sql_profiling(replica_engine.sync_engine)
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
 
-# Функция проверки токена авторизации намеренно вынесена отдельно. Реализация RBAC зависит
-# от конкретного случая и здесь служит только для демонстрационных целей.
-async def check_bearer_token(token: str) -> (bool, str):
+async def get_read_db():
+    async with replicas.session() as session:
+        yield session
+
+
+# Таблицы справочника -> теги кэша ответов, зависящих от их данных
+DATA_VERSION_TABLE_TAGS = {
+    "buildings": TAG_BUILDINGS,
+    "activities": TAG_ACTIVITIES,
+    "organizations": TAG_ORGANIZATIONS,
+    "phones": TAG_ORGANIZATIONS,
+    "organization_phones": TAG_ORGANIZATIONS,
+    "organization_activities": TAG_ORGANIZATIONS,
+}
+
+
+def data_changed(tables: set[str] | None) -> None:
+    """
+    Сбрасывает кэш ответов и индексы в памяти при изменении данных, в том числе сделанном другим процессом
+    или в обход приложения (уведомление об изменении версии данных).
+
+    Args:
+        tables: Измененные таблицы. None - изменения неизвестны, сбрасывается все
+    """
+    if tables is None or not tables <= DATA_VERSION_TABLE_TAGS.keys():
+        response_cache.invalidate()
+        activity_index.invalidate()
+        building_geo_index.invalidate()
+        return
+
+    response_cache.invalidate(*{DATA_VERSION_TABLE_TAGS[table] for table in tables})
+    if "activities" in tables:
+        activity_index.invalidate()
+    if "buildings" in tables:
+        building_geo_index.invalidate()
+
+
+def cache_flush_requested(tags: tuple[str, ...]) -> None:
+    """
+    Сбрасывает кэш ответов по запросу другого процесса (DELETE /service/cache обрабатывается одним воркером).
+
+    Args:
+        tags: Теги сбрасываемых записей. Пустой кортеж - весь кэш
+    """
+    qty = response_cache.invalidate(*tags)
+    logger.info(f"Response cache: {qty} entries invalidated on notification")
+
+
+data_version.add_listener(data_changed)
+data_version.add_flush_listener(cache_flush_requested)
+
+
+@asynccontextmanager
+async def lifespan(app: ModFastAPI):
+    app.state.postgis = False
+    app.state.trigram = False
+    app.state.organization_cards = False
+
+    # Версия данных читается до построения индексов, иначе первое ее значение сбросило бы их
+    await data_version.start(DATABASE_URL.replace("+asyncpg", ""))
+
+    # Индексы в памяти строим до приема трафика. Если БД недоступна, они будут построены при первом запросе.
+    try:
+        async with AsyncSessionLocal() as db:
+            if POSTGIS_SEARCH != "off":
+                app.state.postgis = await detect_postgis(db)
+                logger.info(f"PostGIS geo search {'enabled' if app.state.postgis else 'unavailable'}")
+            app.state.trigram = await detect_trigram(db)
+            logger.info(f"Trigram name search {'enabled' if app.state.trigram else 'unavailable'}")
+            if ORGANIZATION_CARDS != "off":
+                app.state.organization_cards = await detect_organization_cards(db)
+                logger.info(f"Organization cards read model {'enabled' if app.state.organization_cards else 'unavailable'}")
+            await activity_index.rebuild(db)
+            await building_geo_index.rebuild(db)
+            logger.info(f"API key cache preloaded with {await api_key_cache.preload(db)} keys")
+    except Exception as e:
+        logger.error(f"Failed to build in-memory indexes on startup: {str(e)}")
+
+    # Соединения пула открываются до приема трафика, а не первыми запросами
+    try:
+        await warm_pool(async_engine)
+    except Exception as e:
+        logger.error(f"Failed to open DB pool connections on startup: {str(e)}")
+
+    await replicas.start()
+    for replica in replicas.replicas:
+        if replica.healthy:
+            try:
+                await warm_pool(replica.engine)
+            except Exception as e:
+                # Чтение идет с основного сервера до следующей успешной проверки реплики
+                logger.error(f"Failed to open DB replica {replica.name} pool connections on startup: {str(e)}")
+                replica.healthy, replica.error = False, str(e) or type(e).__name__
+
+    # Схема OpenAPI строится один раз и кэшируется в ModFastAPI.custom_openapi, первый запрос документации ее не ждет
+    app.openapi()
+    yield
+    await data_version.stop()
+    await replicas.stop()
+    await async_engine.dispose()
+
+
+app = ModFastAPI(title=APP_TITLE, version=APP_VERSION, description=APP_DESCRIPTION, logo=APP_LOGO,
+                 metrics_token=METRICS_TOKEN, lifespan=lifespan)
+if METRICS_TOKEN is None:
+    logger.warning("METRICS_TOKEN is not set, /metrics is served without authorization")
+if SQL_PROFILING:
+    app.add_middleware(SQLProfilingMiddleware)
+
+
+def service_metrics():
+    """Метрики кэша ответов, кэша ключей доступа и пула соединений БД для /metrics"""
+    cache = response_cache.stats()
+    yield "response_cache_hits_total", "counter", "Response cache hits", cache["hits"]
+    yield "response_cache_misses_total", "counter", "Response cache misses", cache["misses"]
+    yield "response_cache_evictions_total", "counter", "Response cache LRU evictions", cache["evictions"]
+    yield "response_cache_entries", "gauge", "Response cache entries", cache["entries"]
+    yield "response_cache_bytes", "gauge", "Response cache size in bytes", cache["bytes"]
+
+    api_keys = api_key_cache.stats()
+    yield "api_key_cache_hits_total", "counter", "API key validations served from cache", api_keys["hits"]
+    yield "api_key_cache_misses_total", "counter", "API key validations that queried the DB", api_keys["misses"]
+
+    version = data_version.stats()
+    if version["version"] is not None:
+        yield "data_version", "gauge", "Current dataset version", version["version"]
+    yield "data_version_notifications_total", "counter", "Dataset change notifications received", version["notifications"]
+
+    pool = pool_stats(async_engine)
+    yield "db_pool_size", "gauge", "DB connection pool size", pool["pool_size"]
+    yield "db_pool_checked_out", "gauge", "DB connections in use", pool["checked_out"]
+    yield "db_pool_overflow", "gauge", "DB connections opened above the pool size", pool["overflow"]
+    yield "db_pool_checkouts_total", "counter", "DB connection checkouts", pool["checkouts"]
+    yield "db_pool_waits_total", "counter", "DB connection checkouts that waited", pool["waits"]
+    yield "db_pool_timeouts_total", "counter", "DB connection checkouts that timed out", pool["timeouts"]
+    yield "db_pool_wait_seconds_total", "counter", "Total DB connection wait time", pool["wait_time_total_ms"] / 1000
+
+    yield "db_read_sessions_total", "counter", "Read-only sessions by server", replicas.primary_sessions, {"server": "primary"}
+    for replica in replicas.stats():
+        labels = {"server": replica["host"]}
+        yield "db_read_sessions_total", "counter", "Read-only sessions by server", replica["sessions"], labels
+        yield "db_replica_healthy", "gauge", "DB replica passed the last health check", int(replica["healthy"]), labels
+        if replica["lag_s"] is not None:
+            yield "db_replica_lag_seconds", "gauge", "DB replica replication lag", replica["lag_s"], labels
+        yield "db_replica_pool_checked_out", "gauge", "DB replica connections in use", replica["pool"]["checked_out"], labels
+
+
+app.metrics.add_collector(service_metrics)
+
+
+# Проверка ключа доступа подключается к методам API как общая зависимость. Ключи хранятся в БД в виде хеша,
+# результат проверки кэшируется в процессе, поэтому в БД проверка обращается не чаще раза в API_KEY_CACHE_TTL.
+# Разграничение прав по ключам (RBAC) зависит от конкретного случая и здесь не реализуется.
+async def require_api_key(
+        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+) -> int:
+    """
+    Проверяет ключ доступа из заголовка Authorization.
+
+    :param authorization: Ключ доступа
+    :return: ID ключа доступа
+    :raises AuthorizationFailed: Ключ неизвестен, отозван или не может быть проверен
+    """
+    try:
+        key_id = await api_key_cache.validate(authorization, AsyncSessionLocal)
+    except Exception as e:
+        logger.error(f"Failed to validate API key: {str(e)}")
+        raise AuthorizationFailed()
+
+    if key_id is None:
+        logger.error("Access denied: unknown or revoked API key")
+        raise AuthorizationFailed()
+    return key_id
+
+
+@app.exception_handler(AuthorizationFailed)
+async def authorization_failed(request: Request, exc: AuthorizationFailed):
+    response = set_response_model(code=1, message="Authorization failed")
+    return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+async def check_data_version(
+        request: Request,
+        if_none_match: str = Header(description="ETag ранее полученного ответа", default=None),
+        key_id: int = Depends(require_api_key)
+) -> str | None:
+    """
+    Сравнивает ETag клиента с текущей версией данных без обращения к БД.
+    Ответ 304 выдается только после проверки ключа доступа.
+
+    :param request: Запрос клиента
+    :param if_none_match: Значение заголовка If-None-Match
+    :param key_id: ID ключа доступа
+    :return: ETag для успешного ответа или None, если версия данных неизвестна или запрошена потоковая выдача
+    :raises NotModified: У клиента актуальные данные
+    """
+    # Версия, при которой начато чтение, входит в ключ кэша ответа: если данные изменятся во время чтения,
+    # устаревший ответ будет сохранен под старой версией и не попадет к клиентам с новым ETag
+    request.state.data_version = data_version.version
+    if wants_ndjson(request):
+        return None
+    # С репликами ETag выдается, только когда изменения должны были дойти до них, иначе клиент мог бы
+    # сохранить устаревший ответ реплики с новой версией
+    etag = data_version.etag(settle=DB_REPLICA_MAX_LAG if replicas.replicas else 0)
+    if etag is not None and etag_matches(if_none_match, etag):
+        raise NotModified(etag)
+    return etag
+
+
+@app.exception_handler(NotModified)
+async def not_modified(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Vary": "Accept"})
+
+
+def any_of(column, values):
+    """
+    Строит условие column = ANY(:values), передавая все значения одним параметром-массивом.
+    В отличие от IN (...) не упирается в ограничение PostgreSQL на количество параметров запроса.
+
+    Args:
+        column: Колонка для сравнения
+        values: Коллекция значений (ID, названий) того же типа, что и колонка
+
+    Returns:
+        Условие для конструкции where()
     """
-    Валидирует токен доступа.
+    return column == any_(bindparam(None, list(values), type_=ARRAY(column.type)))
+
+
+# Чтение карточек организаций из таблицы organization_cards: auto - если в БД есть триггеры, поддерживающие
+# ее в актуальном состоянии, off - карточки всегда собираются из нормализованных таблиц
+ORGANIZATION_CARDS = os.getenv("ORGANIZATION_CARDS", default="auto")
 
-    :param token: Токен авторизации.
-    :return: Кортеж из булевого значения (True - доступ разрешен, False - запрещен) и строки с описанием результата
+# Колонка geography создается миграцией только при наличии PostGIS, поэтому в ORM-модели ее нет
+BUILDING_LOCATION = literal_column("buildings.location")
+
+
+async def detect_postgis(db) -> bool:
     """
-    if token == EXAMPLE_ACCESS_TOKEN:
-        return False, "Access denied"
-    return True, "Access granted"
+    Проверяет, есть ли в БД колонка buildings.location (создается миграцией при наличии PostGIS).
+
+    Args:
+        db: Асинхронная сессия БД
 
-# По-хорошему, функцию нужно выносить отдельно, но не стал дробить проект еще больше.
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    Returns:
+        True - гео-поиск можно выполнять средствами PostGIS
+    """
+    result = await db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'buildings' AND column_name = 'location')"
+    ))
+    return bool(result.scalar())
+
+
+async def detect_trigram(db) -> bool:
     """
-    Вычисляет расстояние между двумя точками на Земле по формуле гаверсина.
+    Проверяет, установлено ли в БД расширение pg_trgm (устанавливается миграцией при наличии на сервере).
 
     Args:
-        lat1, lon1: Координаты первой точки (широта, долгота)
-        lat2, lon2: Координаты второй точки (широта, долгота)
+        db: Асинхронная сессия БД
 
     Returns:
-        Расстояние в километрах
+        True - поиск по сходству названий можно выполнять по триграммному индексу
+    """
+    result = await db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))
+    return bool(result.scalar())
+
+
+async def detect_organization_cards(db) -> bool:
     """
-    # Радиус Земли в километрах
-    R = 6371.0
+    Проверяет, поддерживается ли таблица organization_cards триггерами (создаются миграцией). Таблица без триггеров
+    может остаться от init_db.py, в ней нет актуальных данных.
 
-    # Переводим градусы в радианы
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
+    Args:
+        db: Асинхронная сессия БД
+
+    Returns:
+        True - карточки организаций можно читать из organization_cards
+    """
+    result = await db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'organizations_cards_insert' "
+        "AND tgrelid = to_regclass('organizations'))"
+    ))
+    return bool(result.scalar())
 
-    # Разности координат
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
 
-    # Формула гаверсина
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+def organization_cards_query(*columns, with_building: bool = False):
+    """
+    Строит запрос "карточек" организаций: ID, название, адрес здания, номера телефонов и названия видов
+    деятельности одной SQL-командой. Если доступна модель чтения, карточки читаются из organization_cards
+    по первичному ключу. Иначе телефоны и деятельности агрегируются в массивы LATERAL-подзапросами.
+    В обоих случаях на каждую организацию приходится одна строка результата без загрузки ORM-объектов,
+    а условия отбора задаются по колонкам Organization.
 
-    return R * c
+    Args:
+        columns: Дополнительные колонки результата (например, расстояние до точки)
+        with_building: Присоединить таблицу зданий для условий по колонкам Building
 
-# По-хорошему, функцию нужно выносить отдельно, но не стал дробить проект еще больше.
-def km_to_degrees(km: float, latitude: float) -> tuple[float, float]:
+    Returns:
+        Запрос строк с колонками id, name, address, phones, activities и дополнительными колонками
+    """
+    if app.state.organization_cards:
+        query = select(
+            Organization.id, organization_cards.c.name, organization_cards.c.address,
+            organization_cards.c.phones, organization_cards.c.activities, *columns
+        ).join_from(Organization, organization_cards, organization_cards.c.organization_id == Organization.id)
+        if with_building:
+            query = query.join(Building, Organization.building_id == Building.id)
+        return query
+
+    phones = select(
+        func.array_agg(aggregate_order_by(Phone.number, Phone.id)).label("phones")
+    ).select_from(
+        organization_phones.join(Phone, Phone.id == organization_phones.c.phone_id)
+    ).where(organization_phones.c.organization_id == Organization.id).lateral("organization_phone_numbers")
+
+    activities = select(
+        func.array_agg(aggregate_order_by(Activity.name, Activity.id)).label("activities")
+    ).select_from(
+        organization_activities.join(Activity, Activity.id == organization_activities.c.activity_id)
+    ).where(organization_activities.c.organization_id == Organization.id).lateral("organization_activity_names")
+
+    # Агрегат без GROUP BY всегда возвращает одну строку, поэтому соединения с подзапросами не теряют организации
+    return select(
+        Organization.id, Organization.name, Building.address, phones.c.phones, activities.c.activities, *columns
+    ).join_from(
+        Organization, Building, Organization.building_id == Building.id
+    ).join(phones, true()).join(activities, true())
+
+
+async def load_organizations(db, organization_ids) -> dict:
     """
-    Преобразует километры в градусы с учетом широты.
+    Загружает карточки организаций с указанными ID.
 
     Args:
-        km: Расстояние в километрах
-        latitude: Широта для корректировки расчета долготы
+        db: Асинхронная сессия БД
+        organization_ids: Коллекция ID организаций
 
     Returns:
-        Кортеж (смещение по широте в градусах, смещение по долготе в градусах)
+        Словарь {ID организации: карточка организации}
     """
-    # Один градус широты примерно равен 111.32 км
-    lat_degrees = km / 111.32
+    query = organization_cards_query().where(any_of(Organization.id, organization_ids))
 
-    # Один градус долготы зависит от широты
-    # На экваторе 1° долготы = ~111.32 км, но уменьшается к полюсам
-    lon_degrees = km / (111.32 * math.cos(math.radians(latitude))) if math.cos(
-        math.radians(latitude)) != 0 else km / 111.32
+    result = await db.execute(query)
+    return {organization.id: organization for organization in result.all()}
 
-    return lat_degrees, lon_degrees
+
+async def load_organizations_by_name(db, names) -> dict:
+    """
+    Загружает карточки организаций с указанными названиями.
+
+    Args:
+        db: Асинхронная сессия БД
+        names: Коллекция названий организаций
+
+    Returns:
+        Словарь {название: карточка организации}. Если организаций с одним названием несколько - с наименьшим ID
+    """
+    query = organization_cards_query().where(
+        any_of(Organization.name, set(names))
+    ).order_by(Organization.id.desc())
+
+    result = await db.execute(query)
+    # Записи идут по убыванию ID, поэтому в словаре остается организация с наименьшим ID
+    return {organization.name: organization for organization in result.all()}
+
+
+def search_area_offsets(data) -> tuple[float | None, float, float]:
+    """
+    Вычисляет размеры области поиска (радиус или прямоугольник вокруг точки) в градусах.
+
+    Args:
+        data: Запрос с полями latitude, longitude, radius, latitude_offset, longitude_offset
+
+    Returns:
+        Кортеж (радиус в километрах или None для прямоугольной области, смещение по широте в градусах,
+        смещение по долготе в градусах)
+    """
+    if data.radius is not None:
+        lat_offset_degrees, lon_offset_degrees = radius_to_degrees(data.radius, data.latitude)
+        return data.radius, lat_offset_degrees, lon_offset_degrees
+
+    lat_offset_degrees, _ = km_to_degrees(data.latitude_offset, data.latitude)
+    _, lon_offset_degrees = km_to_degrees(data.longitude_offset, data.latitude)
+    return None, lat_offset_degrees, lon_offset_degrees
+
+
+def in_activity_subtree(activity_ids):
+    """
+    Строит условие "организация относится к одному из видов деятельности или к их потомкам". Поддерево
+    раскрывается в БД через таблицу замыкания, поэтому в запрос передаются только найденные по названию
+    деятельности, а не все их потомки.
+
+    Args:
+        activity_ids: ID видов деятельности - корней поддеревьев
+
+    Returns:
+        Условие для конструкции where()
+    """
+    subtree_organization_ids = select(organization_activities.c.organization_id).join(
+        activity_closure, activity_closure.c.descendant_id == organization_activities.c.activity_id
+    ).where(
+        activity_closure.c.ancestor_id.in_(activity_ids),
+        activity_closure.c.depth < ACTIVITY_MAX_DEPTH
+    )
+    return Organization.id.in_(subtree_organization_ids)
+
+
+def organizations_postgis_query(latitude: float, longitude: float, within_m: float, *conditions,
+                                after: tuple[float, int] = None):
+    """
+    Строит запрос организаций в зданиях не дальше заданного расстояния от точки по GiST-индексу buildings.location.
+
+    Args:
+        latitude, longitude: Координаты точки (широта, долгота)
+        within_m: Расстояние в метрах на сфере PostGIS
+        conditions: Дополнительные условия отбора
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+
+    Returns:
+        Запрос карточек организаций с колонкой distance (расстояние в метрах), упорядоченных по расстоянию и ID
+    """
+    point = func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+    distance = func.ST_Distance(BUILDING_LOCATION, point, False)
+
+    query = organization_cards_query(distance.label("distance"), with_building=True).where(
+        func.ST_DWithin(BUILDING_LOCATION, point, within_m, False), *conditions
+    )
+    if after is not None:
+        query = query.where(tuple_(distance, Organization.id) > tuple_(*after))
+
+    return query.order_by(distance, Organization.id)
+
+
+async def search_organizations_postgis(db, latitude: float, longitude: float, within_m: float, *conditions,
+                                       after: tuple[float, int] = None, limit: int = None) -> list:
+    """
+    Ищет организации в зданиях не дальше заданного расстояния от точки по GiST-индексу buildings.location.
+
+    Args:
+        db: Асинхронная сессия БД
+        latitude, longitude: Координаты точки (широта, долгота)
+        within_m: Расстояние в метрах на сфере PostGIS
+        conditions: Дополнительные условия отбора
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+        limit: Максимальное количество записей. None - без ограничения
+
+    Returns:
+        Список пар (карточка организации, расстояние в метрах), упорядоченный по расстоянию и ID
+    """
+    query = organizations_postgis_query(latitude, longitude, within_m, *conditions, after=after)
+
+    result = await db.execute(query.limit(limit))
+    return [(organization, organization.distance) for organization in result.all()]
+
+
+async def search_organizations_nearest_postgis(db, latitude: float, longitude: float, limit: int) -> list:
+    """
+    Ищет ближайшие к точке организации. Здания обходятся в порядке удаления KNN-сканированием GiST-индекса
+    buildings.location (оператор <->), поэтому читается ровно столько зданий, сколько нужно, независимо от того,
+    насколько далеко они от точки. limit ближайших организаций всегда находятся в limit ближайших зданиях,
+    в которых есть хотя бы одна организация.
+
+    Args:
+        db: Асинхронная сессия БД
+        latitude, longitude: Координаты точки (широта, долгота)
+        limit: Количество организаций
+
+    Returns:
+        Список пар (карточка организации, расстояние в километрах), упорядоченный по расстоянию и ID
+    """
+    point = func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+    distance = func.ST_Distance(BUILDING_LOCATION, point, False)
+
+    nearest_building_ids = select(Building.id).where(
+        exists().where(Organization.building_id == Building.id)
+    ).order_by(BUILDING_LOCATION.op("<->")(point)).limit(limit).correlate(None)
+
+    query = organization_cards_query(distance.label("distance"), with_building=True).where(
+        Organization.building_id.in_(nearest_building_ids.scalar_subquery())
+    ).order_by(distance, Organization.id).limit(limit)
+
+    result = await db.execute(query)
+    return [(organization, from_postgis_meters(organization.distance)) for organization in result.all()]
+
+
+async def rank_organizations_nearest(db, latitude: float, longitude: float, limit: int) -> list:
+    """
+    Ищет ближайшие к точке организации расширяющимся поиском по пространственному индексу в памяти. Радиус
+    удваивается, пока в круг не попадет limit зданий; из БД читаются организации только ближайших зданий, а их
+    количество удваивается, пока не наберется limit организаций. Организации вне отобранных зданий не ближе
+    найденных, поэтому результат совпадает с полной сортировкой, а количество запросов и объем чтения из БД
+    определяются количеством организаций, а не расстоянием до них.
+
+    Args:
+        db: Асинхронная сессия БД
+        latitude, longitude: Координаты точки (широта, долгота)
+        limit: Количество организаций
+
+    Returns:
+        Список пар (ID организации, расстояние в километрах), упорядоченный по расстоянию и ID
+    """
+    radius_km = NEAREST_SEARCH_START_RADIUS_KM
+    buildings = limit
+    while True:
+        # Квадрат охватывает весь круг радиуса, поэтому ни одно здание в радиусе не пропускается
+        lat_offset, lon_offset = radius_to_degrees(radius_km, latitude)
+        building_ids = building_geo_index.within(
+            latitude - lat_offset, latitude + lat_offset, longitude - lon_offset, longitude + lon_offset
+        )
+        # Если в квадрат попали все здания, расширять поиск дальше некуда
+        everything = len(building_ids) == len(building_geo_index.coordinates)
+
+        locations = [building_geo_index.location(building_id) for building_id in building_ids]
+        order, distances = filter_sort_by_distance(
+            latitude, longitude,
+            [building_latitude for building_latitude, _ in locations],
+            [building_longitude for _, building_longitude in locations],
+            None if everything else radius_km
+        )
+        if len(order) < buildings and not everything:
+            radius_km *= 2
+            continue
+
+        # Здания на том же расстоянии, что и последнее отобранное, берутся вместе с ним
+        count = min(buildings, len(order))
+        while count < len(order) and distances[count] == distances[count - 1]:
+            count += 1
+
+        ranked = await rank_organizations_in_buildings(
+            db, dict(zip([building_ids[index] for index in order[:count]], distances[:count].tolist())), limit=limit
+        )
+        if len(ranked) >= limit or (count == len(order) and everything):
+            return ranked
+        buildings *= 2
+
+
+async def rank_organizations_in_buildings(db, building_distances: dict, after: tuple[float, int] = None,
+                                          limit: int = None, conditions: tuple = ()) -> list:
+    """
+    Упорядочивает организации в заданных зданиях по расстоянию до зданий.
+    Из БД читаются только пары (ID организации, ID здания).
+
+    Args:
+        db: Асинхронная сессия БД
+        building_distances: Словарь {ID здания: расстояние в километрах}
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+        limit: Максимальное количество записей. None - без ограничения
+        conditions: Дополнительные условия отбора организаций
+
+    Returns:
+        Список пар (ID организации, расстояние в километрах), упорядоченный по расстоянию и ID
+    """
+    if not building_distances:
+        return []
+
+    result = await db.execute(
+        select(Organization.id, Organization.building_id).where(
+            any_of(Organization.building_id, building_distances), *conditions
+        )
+    )
+    rows = result.all()
+    organization_ids = [organization_id for organization_id, _ in rows]
+    organization_distances = [building_distances[building_id] for _, building_id in rows]
+
+    return [
+        (organization_ids[index], organization_distances[index])
+        for index in keyset_order(organization_distances, organization_ids, after, limit)
+    ]
+
+
+async def rank_organizations_nearby(db, latitude: float, longitude: float, building_ids: list,
+                                    radius_km: float = None, after: tuple[float, int] = None,
+                                    limit: int = None, conditions: tuple = ()) -> list:
+    """
+    Упорядочивает организации в зданиях-кандидатах из пространственного индекса в памяти по расстоянию.
+    Расстояния до зданий считаются одним векторным проходом, из БД читаются только пары (ID организации, ID здания).
+
+    Args:
+        db: Асинхронная сессия БД
+        latitude, longitude: Координаты точки (широта, долгота)
+        building_ids: ID зданий-кандидатов
+        radius_km: Радиус отбора в километрах. None - без фильтрации по расстоянию
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+        limit: Максимальное количество записей. None - без ограничения
+        conditions: Дополнительные условия отбора организаций
+
+    Returns:
+        Список пар (ID организации, расстояние в километрах), упорядоченный по расстоянию и ID
+    """
+    if not building_ids:
+        return []
+
+    locations = [building_geo_index.location(building_id) for building_id in building_ids]
+    order, distances = filter_sort_by_distance(
+        latitude, longitude,
+        [building_latitude for building_latitude, _ in locations],
+        [building_longitude for _, building_longitude in locations],
+        radius_km
+    )
+    building_distances = dict(zip([building_ids[index] for index in order], distances.tolist()))
+
+    return await rank_organizations_in_buildings(db, building_distances, after, limit, conditions)
+
+
+async def search_organizations_nearby(db, latitude: float, longitude: float, building_ids: list,
+                                      radius_km: float = None, after: tuple[float, int] = None,
+                                      limit: int = None, conditions: tuple = ()) -> list:
+    """
+    Ищет организации в зданиях-кандидатах из пространственного индекса в памяти.
+    Целиком из БД загружаются только организации страницы.
+
+    Args:
+        db: Асинхронная сессия БД
+        latitude, longitude: Координаты точки (широта, долгота)
+        building_ids: ID зданий-кандидатов
+        radius_km: Радиус отбора в километрах. None - без фильтрации по расстоянию
+        after: Ключ (расстояние, ID) последней записи предыдущей страницы. None - первая страница
+        limit: Максимальное количество записей. None - без ограничения
+        conditions: Дополнительные условия отбора организаций
+
+    Returns:
+        Список пар (карточка организации, расстояние в километрах), упорядоченный по расстоянию и ID
+    """
+    ranked = await rank_organizations_nearby(
+        db, latitude, longitude, building_ids, radius_km, after, limit, conditions
+    )
+    organizations = await load_organizations(db, [organization_id for organization_id, _ in ranked])
+
+    return [
+        (organizations[organization_id], distance)
+        for organization_id, distance in ranked if organization_id in organizations
+    ]
+
+
+def escape_like(value: str) -> str:
+    """
+    Экранирует служебные символы шаблона LIKE (экранирующий символ - обратная косая черта).
+
+    Args:
+        value: Строка из запроса клиента
+
+    Returns:
+        Строка, которая в шаблоне LIKE совпадает только сама с собой
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def match_organizations_prefix(db, name: str, limit: int) -> list:
+    """
+    Ищет организации, название которых начинается с указанной строки (без учета регистра).
+    Использует индекс ix_organizations_name_prefix, более короткие названия ранжируются выше.
+
+    Args:
+        db: Асинхронная сессия БД
+        name: Начало названия
+        limit: Максимальное количество организаций
+
+    Returns:
+        Список кортежей (ID организации, степень совпадения)
+    """
+    length = func.length(Organization.name)
+    query = select(Organization.id, length).where(
+        func.lower(Organization.name).like(escape_like(name.lower()) + "%", escape="\\")
+    ).order_by(length, Organization.id).limit(limit)
+
+    result = await db.execute(query)
+    return [(organization_id, min(len(name) / name_length, 1.0)) for organization_id, name_length in result.all()]
+
+
+async def match_organizations_trigram(db, name: str, limit: int) -> list:
+    """
+    Ищет организации, в названии которых есть фрагмент, похожий на запрос (pg_trgm word_similarity).
+    Допускает опечатки, пропущенные слова и другой регистр. Использует индекс ix_organizations_name_trgm.
+
+    Args:
+        db: Асинхронная сессия БД
+        name: Название или часть названия
+        limit: Максимальное количество организаций
+
+    Returns:
+        Список кортежей (ID организации, степень совпадения) в порядке убывания совпадения
+    """
+    # Порог оператора %> задается настройкой, которая действует до конца текущей транзакции
+    await db.execute(
+        text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+        {"threshold": str(NAME_SEARCH_THRESHOLD)}
+    )
+
+    score = func.word_similarity(name, Organization.name)
+    query = select(Organization.id, score).where(
+        Organization.name.op("%>")(name)
+    ).order_by(score.desc(), Organization.id).limit(limit)
+
+    result = await db.execute(query)
+    return [(organization_id, float(similarity)) for organization_id, similarity in result.all()]
+
+
+async def match_organizations_words(db, name: str, limit: int) -> list:
+    """
+    Ищет организации, в названии которых встречаются все слова запроса (без учета регистра).
+    Используется вместо триграммного поиска, если в БД нет pg_trgm; опечатки не учитываются.
+
+    Args:
+        db: Асинхронная сессия БД
+        name: Название или часть названия
+        limit: Максимальное количество организаций
+
+    Returns:
+        Список кортежей (ID организации, степень совпадения) в порядке убывания совпадения
+    """
+    conditions = [Organization.name.ilike(f"%{escape_like(word)}%", escape="\\") for word in name.split()]
+    query = select(Organization.id, Organization.name).where(*conditions).order_by(
+        func.length(Organization.name), Organization.id
+    ).limit(NAME_SEARCH_FALLBACK_CANDIDATES)
+
+    result = await db.execute(query)
+    needle = name.casefold()
+    ranked = [
+        (organization_id, SequenceMatcher(None, needle, organization_name.casefold()).ratio())
+        for organization_id, organization_name in result.all()
+    ]
+    ranked.sort(key=lambda item: -item[1])
+    return ranked[:limit]
+
+
+def organization_info(organization) -> dict:
+    """
+    Преобразует карточку организации в словарь формата OrganizationInfo.
+
+    Args:
+        organization: Строка запроса organization_cards_query
+
+    Returns:
+        Словарь с информацией об организации
+    """
+    # Словарь собирается напрямую, без создания и валидации модели: значения уже проверены схемой БД,
+    # а порядок и типы полей совпадают с OrganizationInfo. У организации без телефонов или деятельностей
+    # агрегат возвращает NULL
+    return {
+        "id": organization.id,
+        "name": organization.name,
+        "phones": [int(number) for number in organization.phones or ()],
+        "activities": organization.activities or [],
+        "address": organization.address
+    }
+
+
+def building_info(building) -> dict:
+    """
+    Преобразует здание в словарь формата BuildingInfo.
+
+    Args:
+        building: Здание или строка запроса с колонками здания
+
+    Returns:
+        Словарь с информацией о здании
+    """
+    return {
+        "id": building.id,
+        "address": building.address,
+        "latitude": building.latitude,
+        "longitude": building.longitude
+    }
+
+
+async def stream_query(query):
+    """
+    Читает результат запроса серверным курсором порциями по STREAM_BATCH_SIZE записей.
+    Использует собственную сессию, так как ответ передается уже после завершения обработчика.
+
+    Args:
+        query: Запрос
+
+    Yields:
+        Строки результата по одной
+    """
+    async with replicas.session() as session:
+        result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result:
+            yield row
+
+
+async def stream_organizations(organization_ids: list):
+    """
+    Загружает организации порциями по STREAM_BATCH_SIZE в заданном порядке.
+    Использует собственную сессию, так как ответ передается уже после завершения обработчика.
+
+    Args:
+        organization_ids: Упорядоченный список ID организаций
+
+    Yields:
+        Карточки организаций по одной
+    """
+    async with replicas.session() as session:
+        for start in range(0, len(organization_ids), STREAM_BATCH_SIZE):
+            batch = organization_ids[start:start + STREAM_BATCH_SIZE]
+            organizations = await load_organizations(session, batch)
+            for organization_id in batch:
+                if organization_id in organizations:
+                    yield organizations[organization_id]
 
 
 @app.post("/building/search/organization", response_model_exclude_none=True,
-          response_model=BuildingSearchOrganizationResponse, name="Поиск организаций в здании", tags=["Здания"])
+          response_model=BuildingSearchOrganizationResponse, name="Поиск организаций в здании", tags=["Здания"],
+          responses=NDJSON_RESPONSES,
+          dependencies=[Depends(require_api_key)])
 async def building_search_organization(
-        request: Request, data: BuildingSearchOrganization, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: BuildingSearchOrganization, db = Depends(get_read_db)
 ):
     """
       Поиск всех организаций находящихся в конкретном здании.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
-
     try:
         # Сначала проверяем, существует ли здание с указанным ID
         building_query = select(Building).where(Building.id == data.building_id)
@@ -144,39 +953,45 @@ async def building_search_organization(
                 code=22,
                 message=f"Здание с ID {data.building_id} не найдено"
             )
-            return JSONResponse(status_code=200, content=response, media_type='application/json')
+            return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
-        # Получаем все организации в указанном здании
-        query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).where(Organization.building_id == data.building_id)
+        # Получаем страницу организаций в указанном здании (ключ страницы - ID организации)
+        after = decode_cursor(data.cursor, int)
+        query = organization_cards_query().where(Organization.building_id == data.building_id)
+        if after is not None:
+            query = query.where(Organization.id > after[0])
+        query = query.order_by(Organization.id)
+
+        if wants_ndjson(request):
+            # Потоковая выдача: все организации после курсора построчно, без ограничения страницы
+            return ndjson_response(stream_query(query), organization_info, error_code=53)
+
+        query = query.limit(data.limit + 1)
 
         result = await db.execute(query)
-        organizations = result.scalars().all()
+        organizations, has_more = split_page(result.all(), data.limit)
+        next_cursor = encode_cursor(organizations[-1].id) if has_more else None
 
         # Преобразуем данные в формат ответа
         organizations_info = []
         for organization in organizations:
-            organization_info = OrganizationInfo(
-                id=organization.id,
-                name=organization.name,
-                phones=[int(phone.number) for phone in organization.phones],
-                activities=[activity.name for activity in organization.activities],
-                address=organization.building.address
-            )
-            organizations_info.append(organization_info.model_dump())
+            organizations_info.append(organization_info(organization))
 
         response = set_response_model(
             code=0,
             message=f"Найдено {len(organizations_info)} организаций в здании",
             organization=organizations_info,
-            qty=len(organizations_info)
+            qty=len(organizations_info),
+            next_cursor=next_cursor
         )
 
         logger.info(f"Successfully found {len(organizations_info)} organizations in building ID {data.building_id}")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {data.cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
     except Exception as e:
         logger.error(f"Error searching organizations in building ID {data.building_id}: {str(e)}")
@@ -184,49 +999,65 @@ async def building_search_organization(
             code=53,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.get("/building/list/all", response_model_exclude_none=True, response_model=BuildingListAllResponse,
-         name="Список всех зданий", tags=["Здания"])
+         name="Список всех зданий", tags=["Здания"],
+         responses=NDJSON_RESPONSES | NOT_MODIFIED_RESPONSES,
+         dependencies=[Depends(require_api_key)])
 async def building_list_all(
-        request: Request, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, etag: str = Depends(check_data_version), db = Depends(get_read_db),
+        limit: int = Query(description="Максимальное количество записей на странице", ge=1, le=PAGE_LIMIT_MAX,
+                           default=PAGE_LIMIT_DEFAULT),
+        cursor: str = Query(description="Курсор следующей страницы (next_cursor из предыдущего ответа)",
+                            default=None, max_length=200)
 ):
     """
       Список всех зданий в базе данных.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+    # Повторные запросы с теми же параметрами обслуживаются из кэша без обращения к БД
+    cache_key = request_key("building_list_all", limit=limit, cursor=cursor, version=request.state.data_version)
+    if not wants_ndjson(request):
+        response = cached_response(cache_key)
+        if response is not None:
+            return with_etag(response, etag)
 
     try:
-        # Получаем все здания из базы данных
-        query = select(Building)
+        # Получаем страницу зданий из базы данных (ключ страницы - ID здания)
+        after = decode_cursor(cursor, int)
+        query = select(Building.id, Building.address, Building.latitude, Building.longitude)
+        if after is not None:
+            query = query.where(Building.id > after[0])
+        query = query.order_by(Building.id)
+
+        if wants_ndjson(request):
+            # Потоковая выдача: все здания после курсора построчно, без ограничения страницы
+            return ndjson_response(stream_query(query), building_info, error_code=52)
+
+        query = query.limit(limit + 1)
+
         result = await db.execute(query)
-        buildings = result.scalars().all()
+        buildings, has_more = split_page(result.all(), limit)
+        next_cursor = encode_cursor(buildings[-1].id) if has_more else None
 
         # Преобразуем данные в формат ответа
-        buildings_info = []
-        for building in buildings:
-            building_info = {
-                "id": building.id,
-                "address": building.address,
-                "latitude": building.latitude,
-                "longitude": building.longitude
-            }
-            buildings_info.append(building_info)
+        buildings_info = [building_info(building) for building in buildings]
 
         response = set_response_model(
             code=0,
             message=f"Найдено {len(buildings_info)} зданий",
-            building=buildings_info
+            building=buildings_info,
+            next_cursor=next_cursor
         )
 
         logger.info(f"Successfully retrieved {len(buildings_info)} buildings from database")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return with_etag(cache_json_response(cache_key, response, tags=(TAG_BUILDINGS,)), etag)
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
     except Exception as e:
         logger.error(f"Error retrieving buildings list: {str(e)}")
@@ -234,75 +1065,31 @@ async def building_list_all(
             code=52,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.post("/activity/search/organization", response_model_exclude_none=True,
-          response_model=ActivitySearchOrganizationResponse, name="Поиск организаций по деятельности", tags=["Организации"])
+          response_model=ActivitySearchOrganizationResponse, name="Поиск организаций по деятельности", tags=["Организации"],
+          responses=NDJSON_RESPONSES,
+          dependencies=[Depends(require_api_key)])
 async def activity_search_organization(
-        request: Request, data: ActivitySearchOrganization, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: ActivitySearchOrganization, db = Depends(get_read_db)
 ):
     """
       Поиск всех организаций, которые относятся к указанному виду деятельности.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+    # Повторные запросы с теми же параметрами обслуживаются из кэша без обращения к БД
+    cache_key = request_key("activity_search_organization", data)
+    if not wants_ndjson(request):
+        response = cached_response(cache_key)
+        if response is not None:
+            return response
 
     try:
-        async def get_activity_ids_with_children(activity_name: str, max_depth: int = 3) -> set:
-            """
-            Получает ID всех видов деятельности по названию, включая дочерние до указанной глубины.
-
-            Args:
-                activity_name: Название искомого вида деятельности
-                max_depth: Максимальная глубина вложенности (по умолчанию 3)
-
-            Returns:
-                Множество ID всех найденных видов деятельности
-            """
-            activity_ids = set()
-
-            # Находим все виды деятельности с указанным названием
-            base_query = select(Activity).where(Activity.name.ilike(f"%{activity_name}%"))
-            base_result = await db.execute(base_query)
-            base_activities = base_result.scalars().all()
-
-            if not base_activities:
-                return activity_ids
-
-            # Добавляем найденные базовые виды деятельности
-            for activity in base_activities:
-                activity_ids.add(activity.id)
-
-            # Рекурсивно ищем дочерние виды деятельности
-            async def find_children(parent_ids: set, current_depth: int):
-                if current_depth >= max_depth or not parent_ids:
-                    return
-
-                # Находим всех детей для текущего уровня
-                children_query = select(Activity).where(Activity.parent_id.in_(parent_ids))
-                children_result = await db.execute(children_query)
-                children = children_result.scalars().all()
-
-                next_level_ids = set()
-                for child in children:
-                    activity_ids.add(child.id)
-                    next_level_ids.add(child.id)
-
-                # Рекурсивно ищем детей следующего уровня
-                await find_children(next_level_ids, current_depth + 1)
-
-            # Начинаем поиск дочерних элементов
-            base_ids = {activity.id for activity in base_activities}
-            await find_children(base_ids, 1)
-
-            return activity_ids
-
-        activity_ids = await get_activity_ids_with_children(data.activity)
+        # Названия деятельностей сопоставляются по индексу в памяти без обращений к БД
+        await activity_index.ensure_fresh(db)
+        base_activity_ids = activity_index.find_ids(data.activity)
+        activity_ids = activity_index.expand(base_activity_ids)
 
         if not activity_ids:
             logger.warning(f"No activities found matching '{data.activity}'")
@@ -312,47 +1099,45 @@ async def activity_search_organization(
                 organization=[],
                 qty=0
             )
-            return JSONResponse(status_code=200, content=response, media_type='application/json')
-
-        organizations_query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).join(
-            organization_activities, Organization.id == organization_activities.c.organization_id
-        ).where(
-            organization_activities.c.activity_id.in_(activity_ids)
-        ).distinct()
+            return cache_json_response(cache_key, response)
+
+        # Ключ страницы - ID организации
+        after = decode_cursor(data.cursor, int)
+        organizations_query = organization_cards_query().where(in_activity_subtree(base_activity_ids))
+        if after is not None:
+            organizations_query = organizations_query.where(Organization.id > after[0])
+        organizations_query = organizations_query.order_by(Organization.id)
+
+        if wants_ndjson(request):
+            # Потоковая выдача: все организации после курсора построчно, без ограничения страницы
+            return ndjson_response(stream_query(organizations_query), organization_info, error_code=54)
+
+        organizations_query = organizations_query.limit(data.limit + 1)
 
         result = await db.execute(organizations_query)
-        organizations = result.scalars().all()
+        organizations, has_more = split_page(result.all(), data.limit)
+        next_cursor = encode_cursor(organizations[-1].id) if has_more else None
 
         organizations_info = []
-        organization_ids_seen = set()
-
         for organization in organizations:
-            if organization.id not in organization_ids_seen:
-                organization_ids_seen.add(organization.id)
-
-                organization_info = OrganizationInfo(
-                    id=organization.id,
-                    name=organization.name,
-                    phones=[int(phone.number) for phone in organization.phones],
-                    activities=[activity.name for activity in organization.activities],
-                    address=organization.building.address
-                )
-                organizations_info.append(organization_info.model_dump())
+            organizations_info.append(organization_info(organization))
 
         response = set_response_model(
             code=0,
             message=f"Найдено {len(organizations_info)} организаций по виду деятельности '{data.activity}' (включая {len(activity_ids)} связанных видов деятельности)",
             organization=organizations_info,
-            qty=len(organizations_info)
+            qty=len(organizations_info),
+            next_cursor=next_cursor
         )
 
         logger.info(
             f"Successfully found {len(organizations_info)} organizations for activity '{data.activity}' with {len(activity_ids)} related activity types")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return cache_json_response(cache_key, response)
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {data.cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
     except Exception as e:
         logger.error(f"Error searching organizations by activity '{data.activity}': {str(e)}")
@@ -360,89 +1145,211 @@ async def activity_search_organization(
             code=54,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/activity/facets", response_model_exclude_none=True,
+          response_model=ActivityFacetsResponse, name="Количество организаций по видам деятельности", tags=["Деятельности"],
+          dependencies=[Depends(require_api_key)])
+async def activity_facets(
+        request: Request, data: ActivityFacets, db = Depends(get_read_db)
+):
+    """
+      Количество организаций по каждому виду деятельности в заданной области и/или среди организаций указанного
+      вида деятельности. Количество для вида деятельности включает организации вложенных видов.
+    """
+    # Без области поиска набор параметров невелик, такие ответы обслуживаются из кэша
+    cache_key = request_key("activity_facets", data) if data.latitude is None else None
+    if cache_key is not None:
+        response = cached_response(cache_key)
+        if response is not None:
+            return response
+
+    try:
+        await activity_index.ensure_fresh(db)
+        conditions = []
+
+        if data.activity is not None:
+            base_activity_ids = activity_index.find_ids(data.activity)
+            if not base_activity_ids:
+                logger.warning(f"No activities found matching '{data.activity}'")
+                response = set_response_model(
+                    code=23,
+                    message=f"Виды деятельности с названием '{data.activity}' не найдены",
+                    activity=[],
+                    qty=0
+                )
+                return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+            conditions.append(in_activity_subtree(base_activity_ids))
+
+        with_building = False
+        if data.latitude is not None:
+            radius_km, lat_offset_degrees, lon_offset_degrees = search_area_offsets(data)
+            min_lat = data.latitude - lat_offset_degrees
+            max_lat = data.latitude + lat_offset_degrees
+            min_lon = data.longitude - lon_offset_degrees
+            max_lon = data.longitude + lon_offset_degrees
+
+            if request.app.state.postgis:
+                point = func.geography(func.ST_SetSRID(func.ST_MakePoint(data.longitude, data.latitude), 4326))
+                if radius_km is not None:
+                    within_m = to_postgis_meters(radius_km)
+                else:
+                    within_m = to_postgis_meters(rectangle_circumradius_km(lat_offset_degrees, lon_offset_degrees))
+                    conditions += [
+                        Building.latitude >= min_lat,
+                        Building.latitude <= max_lat,
+                        Building.longitude >= min_lon,
+                        Building.longitude <= max_lon
+                    ]
+                conditions.append(func.ST_DWithin(BUILDING_LOCATION, point, within_m, False))
+                with_building = True
+            else:
+                # Здания области берем из пространственного индекса в памяти, точный отбор по радиусу -
+                # одним векторным проходом
+                await building_geo_index.ensure_fresh(db)
+                building_ids = building_geo_index.within(min_lat, max_lat, min_lon, max_lon)
+                if radius_km is not None:
+                    locations = [building_geo_index.location(building_id) for building_id in building_ids]
+                    order, _ = filter_sort_by_distance(
+                        data.latitude, data.longitude,
+                        [building_latitude for building_latitude, _ in locations],
+                        [building_longitude for _, building_longitude in locations],
+                        radius_km
+                    )
+                    building_ids = [building_ids[index] for index in order]
+                conditions.append(any_of(Organization.building_id, building_ids))
+
+        # Один GROUP BY по связям организаций с деятельностями: каждая связь через таблицу замыкания засчитывается
+        # своей деятельности и всем ее предкам, организация с несколькими деятельностями одного поддерева
+        # учитывается в нем один раз
+        facets_query = select(
+            activity_closure.c.ancestor_id, func.count(distinct(organization_activities.c.organization_id))
+        ).join_from(
+            organization_activities, activity_closure,
+            activity_closure.c.descendant_id == organization_activities.c.activity_id
+        ).where(
+            activity_closure.c.depth < ACTIVITY_MAX_DEPTH, *conditions
+        ).group_by(activity_closure.c.ancestor_id)
+        if conditions:
+            facets_query = facets_query.join(Organization, Organization.id == organization_activities.c.organization_id)
+        if with_building:
+            facets_query = facets_query.join(Building, Building.id == Organization.building_id)
+
+        result = await db.execute(facets_query)
+
+        # Названия и родители берутся из индекса дерева деятельностей в памяти
+        facets = [
+            {
+                "id": activity_id,
+                "name": activity_index.name(activity_id),
+                "parent_id": activity_index.parents.get(activity_id),
+                "qty": qty
+            }
+            for activity_id, qty in result.all()
+        ]
+        facets.sort(key=lambda facet: (-facet["qty"], facet["id"]))
+
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {len(facets)} видов деятельности",
+            activity=facets,
+            qty=len(facets)
+        )
+
+        logger.info(f"Successfully counted organizations for {len(facets)} activities")
+        if cache_key is not None:
+            return cache_json_response(cache_key, response)
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except Exception as e:
+        logger.error(f"Error counting organizations by activity: {str(e)}")
+        response = set_response_model(
+            code=62,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.post("/organization/search/coordinate/radius", response_model_exclude_none=True,
-          response_model=OrganizationSearchCoordinateRadiusResponse, name="Поиск в радиусе", tags=["Организации"])
+          response_model=OrganizationSearchCoordinateRadiusResponse, name="Поиск в радиусе", tags=["Организации"],
+          responses=NDJSON_RESPONSES,
+          dependencies=[Depends(require_api_key)])
 async def organization_search_coordinate_radius(
-        request: Request, data: OrganizationSearchCoordinateRadius, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: OrganizationSearchCoordinateRadius, db = Depends(get_read_db)
 ):
     """
       Поиск организаций, которые находятся в заданном радиусе относительно указанной точки на карте.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
-
     try:
         radius_km = data.radius
 
-        # Вычисляем границы поиска в градусах для предварительной фильтрации
-        lat_offset, lon_offset = km_to_degrees(radius_km, data.latitude)
-
-        min_lat = data.latitude - lat_offset
-        max_lat = data.latitude + lat_offset
-        min_lon = data.longitude - lon_offset
-        max_lon = data.longitude + lon_offset
-
-        # Получаем все организации в приблизительном квадрате для предварительной фильтрации
-        query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).join(Building).where(
-            and_(
-                Building.latitude >= min_lat,
-                Building.latitude <= max_lat,
-                Building.longitude >= min_lon,
-                Building.longitude <= max_lon
-            )
-        )
+        # Ключ страницы - пара (расстояние, ID организации)
+        after = decode_cursor(data.cursor, float, int)
 
-        result = await db.execute(query)
-        organizations = result.scalars().all()
+        if request.app.state.postgis:
+            # Отбор по радиусу и сортировка по расстоянию выполняются в БД по GiST-индексу
+            if wants_ndjson(request):
+                query = organizations_postgis_query(
+                    data.latitude, data.longitude, to_postgis_meters(radius_km), after=after
+                )
+                return ndjson_response(stream_query(query), organization_info, error_code=55)
 
-        # Фильтруем организации по точному расстоянию
-        organizations_info = []
-        for organization in organizations:
-            # Вычисляем точное расстояние в километрах
-            distance_km = calculate_distance(
-                data.latitude, data.longitude,
-                organization.building.latitude, organization.building.longitude
+            rows = await search_organizations_postgis(
+                db, data.latitude, data.longitude, to_postgis_meters(radius_km),
+                after=after, limit=data.limit + 1
             )
-
-            # Проверяем, находится ли организация в заданном радиусе
-            if distance_km <= radius_km:
-                organization_info = OrganizationInfo(
-                    id=organization.id,
-                    name=organization.name,
-                    phones=[int(phone.number) for phone in organization.phones],
-                    activities=[activity.name for activity in organization.activities],
-                    address=organization.building.address
+        else:
+            # Вычисляем границы поиска в градусах для предварительной фильтрации
+            lat_offset, lon_offset = radius_to_degrees(radius_km, data.latitude)
+
+            min_lat = data.latitude - lat_offset
+            max_lat = data.latitude + lat_offset
+            min_lon = data.longitude - lon_offset
+            max_lon = data.longitude + lon_offset
+
+            # Здания в приблизительном квадрате берем из пространственного индекса в памяти,
+            # точный отбор по расстоянию и сортировка выполняются одним векторным проходом
+            await building_geo_index.ensure_fresh(db)
+            building_ids = building_geo_index.within(min_lat, max_lat, min_lon, max_lon)
+
+            if wants_ndjson(request):
+                ranked = await rank_organizations_nearby(
+                    db, data.latitude, data.longitude, building_ids, radius_km, after=after
                 )
-                organizations_info.append((organization_info.model_dump(), distance_km))
+                return ndjson_response(
+                    stream_organizations([organization_id for organization_id, _ in ranked]),
+                    organization_info, error_code=55
+                )
+
+            rows = await search_organizations_nearby(
+                db, data.latitude, data.longitude, building_ids, radius_km,
+                after=after, limit=data.limit + 1
+            )
 
-        # Сортируем результаты по расстоянию (ближайшие сначала)
-        organizations_info.sort(key=lambda x: x[1])
-        print(f"organizations_info: {organizations_info}")
+        rows, has_more = split_page(rows, data.limit)
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id) if has_more else None
 
-        # Извлекаем только информацию об организациях (без расстояний)
-        organizations_info_sorted = [org_info for org_info, _ in organizations_info]
+        organizations_info_sorted = []
+        for organization, _ in rows:
+            organizations_info_sorted.append(organization_info(organization))
 
         response = set_response_model(
             code=0,
             message=f"Найдено {len(organizations_info_sorted)} организаций в радиусе {radius_km} км от точки ({data.latitude}, {data.longitude})",
             organization=organizations_info_sorted,
-            qty=len(organizations_info_sorted)
+            qty=len(organizations_info_sorted),
+            next_cursor=next_cursor
         )
 
         logger.info(
             f"Successfully found {len(organizations_info_sorted)} organizations within {radius_km} km radius from ({data.latitude}, {data.longitude})")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {data.cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
     except Exception as e:
         logger.error(f"Error searching organizations by coordinate radius: {str(e)}")
@@ -450,25 +1357,20 @@ async def organization_search_coordinate_radius(
             code=55,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.post("/organization/search/coordinate/rectangle", response_model_exclude_none=True,
           response_model=OrganizationSearchCoordinateRectangleResponse, name="Поиск в прямоугольной области",
-          tags=["Организации"])
+          tags=["Организации"],
+          responses=NDJSON_RESPONSES,
+          dependencies=[Depends(require_api_key)])
 async def organization_search_coordinate_rectangle(
-        request: Request, data: OrganizationSearchCoordinateRectangle, db=Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: OrganizationSearchCoordinateRectangle, db=Depends(get_read_db)
 ):
     """
       Поиск организаций, которые находятся в заданной прямоугольной области относительно указанной точки на карте.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
-
     try:
         # Преобразуем смещения из километров в градусы
         lat_offset_degrees, lon_offset_degrees = km_to_degrees(data.latitude_offset, data.latitude)
@@ -484,46 +1386,54 @@ async def organization_search_coordinate_rectangle(
         # Логируем границы для отладки
         logger.info(f"Rectangle search bounds: lat[{min_lat:.6f}, {max_lat:.6f}], lon[{min_lon:.6f}, {max_lon:.6f}]")
 
-        # Получаем все организации в прямоугольной области
-        query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).join(Building).where(
-            and_(
+        # Ключ страницы - пара (расстояние, ID организации)
+        after = decode_cursor(data.cursor, float, int)
+
+        if request.app.state.postgis:
+            # Отбор и сортировка по расстоянию выполняются в БД: GiST-индекс сужает поиск до описанной
+            # окружности прямоугольника, точные границы проверяются по широте и долготе
+            within_m = to_postgis_meters(rectangle_circumradius_km(lat_offset_degrees, lon_offset_degrees_lon))
+            bounds = (
                 Building.latitude >= min_lat,
                 Building.latitude <= max_lat,
                 Building.longitude >= min_lon,
                 Building.longitude <= max_lon
             )
-        )
 
-        result = await db.execute(query)
-        organizations = result.scalars().all()
+            if wants_ndjson(request):
+                query = organizations_postgis_query(data.latitude, data.longitude, within_m, *bounds, after=after)
+                return ndjson_response(stream_query(query), organization_info, error_code=56)
 
-        # Преобразуем найденные организации в формат ответа
-        organizations_info = []
-        for organization in organizations:
-            # Вычисляем расстояние от базовой точки для сортировки
-            distance_km = calculate_distance(
-                data.latitude, data.longitude,
-                organization.building.latitude, organization.building.longitude
+            rows = await search_organizations_postgis(
+                db, data.latitude, data.longitude, within_m, *bounds, after=after, limit=data.limit + 1
             )
+        else:
+            # Здания в прямоугольной области берем из пространственного индекса в памяти,
+            # сортировка по расстоянию от базовой точки выполняется одним векторным проходом
+            await building_geo_index.ensure_fresh(db)
+            building_ids = building_geo_index.within(min_lat, max_lat, min_lon, max_lon)
+
+            if wants_ndjson(request):
+                ranked = await rank_organizations_nearby(
+                    db, data.latitude, data.longitude, building_ids, after=after
+                )
+                return ndjson_response(
+                    stream_organizations([organization_id for organization_id, _ in ranked]),
+                    organization_info, error_code=56
+                )
 
-            organization_info = OrganizationInfo(
-                id=organization.id,
-                name=organization.name,
-                phones=[int(phone.number) for phone in organization.phones],
-                activities=[activity.name for activity in organization.activities],
-                address=organization.building.address
+            rows = await search_organizations_nearby(
+                db, data.latitude, data.longitude, building_ids,
+                after=after, limit=data.limit + 1
             )
-            organizations_info.append((organization_info.model_dump(), distance_km))
 
-        # Сортируем результаты по расстоянию от базовой точки (ближайшие сначала)
-        organizations_info.sort(key=lambda x: x[1])
+        rows, has_more = split_page(rows, data.limit)
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id) if has_more else None
 
-        # Извлекаем только информацию об организациях (без расстояний)
-        organizations_info_sorted = [org_info for org_info, _ in organizations_info]
+        # Преобразуем найденные организации в формат ответа
+        organizations_info_sorted = []
+        for organization, _ in rows:
+            organizations_info_sorted.append(organization_info(organization))
 
         # Информация о размерах области поиска
         area_width = data.latitude_offset * 2  # ширина прямоугольника
@@ -533,12 +1443,18 @@ async def organization_search_coordinate_rectangle(
             code=0,
             message=f"Найдено {len(organizations_info_sorted)} организаций в прямоугольной области {area_width}×{area_height} км от точки ({data.latitude}, {data.longitude})",
             organization=organizations_info_sorted,
-            qty=len(organizations_info_sorted)
+            qty=len(organizations_info_sorted),
+            next_cursor=next_cursor
         )
 
         logger.info(
             f"Successfully found {len(organizations_info_sorted)} organizations in rectangle {area_width}×{area_height} km from ({data.latitude}, {data.longitude})")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {data.cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
     except Exception as e:
         logger.error(f"Error searching organizations by coordinate rectangle: {str(e)}")
@@ -546,33 +1462,210 @@ async def organization_search_coordinate_rectangle(
             code=56,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/organization/search/coordinate/nearest", response_model_exclude_none=True,
+          response_model=OrganizationSearchCoordinateNearestResponse, name="Поиск ближайших организаций",
+          tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
+async def organization_search_coordinate_nearest(
+        request: Request, data: OrganizationSearchCoordinateNearest, db = Depends(get_read_db)
+):
+    """
+      Поиск заданного количества организаций, ближайших к указанной точке на карте, в порядке удаления от нее.
+      В отличие от поиска в радиусе не требует подбирать радиус: поиск останавливается, как только найдено
+      нужное количество организаций.
+    """
+    try:
+        if request.app.state.postgis:
+            # Здания перебираются в порядке удаления по GiST-индексу
+            rows = await search_organizations_nearest_postgis(db, data.latitude, data.longitude, data.limit)
+        else:
+            await building_geo_index.ensure_fresh(db)
+            ranked = await rank_organizations_nearest(db, data.latitude, data.longitude, data.limit)
+            organizations = await load_organizations(db, [organization_id for organization_id, _ in ranked])
+            rows = [
+                (organizations[organization_id], distance)
+                for organization_id, distance in ranked if organization_id in organizations
+            ]
+
+        organizations_info = []
+        for organization, distance in rows:
+            organizations_info.append(organization_info(organization) | {"distance_km": round(distance, 6)})
+
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {len(organizations_info)} ближайших организаций к точке ({data.latitude}, {data.longitude})",
+            organization=organizations_info,
+            qty=len(organizations_info)
+        )
+
+        logger.info(
+            f"Successfully found {len(organizations_info)} nearest organizations to ({data.latitude}, {data.longitude})")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except Exception as e:
+        logger.error(f"Error searching nearest organizations: {str(e)}")
+        response = set_response_model(
+            code=60,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/organization/search/combined", response_model_exclude_none=True,
+          response_model=OrganizationSearchCombinedResponse, name="Поиск по области, деятельности и зданию",
+          tags=["Организации"],
+          responses=NDJSON_RESPONSES,
+          dependencies=[Depends(require_api_key)])
+async def organization_search_combined(
+        request: Request, data: OrganizationSearchCombined, db = Depends(get_read_db)
+):
+    """
+      Поиск организаций указанного вида деятельности (включая вложенные виды) в заданном радиусе или прямоугольной
+      области относительно точки на карте, при необходимости - только в указанном здании.
+      Результаты упорядочены по расстоянию от точки.
+    """
+    try:
+        await activity_index.ensure_fresh(db)
+        base_activity_ids = activity_index.find_ids(data.activity)
+
+        if not base_activity_ids:
+            logger.warning(f"No activities found matching '{data.activity}'")
+            response = set_response_model(
+                code=23,
+                message=f"Виды деятельности с названием '{data.activity}' не найдены",
+                organization=[],
+                qty=0
+            )
+            return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+        # Все фильтры применяются в одном запросе, поэтому планировщик сам начинает с самого селективного из них:
+        # здания, деятельности (по таблице замыкания) или области
+        conditions = [in_activity_subtree(base_activity_ids)]
+
+        radius_km, lat_offset_degrees, lon_offset_degrees = search_area_offsets(data)
+        if radius_km is not None:
+            area = f"в радиусе {radius_km} км"
+        else:
+            area = f"в прямоугольной области {data.latitude_offset * 2}×{data.longitude_offset * 2} км"
+
+        min_lat = data.latitude - lat_offset_degrees
+        max_lat = data.latitude + lat_offset_degrees
+        min_lon = data.longitude - lon_offset_degrees
+        max_lon = data.longitude + lon_offset_degrees
+
+        # Ключ страницы - пара (расстояние, ID организации)
+        after = decode_cursor(data.cursor, float, int)
+
+        if request.app.state.postgis:
+            if radius_km is not None:
+                within_m = to_postgis_meters(radius_km)
+            else:
+                within_m = to_postgis_meters(rectangle_circumradius_km(lat_offset_degrees, lon_offset_degrees))
+                conditions += [
+                    Building.latitude >= min_lat,
+                    Building.latitude <= max_lat,
+                    Building.longitude >= min_lon,
+                    Building.longitude <= max_lon
+                ]
+            if data.building_id is not None:
+                conditions.append(Organization.building_id == data.building_id)
+
+            if wants_ndjson(request):
+                query = organizations_postgis_query(data.latitude, data.longitude, within_m, *conditions, after=after)
+                return ndjson_response(
+                    stream_query(query),
+                    lambda row: organization_info(row) | {"distance_km": round(from_postgis_meters(row.distance), 6)},
+                    error_code=61
+                )
+
+            rows = await search_organizations_postgis(
+                db, data.latitude, data.longitude, within_m, *conditions, after=after, limit=data.limit + 1
+            )
+            distances_km = [from_postgis_meters(distance) for _, distance in rows]
+        else:
+            # Здания области берем из пространственного индекса в памяти. Если задано здание, область сужается
+            # до него без обращения к БД, и в запрос организаций передается одно здание
+            await building_geo_index.ensure_fresh(db)
+            building_ids = building_geo_index.within(min_lat, max_lat, min_lon, max_lon)
+            if data.building_id is not None:
+                building_ids = [building_id for building_id in building_ids if building_id == data.building_id]
+
+            if wants_ndjson(request):
+                ranked = await rank_organizations_nearby(
+                    db, data.latitude, data.longitude, building_ids, radius_km, after=after, conditions=conditions
+                )
+                distances = dict(ranked)
+                return ndjson_response(
+                    stream_organizations([organization_id for organization_id, _ in ranked]),
+                    lambda organization: organization_info(organization) | {
+                        "distance_km": round(distances[organization.id], 6)
+                    },
+                    error_code=61
+                )
+
+            rows = await search_organizations_nearby(
+                db, data.latitude, data.longitude, building_ids, radius_km,
+                after=after, limit=data.limit + 1, conditions=conditions
+            )
+            distances_km = [distance for _, distance in rows]
+
+        rows, has_more = split_page(rows, data.limit)
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id) if has_more else None
+
+        organizations_info = []
+        for (organization, _), distance in zip(rows, distances_km):
+            organizations_info.append(organization_info(organization) | {"distance_km": round(distance, 6)})
+
+        building = f" в здании ID {data.building_id}" if data.building_id is not None else ""
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {len(organizations_info)} организаций по виду деятельности '{data.activity}' {area} от точки ({data.latitude}, {data.longitude}){building}",
+            organization=organizations_info,
+            qty=len(organizations_info),
+            next_cursor=next_cursor
+        )
+
+        logger.info(
+            f"Successfully found {len(organizations_info)} organizations for activity '{data.activity}' near ({data.latitude}, {data.longitude})")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except InvalidCursor:
+        logger.warning(f"Invalid pagination cursor: {data.cursor}")
+        response = set_response_model(code=2, message="Некорректный курсор постраничной выдачи")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except Exception as e:
+        logger.error(f"Error in combined organization search: {str(e)}")
+        response = set_response_model(
+            code=61,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.post("/organization/search/id", response_model_exclude_none=True,
-          response_model=OrganizationSearchIdResponse, name="Поиск организации по ID", tags=["Организации"])
+          response_model=OrganizationSearchIdResponse, name="Поиск организации по ID", tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
 async def organization_search_id(
-        request: Request, data: OrganizationSearchId, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: OrganizationSearchId, db = Depends(get_read_db)
 ):
     """
       Поиск информации об организации по её идентификатору.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+    # Повторные запросы с теми же параметрами обслуживаются из кэша без обращения к БД
+    cache_key = request_key("organization_search_id", data)
+    response = cached_response(cache_key)
+    if response is not None:
+        return response
 
     try:
-        query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).where(Organization.id == data.organization_id)
+        query = organization_cards_query().where(Organization.id == data.organization_id)
 
         result = await db.execute(query)
-        organization = result.scalar_one_or_none()
+        organization = result.one_or_none()
 
         if not organization:
             logger.warning(f"Organization with ID {data.organization_id} not found")
@@ -580,23 +1673,15 @@ async def organization_search_id(
                 code=20,
                 message=f"Организация с ID {data.organization_id} не найдена"
             )
-            return JSONResponse(status_code=200, content=response, media_type='application/json')
-
-        organization_info = OrganizationInfo(
-            id=organization.id,
-            name=organization.name,
-            phones=[int(phone.number) for phone in organization.phones],
-            activities=[activity.name for activity in organization.activities],
-            address=organization.building.address
-        )
+            return cache_json_response(cache_key, response)
 
         response = set_response_model(
             code=0,
             message="Организация успешно найдена",
-            organization=organization_info.model_dump()
+            organization=organization_info(organization)
         )
 
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return cache_json_response(cache_key, response)
 
     except Exception as e:
         logger.error(f"Error searching organization by ID {data.organization_id}: {str(e)}")
@@ -604,33 +1689,29 @@ async def organization_search_id(
             code=50,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 @app.post("/organization/search/name", response_model_exclude_none=True,
-          response_model=OrganizationSearchNameResponse, name="Поиск организации по названию", tags=["Организации"])
+          response_model=OrganizationSearchNameResponse, name="Поиск организации по названию", tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
 async def organization_search_name(
-        request: Request, data: OrganizationSearchName, db = Depends(get_db),
-        authorization: str = Header(description="Токен авторизации", examples=["p9q348pq347hnp34g"])
+        request: Request, data: OrganizationSearchName, db = Depends(get_read_db)
 ):
     """
       Поиск информации об организации по её названию.
     """
-    denied, detail = await check_bearer_token(token=authorization)
-    if denied:
-        logger.error(f"Access denied: {detail}")
-        response = set_response_model(code=1, message="Authorization failed")
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+    # Повторные запросы с теми же параметрами обслуживаются из кэша без обращения к БД
+    cache_key = request_key("organization_search_name", data)
+    response = cached_response(cache_key)
+    if response is not None:
+        return response
 
     try:
-        query = select(Organization).options(
-            selectinload(Organization.building),
-            selectinload(Organization.phones),
-            selectinload(Organization.activities)
-        ).where(Organization.name == data.organization_name)
+        query = organization_cards_query().where(Organization.name == data.organization_name)
 
         result = await db.execute(query)
-        organization = result.scalar_one_or_none()
+        organization = result.one_or_none()
 
         if not organization:
             logger.warning(f"Organization with name '{data.organization_name}' not found")
@@ -638,23 +1719,15 @@ async def organization_search_name(
                 code=21,
                 message=f"Организация с названием '{data.organization_name}' не найдена"
             )
-            return JSONResponse(status_code=200, content=response, media_type='application/json')
-
-        organization_info = OrganizationInfo(
-            id=organization.id,
-            name=organization.name,
-            phones=[int(phone.number) for phone in organization.phones],
-            activities=[activity.name for activity in organization.activities],
-            address=organization.building.address
-        )
+            return cache_json_response(cache_key, response)
 
         response = set_response_model(
             code=0,
             message="Организация успешно найдена",
-            organization=organization_info.model_dump()
+            organization=organization_info(organization)
         )
 
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return cache_json_response(cache_key, response)
 
     except Exception as e:
         logger.error(f"Error searching organization by name '{data.organization_name}': {str(e)}")
@@ -662,8 +1735,217 @@ async def organization_search_name(
             code=51,
             message=f"Внутренняя ошибка сервера: {str(e)}"
         )
-        return JSONResponse(status_code=200, content=response, media_type='application/json')
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/organization/search/id/batch", response_model_exclude_none=True,
+          response_model=OrganizationSearchIdBatchResponse, name="Пакетный поиск организаций по ID",
+          tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
+async def organization_search_id_batch(
+        request: Request, data: OrganizationSearchIdBatch, db = Depends(get_read_db)
+):
+    """
+      Поиск информации о нескольких организациях по их идентификаторам одним запросом.
+      Результаты возвращаются в порядке запрошенных ID, ненайденные отмечаются признаком found = false.
+    """
+    try:
+        organizations = await load_organizations(db, set(data.organization_ids))
+
+        items = []
+        for organization_id in data.organization_ids:
+            organization = organizations.get(organization_id)
+            items.append({
+                "organization_id": organization_id,
+                "found": organization is not None,
+                "organization": organization_info(organization) if organization is not None else None
+            })
+        qty = sum(item["found"] for item in items)
+
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {qty} из {len(items)} организаций",
+            organization=items,
+            qty=qty
+        )
+
+        logger.info(f"Successfully found {qty} of {len(items)} organizations by ID")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except Exception as e:
+        logger.error(f"Error searching {len(data.organization_ids)} organizations by ID: {str(e)}")
+        response = set_response_model(
+            code=58,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/organization/search/name/batch", response_model_exclude_none=True,
+          response_model=OrganizationSearchNameBatchResponse, name="Пакетный поиск организаций по названию",
+          tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
+async def organization_search_name_batch(
+        request: Request, data: OrganizationSearchNameBatch, db = Depends(get_read_db)
+):
+    """
+      Поиск информации о нескольких организациях по их точным названиям одним запросом.
+      Результаты возвращаются в порядке запрошенных названий, ненайденные отмечаются признаком found = false.
+    """
+    try:
+        organizations = await load_organizations_by_name(db, data.organization_names)
+
+        items = []
+        for organization_name in data.organization_names:
+            organization = organizations.get(organization_name)
+            items.append({
+                "organization_name": organization_name,
+                "found": organization is not None,
+                "organization": organization_info(organization) if organization is not None else None
+            })
+        qty = sum(item["found"] for item in items)
+
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {qty} из {len(items)} организаций",
+            organization=items,
+            qty=qty
+        )
+
+        logger.info(f"Successfully found {qty} of {len(items)} organizations by name")
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+    except Exception as e:
+        logger.error(f"Error searching {len(data.organization_names)} organizations by name: {str(e)}")
+        response = set_response_model(
+            code=59,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.post("/organization/search/name/match", response_model_exclude_none=True,
+          response_model=OrganizationSearchNameMatchResponse, name="Поиск организаций по части названия",
+          tags=["Организации"],
+          dependencies=[Depends(require_api_key)])
+async def organization_search_name_match(
+        request: Request, data: OrganizationSearchNameMatch, db = Depends(get_read_db)
+):
+    """
+      Поиск организаций по части названия с ранжированием по степени совпадения.
+      Режим fuzzy допускает опечатки и пропущенные слова, режим prefix ищет по началу названия.
+    """
+    # Повторные запросы с теми же параметрами обслуживаются из кэша без обращения к БД
+    cache_key = request_key("organization_search_name_match", data)
+    response = cached_response(cache_key)
+    if response is not None:
+        return response
+
+    try:
+        # Название уже нормализовано при валидации запроса (пробелы схлопнуты, не пустое)
+        name = data.organization_name
+        if data.mode == "prefix":
+            ranked = await match_organizations_prefix(db, name, data.limit)
+        elif request.app.state.trigram:
+            ranked = await match_organizations_trigram(db, name, data.limit)
+        else:
+            ranked = await match_organizations_words(db, name, data.limit)
+
+        if not ranked:
+            logger.warning(f"No organizations matching '{data.organization_name}' ({data.mode})")
+            response = set_response_model(
+                code=21,
+                message=f"Организации с названием, похожим на '{data.organization_name}', не найдены",
+                organization=[],
+                qty=0
+            )
+            return cache_json_response(cache_key, response)
+
+        organizations = await load_organizations(db, [organization_id for organization_id, _ in ranked])
+
+        organizations_info = []
+        for organization_id, score in ranked:
+            if organization_id in organizations:
+                organizations_info.append(organization_info(organizations[organization_id]) | {"score": round(score, 4)})
+
+        response = set_response_model(
+            code=0,
+            message=f"Найдено {len(organizations_info)} организаций по названию '{data.organization_name}'",
+            organization=organizations_info,
+            qty=len(organizations_info)
+        )
+
+        logger.info(f"Successfully matched {len(organizations_info)} organizations by name '{data.organization_name}' ({data.mode})")
+        return cache_json_response(cache_key, response)
+
+    except Exception as e:
+        logger.error(f"Error matching organizations by name '{data.organization_name}': {str(e)}")
+        response = set_response_model(
+            code=57,
+            message=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+        return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.get("/service/cache", response_model_exclude_none=True, response_model=CacheStatsResponse,
+         name="Статистика кэша ответов", tags=["Сервис"],
+         dependencies=[Depends(require_api_key)])
+async def service_cache_stats(
+        request: Request
+):
+    """
+      Счетчики попаданий и промахов кэша ответов, текущий размер кэша.
+    """
+    response = set_response_model(code=0, message="Статистика кэша ответов", cache=response_cache.stats())
+    return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.delete("/service/cache", response_model_exclude_none=True, response_model=CacheStatsResponse,
+            name="Сброс кэша ответов", tags=["Сервис"],
+            dependencies=[Depends(require_api_key)])
+async def service_cache_invalidate(
+        request: Request, db = Depends(get_db),
+        tag: List[str] = Query(description="Сбросить только записи, зависящие от указанных данных "
+                                           "(без параметра - весь кэш)", default=None,
+                               examples=[[TAG_ORGANIZATIONS, TAG_BUILDINGS, TAG_ACTIVITIES]])
+):
+    """
+      Сброс кэша ответов после изменения данных в обход API (например, загрузки данных напрямую в БД).
+      Кэш сбрасывается во всех процессах приложения, количество сброшенных записей - по процессу, обработавшему запрос.
+    """
+    qty = response_cache.invalidate(*(tag or ()))
+    logger.info(f"Response cache: {qty} entries invalidated on request")
+    # У каждого воркера свой кэш, остальные процессы сбрасывают его по уведомлению через БД
+    try:
+        await notify_cache_flush(db, tuple(tag or ()))
+    except Exception as e:
+        logger.error(f"Failed to notify other processes to invalidate the response cache: {str(e)}")
+    response = set_response_model(code=0, message=f"Сброшено {qty} записей кэша", cache=response_cache.stats())
+    return ORJSONResponse(status_code=200, content=response, media_type='application/json')
+
+
+@app.get("/service/db/pool", response_model_exclude_none=True, response_model=DatabasePoolStatsResponse,
+         name="Статистика пула соединений БД", tags=["Сервис"],
+         dependencies=[Depends(require_api_key)])
+async def service_db_pool_stats(
+        request: Request
+):
+    """
+      Состояние пула соединений с БД текущего процесса: занятые соединения, соединения сверх пула, время ожидания.
+      Для реплик также доступность, отставание и количество выданных сессий чтения.
+    """
+    response = set_response_model(code=0, message="Статистика пула соединений БД", pool=pool_stats(async_engine),
+                                  replicas=replicas.stats() or None, primary_read_sessions=replicas.primary_sessions)
+    return ORJSONResponse(status_code=200, content=response, media_type='application/json')
 
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host=API_HOST, port=API_PORT, reload=True)
+    if SERVER_MODE == "production":
+        # Каждый воркер - отдельный процесс со своим пулом соединений и кэшами, трафик начинает принимать
+        # после прогрева в lifespan. loop/http "auto" выбирают uvloop и httptools, если они установлены.
+        # При SIGTERM воркеры перестают принимать соединения и дообрабатывают принятые запросы
+        logger.info(f"Starting {SERVER_WORKERS} workers on {API_HOST}:{API_PORT}")
+        uvicorn.run("app:app", host=API_HOST, port=API_PORT, workers=SERVER_WORKERS, loop="auto", http="auto",
+                    timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT, access_log=False)
+    else:
+        uvicorn.run("app:app", host=API_HOST, port=API_PORT, reload=True)
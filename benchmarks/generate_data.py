@@ -0,0 +1,174 @@
+"""
+Генератор синтетического справочника для нагрузочного тестирования.
+
+Создает здания, сгруппированные в кластеры вокруг центров (районы города), дерево видов деятельности
+из 3 уровней и организации с телефонами и видами деятельности. Первые записи повторяют тестовые данные
+seed_data.py, поэтому запросы из test.http находят организации и на сгенерированных данных.
+Результат записывается в форматах postgres_init/bulk_load.py. При одинаковом --seed данные совпадают.
+
+Использование (из корня проекта, в пустую БД после init_db.py и миграций):
+  python benchmarks/generate_data.py --buildings 100000 --organizations 1000000 --out benchmarks/data
+  python -m postgres_init.bulk_load --buildings benchmarks/data/buildings.csv \
+      --activities benchmarks/data/activities.jsonl --organizations benchmarks/data/organizations.jsonl.gz
+"""
+import argparse
+import csv
+import gzip
+import json
+import math
+import os
+import random
+from itertools import accumulate
+
+
+# Центр и радиус области, в которой размещаются кластеры зданий (Москва)
+CITY_LATITUDE = 55.751244
+CITY_LONGITUDE = 37.618423
+CITY_RADIUS_DEGREES = 0.25
+
+# Тестовые данные seed_data.py: здания, дерево деятельностей (название, родитель) и организации
+SEED_BUILDINGS = [
+    (1, "г. Москва, ул. Блюхера, 32/1", 55.751244, 37.618423),
+    (2, "г. Москва, ул. Ленина, 1, офис 3", 55.753215, 37.620393),
+]
+SEED_ACTIVITIES = [
+    ("Еда", None), ("Мясная продукция", "Еда"), ("Молочная продукция", "Еда"),
+    ("Автомобили", None), ("Грузовые", "Автомобили"), ("Легковые", "Автомобили"),
+    ("Запчасти", "Легковые"), ("Аксессуары", "Легковые"),
+]
+SEED_ORGANIZATIONS = [
+    ('ООО "Рога и Копыта"', 1, ["2222222", "3333333", "89236661313"], ["Мясная продукция", "Молочная продукция"]),
+    ('АО "Автозапчасти+"', 2, ["3333333"], ["Запчасти", "Аксессуары"]),
+]
+
+STREETS = ["Ленина", "Блюхера", "Красная", "Садовая", "Тверская", "Мира", "Лесная", "Школьная", "Новая", "Полевая",
+           "Советская", "Гагарина", "Пушкина", "Луговая", "Речная", "Заводская"]
+LEGAL_FORMS = ["ООО", "АО", "ИП", "ПАО", "ЗАО"]
+NAME_WORDS = ["Альфа", "Вектор", "Гранит", "Восток", "Север", "Союз", "Профи", "Мастер", "Стандарт", "Эталон",
+              "Лидер", "Феникс", "Меридиан", "Орион", "Титан", "Гарант", "Партнер", "Континент", "Импульс", "Ресурс"]
+
+
+def cluster_centers(rng: random.Random, clusters: int) -> list:
+    """
+    Размещает центры кластеров равномерно по кругу области и назначает им вес (популярность района).
+
+    :param rng: Генератор случайных чисел
+    :param clusters: Количество кластеров
+    :return: Список кортежей (широта, долгота, разброс в градусах, вес)
+    """
+    centers = []
+    for _ in range(clusters):
+        distance = CITY_RADIUS_DEGREES * math.sqrt(rng.random())
+        angle = rng.uniform(0, 2 * math.pi)
+        latitude = CITY_LATITUDE + distance * math.sin(angle)
+        longitude = CITY_LONGITUDE + distance * math.cos(angle) / math.cos(math.radians(CITY_LATITUDE))
+        # Центральные районы плотнее и популярнее окраин
+        spread = 0.002 + 0.02 * distance / CITY_RADIUS_DEGREES
+        weight = rng.paretovariate(1.2)
+        centers.append((latitude, longitude, spread, weight))
+    return centers
+
+
+def generate_buildings(rng: random.Random, count: int, clusters: int, path: str) -> None:
+    centers = cluster_centers(rng, clusters)
+    weights = [weight for *_, weight in centers]
+
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "address", "latitude", "longitude"])
+        writer.writerows(SEED_BUILDINGS)
+        for building_id in range(len(SEED_BUILDINGS) + 1, count + 1):
+            latitude, longitude, spread, _ = rng.choices(centers, weights)[0]
+            address = f"г. Москва, ул. {rng.choice(STREETS)}, {rng.randint(1, 200)}"
+            if rng.random() < 0.3:
+                address += f", офис {rng.randint(1, 500)}"
+            writer.writerow([
+                building_id, address,
+                round(rng.gauss(latitude, spread), 6), round(rng.gauss(longitude, spread * 1.8), 6)
+            ])
+
+
+def generate_activities(roots: int, children: int, path: str) -> list:
+    """
+    Строит дерево видов деятельности из 3 уровней: тестовое дерево seed_data.py и синтетические ветви.
+
+    :param roots: Количество синтетических корневых видов деятельности
+    :param children: Количество дочерних видов деятельности у каждого узла первых двух уровней
+    :param path: Путь к файлу JSONL
+    :return: Список кортежей (ID, название) всех видов деятельности
+    """
+    activities = []
+    ids = {}
+    for name, parent in SEED_ACTIVITIES:
+        ids[name] = len(activities) + 1
+        activities.append((ids[name], name, ids.get(parent)))
+
+    for root in range(1, roots + 1):
+        root_id = len(activities) + 1
+        activities.append((root_id, f"Отрасль {root}", None))
+        for child in range(1, children + 1):
+            child_id = len(activities) + 1
+            activities.append((child_id, f"Отрасль {root}.{child}", root_id))
+            for grandchild in range(1, children + 1):
+                activities.append((len(activities) + 1, f"Отрасль {root}.{child}.{grandchild}", child_id))
+
+    with open(path, "w", encoding="utf-8") as file:
+        for activity_id, name, parent_id in activities:
+            file.write(json.dumps({"id": activity_id, "name": name, "parent_id": parent_id}, ensure_ascii=False) + "\n")
+
+    return [(activity_id, name) for activity_id, name, _ in activities]
+
+
+def generate_organizations(rng: random.Random, count: int, buildings: int, activities: list, path: str) -> None:
+    # Популярность зданий и видов деятельности распределена по степенному закону:
+    # в бизнес-центрах сотни организаций, большинство зданий занято одной-двумя
+    building_weights = [rng.paretovariate(1.1) for _ in range(buildings)]
+    building_cumulative = list(accumulate(building_weights))
+    activity_cumulative = list(accumulate(1 / rank for rank in range(1, len(activities) + 1)))
+    activity_ids = [activity_id for activity_id, _ in activities]
+    shuffled_activity_ids = activity_ids[:]
+    rng.shuffle(shuffled_activity_ids)
+
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        for organization_id, (name, building_id, phones, activity_names) in enumerate(SEED_ORGANIZATIONS, start=1):
+            record = {"id": organization_id, "name": name, "building_id": building_id, "phones": phones,
+                      "activities": activity_names}
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        for organization_id in range(len(SEED_ORGANIZATIONS) + 1, count + 1):
+            name = f'{rng.choice(LEGAL_FORMS)} "{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {organization_id}"'
+            building_id = rng.choices(range(1, buildings + 1), cum_weights=building_cumulative)[0]
+            # Номера уникальны: префикс 89, ID организации и порядковый номер телефона организации
+            phones = [f"89{organization_id:08d}{index}" for index in range(rng.choice((1, 1, 1, 2, 2, 3)))]
+            organization_activities = set(rng.choices(shuffled_activity_ids, cum_weights=activity_cumulative,
+                                                       k=rng.choice((1, 1, 2, 2, 3))))
+            record = {"id": organization_id, "name": name, "building_id": building_id, "phones": phones,
+                      "activities": sorted(organization_activities)}
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генератор синтетического справочника для нагрузочного тестирования")
+    parser.add_argument("--buildings", type=int, default=10000, help="Количество зданий")
+    parser.add_argument("--organizations", type=int, default=100000, help="Количество организаций")
+    parser.add_argument("--clusters", type=int, default=200, help="Количество кластеров (районов) зданий")
+    parser.add_argument("--activity-roots", type=int, default=20, help="Количество синтетических корневых деятельностей")
+    parser.add_argument("--activity-children", type=int, default=5, help="Количество дочерних деятельностей у узла")
+    parser.add_argument("--seed", type=int, default=42, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--out", default=os.path.join("benchmarks", "data"), help="Папка для файлов данных")
+    args = parser.parse_args()
+
+    if args.buildings < len(SEED_BUILDINGS) or args.organizations < len(SEED_ORGANIZATIONS):
+        parser.error(f"Нужно не меньше {len(SEED_BUILDINGS)} зданий и {len(SEED_ORGANIZATIONS)} организаций")
+
+    os.makedirs(args.out, exist_ok=True)
+    rng = random.Random(args.seed)
+
+    generate_buildings(rng, args.buildings, args.clusters, os.path.join(args.out, "buildings.csv"))
+    activities = generate_activities(args.activity_roots, args.activity_children,
+                                     os.path.join(args.out, "activities.jsonl"))
+    generate_organizations(rng, args.organizations, args.buildings, activities,
+                           os.path.join(args.out, "organizations.jsonl.gz"))
+
+    print(f"Сгенерировано: зданий {args.buildings}, видов деятельности {len(activities)}, "
+          f"организаций {args.organizations}. Файлы в папке '{args.out}'")
@@ -0,0 +1,236 @@
+"""
+Нагрузочный драйвер: воспроизводит запросы из test.http с заданной конкурентностью и измеряет
+задержки (p50/p95/p99) и пропускную способность по каждому методу API.
+
+Методы нагружаются по очереди, чтобы задержки одного не влияли на другой. Результаты печатаются
+таблицей и сохраняются в JSON для сравнения прогонов.
+
+Использование (из корня проекта, приложение должно быть запущено):
+  python benchmarks/load.py --url http://localhost:8000 --concurrency 32 --requests 2000 \
+      --output benchmarks/results/$(date +%Y%m%d-%H%M%S).json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+
+# Коды ответов приложения, которые не считаются ошибками: успех и "не найдено" (запросы из test.http
+# могут не находить данных в сгенерированном наборе). Любой другой код - ошибка
+EXPECTED_CODES = {0, 20, 21, 22, 23}
+
+# Код ответа приложения "ключ доступа не принят": прогон прерывается, иначе измерялся бы отказ в доступе
+AUTHORIZATION_FAILED_CODE = 1
+
+
+class AuthorizationFailed(Exception):
+    """Приложение не приняло ключ доступа из запроса"""
+
+
+def parse_http_file(path: str) -> list:
+    """
+    Разбирает файл запросов в формате HTTP Client (JetBrains): "### Название", строка запроса, заголовки, тело.
+    Скрипты проверок ответа ("> {% ... %}") пропускаются.
+
+    :param path: Путь к файлу
+    :return: Список словарей с названием, методом, путем, заголовками и телом запроса
+    """
+    with open(path, encoding="utf-8") as file:
+        sections = re.split(r"^###[ \t]*(.*)$", file.read(), flags=re.MULTILINE)
+
+    requests = []
+    # После split: [текст до первого ###, название, текст, название, текст, ...]
+    for name, text in zip(sections[1::2], sections[2::2]):
+        lines = text.split("\n")
+        while lines and not lines[0].strip():
+            lines.pop(0)
+        if not lines:
+            continue
+
+        method, url = lines.pop(0).split()[:2]
+        # Адрес сервера из файла заменяется адресом из параметров запуска, используется только путь
+        address = url.split("://", 1)[-1]
+        path = "/" + address.split("/", 1)[1] if "/" in address else "/"
+
+        headers = {}
+        while lines and lines[0].strip():
+            key, value = lines.pop(0).split(":", 1)
+            headers[key.strip()] = value.strip()
+
+        body = []
+        for line in lines:
+            if line.startswith("> {%"):
+                break
+            body.append(line)
+
+        requests.append({
+            "name": name.strip() or f"{method} {path}",
+            "method": method.upper(),
+            "path": path,
+            "headers": headers,
+            "body": "\n".join(body).strip().encode("utf-8") or None,
+        })
+
+    return requests
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Процентиль по методу ближайшего ранга.
+
+    :param values: Отсортированные значения
+    :param percent: Процент (0-100)
+    :return: Значение процентиля
+    """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+async def run_endpoint(client: httpx.AsyncClient, request: dict, total: int, concurrency: int, warmup: int) -> dict:
+    """
+    Выполняет запрос total раз силами concurrency параллельных клиентов и собирает статистику.
+
+    :param client: HTTP-клиент
+    :param request: Описание запроса из test.http
+    :param total: Количество измеряемых запросов
+    :param concurrency: Количество параллельных клиентов
+    :param warmup: Количество прогревочных запросов (не учитываются)
+    :return: Статистика по методу
+    """
+    latencies = []
+    statuses = {}
+    codes = {}
+    errors = 0
+
+    async def send(measure: bool) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            response = await client.request(request["method"], request["path"], headers=request["headers"],
+                                            content=request["body"])
+            status = str(response.status_code)
+            try:
+                code = response.json().get("code")
+            except ValueError:
+                code = None
+        except httpx.HTTPError as e:
+            status, code = type(e).__name__, None
+        elapsed = time.perf_counter() - started
+
+        if code == AUTHORIZATION_FAILED_CODE:
+            raise AuthorizationFailed(request["name"])
+        if not measure:
+            return
+        latencies.append(elapsed * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+        codes[str(code)] = codes.get(str(code), 0) + 1
+        if status != "200" or code not in EXPECTED_CODES:
+            errors += 1
+
+    for _ in range(warmup):
+        await send(measure=False)
+
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await send(measure=True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "method": request["method"],
+        "path": request["path"],
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "response_codes": codes,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.realpath(__file__)))
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(url: str, http_file: str, total: int, concurrency: int, warmup: int, only: list,
+                        timeout: float) -> dict:
+    requests = parse_http_file(http_file)
+    if only:
+        requests = [request for request in requests if request["name"] in only]
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": platform.node(),
+        "url": url,
+        "http_file": http_file,
+        "concurrency": concurrency,
+        "requests_per_endpoint": total,
+        "warmup": warmup,
+        "endpoints": {},
+    }
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        for request in requests:
+            stats = await run_endpoint(client, request, total, concurrency, warmup)
+            results["endpoints"][request["name"]] = stats
+            latency = stats["latency_ms"]
+            print(f"{request['name']:<35} {stats['throughput_rps']:>9.1f} rps  p50 {latency['p50']:>8.2f}  "
+                  f"p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms  ошибок {stats['errors']}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование методов API по запросам из test.http")
+    parser.add_argument("--url", default="http://localhost:8000", help="Адрес приложения")
+    parser.add_argument("--http-file", default="test.http", help="Файл запросов в формате HTTP Client")
+    parser.add_argument("--requests", type=int, default=1000, help="Количество измеряемых запросов на метод")
+    parser.add_argument("--concurrency", type=int, default=16, help="Количество параллельных клиентов")
+    parser.add_argument("--warmup", type=int, default=20, help="Количество прогревочных запросов на метод")
+    parser.add_argument("--timeout", type=float, default=30, help="Таймаут запроса в секундах")
+    parser.add_argument("--only", action="append", help="Нагружать только метод с этим названием из test.http")
+    parser.add_argument("--output", help="Файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run_benchmark(args.url, args.http_file, args.requests, args.concurrency, args.warmup,
+                                            args.only, args.timeout))
+    except AuthorizationFailed as e:
+        raise SystemExit(f"Ключ доступа из '{args.http_file}' не принят приложением (запрос '{e}'), прогон прерван. "
+                         f"Выпустите ключ: python -m postgres_init.api_keys create demo --key ABC123")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в '{args.output}'")
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table
+import hashlib
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, Index, DateTime, func, SmallInteger, \
+    BigInteger, CheckConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -15,7 +19,53 @@ organization_activities = Table(
     'organization_activities',
     Base.metadata,
     Column('organization_id', Integer, ForeignKey('organizations.id'), primary_key=True),
-    Column('activity_id', Integer, ForeignKey('activities.id'), primary_key=True)
+    Column('activity_id', Integer, ForeignKey('activities.id'), primary_key=True),
+    # Первичный ключ начинается с organization_id, для поиска организаций по деятельности нужен отдельный индекс
+    Index('ix_organization_activities_activity_id', 'activity_id')
+)
+
+# Таблица замыкания дерева деятельностей: все пары (предок, потомок) с расстоянием между ними.
+# Каждая деятельность является сама себе предком с depth = 0. Таблица поддерживается триггерами БД
+# (миграция 0001_activity_closure) при добавлении и переносе деятельностей, вручную не изменяется.
+activity_closure = Table(
+    'activity_closure',
+    Base.metadata,
+    Column('ancestor_id', Integer, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True),
+    Column('descendant_id', Integer, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True),
+    Column('depth', Integer, nullable=False, comment="Расстояние от предка до потомка"),
+    Index('ix_activity_closure_descendant_id', 'descendant_id', 'depth')
+)
+
+# Карточки организаций: все поля OrganizationInfo одной строкой на организацию (модель чтения).
+# Таблица поддерживается триггерами БД (миграция 0005_organization_cards) при изменении организаций, зданий,
+# телефонов, деятельностей и связей между ними, вручную не изменяется.
+organization_cards = Table(
+    'organization_cards',
+    Base.metadata,
+    Column('organization_id', Integer, ForeignKey('organizations.id', ondelete='CASCADE'), primary_key=True),
+    Column('name', String, nullable=False, comment="Название организации"),
+    Column('address', String, nullable=False, comment="Адрес здания"),
+    Column('phones', ARRAY(String), comment="Номера телефонов в порядке ID"),
+    Column('activities', ARRAY(String), comment="Названия видов деятельности в порядке ID")
+)
+
+# Версия данных справочника: одна строка, версия увеличивается триггерами БД (миграция 0007_data_version)
+# при любом изменении зданий, организаций, телефонов, деятельностей и связей между ними
+data_version = Table(
+    'data_version',
+    Base.metadata,
+    Column('id', SmallInteger, CheckConstraint('id = 1'), primary_key=True, server_default='1'),
+    Column('version', BigInteger, nullable=False, server_default='1',
+           comment="Версия данных справочника, увеличивается при каждом изменении")
+)
+
+# Транзакции с изменениями справочника, версия для которых еще не увеличена: строка добавляется при первом изменении
+# в транзакции, а отложенный триггер увеличивает версию и удаляет строку при фиксации (миграция 0007_data_version)
+data_version_pending = Table(
+    'data_version_pending',
+    Base.metadata,
+    Column('transaction_id', BigInteger, primary_key=True, server_default=func.txid_current()),
+    prefixes=['UNLOGGED']
 )
 
 
@@ -64,10 +114,27 @@ class Organization(Base):
     __tablename__ = 'organizations'
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False, comment="Название организации")
-    building_id = Column(Integer, ForeignKey('buildings.id'), nullable=False, comment="ID здания")
+    name = Column(String, nullable=False, index=True, comment="Название организации")
+    building_id = Column(Integer, ForeignKey('buildings.id'), nullable=False, index=True, comment="ID здания")
 
     # Связи
     building = relationship("Building", back_populates="organizations")
     phones = relationship("Phone", secondary=organization_phones, back_populates="organizations")
     activities = relationship("Activity", secondary=organization_activities, back_populates="organizations")
+
+
+class ApiKey(Base):
+    """Модель для ключа доступа к API. Сам ключ не хранится, только его хеш"""
+    __tablename__ = 'api_keys'
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, comment="Владелец или назначение ключа")
+    key_hash = Column(String(64), nullable=False, unique=True, comment="SHA-256 ключа в шестнадцатеричном виде")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), comment="Дата выпуска")
+    revoked_at = Column(DateTime(timezone=True), nullable=True, comment="Дата отзыва, NULL - ключ действует")
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        # Ключи выпускаются случайными и длинными, подобрать их по хешу невозможно, поэтому медленная функция
+        # хеширования паролей (bcrypt, scrypt) не нужна и проверка ключа остается дешевой
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
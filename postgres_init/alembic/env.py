@@ -6,10 +6,10 @@ import os
 import sys
 
 # Добавляем корневую директорию проекта в путь
-sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
 
-from DBModels import Base
-from database import DATABASE_URL
+from postgres_init.DBModels import Base
+from postgres_init.database import DATABASE_URL
 
 config = context.config
 
@@ -19,7 +19,8 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 def get_url():
-    return DATABASE_URL
+    # Миграции выполняются синхронно, поэтому асинхронный драйвер подменяем на psycopg2
+    return DATABASE_URL.replace("+asyncpg", "+psycopg2")
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -0,0 +1,107 @@
+"""Activity closure table
+
+Revision ID: 0001_activity_closure
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_activity_closure'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    # Таблица могла быть уже создана через init_db.py (Base.metadata.create_all)
+    if not inspector.has_table('activity_closure'):
+        op.create_table(
+            'activity_closure',
+            sa.Column('ancestor_id', sa.Integer(), sa.ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('descendant_id', sa.Integer(), sa.ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('depth', sa.Integer(), nullable=False, comment="Расстояние от предка до потомка"),
+        )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_activity_closure_descendant_id "
+               "ON activity_closure (descendant_id, depth)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_organization_activities_activity_id "
+               "ON organization_activities (activity_id)")
+
+    # Новая деятельность наследует всех предков родителя и ссылается сама на себя
+    op.execute("""
+        CREATE OR REPLACE FUNCTION activity_closure_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT NEW.id, NEW.id, 0
+            UNION ALL
+            SELECT ancestor_id, NEW.id, depth + 1
+            FROM activity_closure
+            WHERE descendant_id = NEW.parent_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # При переносе деятельности все поддерево отвязывается от старых предков и привязывается к новым
+    op.execute("""
+        CREATE OR REPLACE FUNCTION activity_closure_move() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM activity_closure
+            WHERE descendant_id IN (SELECT descendant_id FROM activity_closure WHERE ancestor_id = NEW.id)
+              AND ancestor_id NOT IN (SELECT descendant_id FROM activity_closure WHERE ancestor_id = NEW.id);
+
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT parents.ancestor_id, subtree.descendant_id, parents.depth + subtree.depth + 1
+            FROM activity_closure AS parents
+            CROSS JOIN activity_closure AS subtree
+            WHERE parents.descendant_id = NEW.parent_id
+              AND subtree.ancestor_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("DROP TRIGGER IF EXISTS activities_closure_insert ON activities")
+    op.execute("""
+        CREATE TRIGGER activities_closure_insert
+        AFTER INSERT ON activities
+        FOR EACH ROW EXECUTE FUNCTION activity_closure_insert()
+    """)
+    op.execute("DROP TRIGGER IF EXISTS activities_closure_move ON activities")
+    op.execute("""
+        CREATE TRIGGER activities_closure_move
+        AFTER UPDATE OF parent_id ON activities
+        FOR EACH ROW WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+        EXECUTE FUNCTION activity_closure_move()
+    """)
+
+    # Заполняем таблицу для уже существующих деятельностей
+    op.execute("TRUNCATE activity_closure")
+    op.execute("""
+        INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree AS (
+            SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+            FROM activities
+            UNION ALL
+            SELECT tree.ancestor_id, activities.id, tree.depth + 1
+            FROM tree
+            JOIN activities ON activities.parent_id = tree.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS activities_closure_move ON activities")
+    op.execute("DROP TRIGGER IF EXISTS activities_closure_insert ON activities")
+    op.execute("DROP FUNCTION IF EXISTS activity_closure_move()")
+    op.execute("DROP FUNCTION IF EXISTS activity_closure_insert()")
+    op.execute("DROP INDEX IF EXISTS ix_organization_activities_activity_id")
+    op.drop_table('activity_closure')
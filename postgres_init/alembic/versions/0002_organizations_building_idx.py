@@ -0,0 +1,26 @@
+"""Index on organizations.building_id
+
+Revision ID: 0002_organizations_building_idx
+Revises: 0001_activity_closure
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_organizations_building_idx'
+down_revision: Union[str, None] = '0001_activity_closure'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Гео-поиск выбирает здания по пространственному индексу в памяти, а организации - по building_id
+    op.execute("CREATE INDEX IF NOT EXISTS ix_organizations_building_id ON organizations (building_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_organizations_building_id")
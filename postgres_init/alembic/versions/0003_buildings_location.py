@@ -0,0 +1,58 @@
+"""PostGIS geography column on buildings
+
+Revision ID: 0003_buildings_location
+Revises: 0002_organizations_building_idx
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_buildings_location'
+down_revision: Union[str, None] = '0002_organizations_building_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # Колонка опциональна: без PostGIS приложение продолжает искать по latitude/longitude
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")).scalar()
+    if not available:
+        print("PostGIS не установлен на сервере БД, колонка buildings.location не создается")
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    op.execute("ALTER TABLE buildings ADD COLUMN IF NOT EXISTS location geography(Point, 4326)")
+    op.execute("COMMENT ON COLUMN buildings.location IS 'Координаты здания (PostGIS), заполняется триггером'")
+
+    # Колонка вычисляется из latitude/longitude, поэтому приложение и загрузчики данных ее не заполняют
+    op.execute("""
+        CREATE OR REPLACE FUNCTION buildings_set_location() RETURNS trigger AS $$
+        BEGIN
+            NEW.location := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326)::geography;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS buildings_location ON buildings")
+    op.execute("""
+        CREATE TRIGGER buildings_location
+        BEFORE INSERT OR UPDATE OF latitude, longitude ON buildings
+        FOR EACH ROW EXECUTE FUNCTION buildings_set_location()
+    """)
+
+    op.execute("UPDATE buildings SET location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_buildings_location ON buildings USING GIST (location)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_buildings_location")
+    op.execute("DROP TRIGGER IF EXISTS buildings_location ON buildings")
+    op.execute("DROP FUNCTION IF EXISTS buildings_set_location()")
+    op.execute("ALTER TABLE buildings DROP COLUMN IF EXISTS location")
@@ -0,0 +1,42 @@
+"""Indexes for organization name search
+
+Revision ID: 0004_organizations_name_search
+Revises: 0003_buildings_location
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_organizations_name_search'
+down_revision: Union[str, None] = '0003_buildings_location'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Точный поиск по названию
+    op.execute("CREATE INDEX IF NOT EXISTS ix_organizations_name ON organizations (name)")
+    # Поиск по началу названия без учета регистра: lower(name) LIKE 'префикс%'
+    op.execute("CREATE INDEX IF NOT EXISTS ix_organizations_name_prefix ON organizations (lower(name) text_pattern_ops)")
+
+    bind = op.get_bind()
+
+    # Без pg_trgm поиск по сходству выполняется через ILIKE по словам запроса, без учета опечаток
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar()
+    if not available:
+        print("pg_trgm не установлен на сервере БД, триграммный индекс названий организаций не создается")
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_organizations_name_trgm ON organizations USING GIN (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_organizations_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_organizations_name_prefix")
+    op.execute("DROP INDEX IF EXISTS ix_organizations_name")
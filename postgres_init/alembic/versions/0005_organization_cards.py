@@ -0,0 +1,222 @@
+"""Organization cards read model
+
+Revision ID: 0005_organization_cards
+Revises: 0004_organizations_name_search
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_organization_cards'
+down_revision: Union[str, None] = '0004_organizations_name_search'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Триггеры уровня оператора: (имя триггера, таблица, событие, функция). Затронутые строки передаются
+# через таблицы переходов, поэтому массовые INSERT и COPY обновляют карточки одним запросом на оператор
+TRIGGERS = [
+    ('organizations_cards_insert', 'organizations', 'INSERT', 'organization_cards_organizations_changed'),
+    ('organizations_cards_update', 'organizations', 'UPDATE', 'organization_cards_organizations_changed'),
+    ('organization_phones_cards_insert', 'organization_phones', 'INSERT', 'organization_cards_links_changed'),
+    ('organization_phones_cards_update', 'organization_phones', 'UPDATE', 'organization_cards_links_changed'),
+    ('organization_phones_cards_delete', 'organization_phones', 'DELETE', 'organization_cards_links_changed'),
+    ('organization_activities_cards_insert', 'organization_activities', 'INSERT', 'organization_cards_links_changed'),
+    ('organization_activities_cards_update', 'organization_activities', 'UPDATE', 'organization_cards_links_changed'),
+    ('organization_activities_cards_delete', 'organization_activities', 'DELETE', 'organization_cards_links_changed'),
+    ('buildings_cards_update', 'buildings', 'UPDATE', 'organization_cards_buildings_changed'),
+    ('phones_cards_update', 'phones', 'UPDATE', 'organization_cards_phones_changed'),
+    ('activities_cards_update', 'activities', 'UPDATE', 'organization_cards_activities_changed'),
+]
+
+FUNCTIONS = [
+    'organization_cards_organizations_changed()',
+    'organization_cards_links_changed()',
+    'organization_cards_buildings_changed()',
+    'organization_cards_phones_changed()',
+    'organization_cards_activities_changed()',
+    'organization_cards_refresh(integer[])',
+]
+
+
+def transition_tables(event: str) -> str:
+    if event == 'INSERT':
+        return 'NEW TABLE AS new_rows'
+    if event == 'DELETE':
+        return 'OLD TABLE AS old_rows'
+    return 'OLD TABLE AS old_rows NEW TABLE AS new_rows'
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    # Таблица могла быть уже создана через init_db.py (Base.metadata.create_all)
+    if not inspector.has_table('organization_cards'):
+        op.create_table(
+            'organization_cards',
+            sa.Column('organization_id', sa.Integer(), sa.ForeignKey('organizations.id', ondelete='CASCADE'),
+                      primary_key=True),
+            sa.Column('name', sa.String(), nullable=False, comment="Название организации"),
+            sa.Column('address', sa.String(), nullable=False, comment="Адрес здания"),
+            sa.Column('phones', postgresql.ARRAY(sa.String()), comment="Номера телефонов в порядке ID"),
+            sa.Column('activities', postgresql.ARRAY(sa.String()), comment="Названия видов деятельности в порядке ID"),
+        )
+
+    # Пересчитывает карточки организаций из нормализованных таблиц. Строки организаций блокируются до пересчета:
+    # конкурирующая транзакция, меняющая ту же организацию, дождется фиксации этой и пересчитает карточку
+    # с учетом ее изменений (в READ COMMITTED каждый оператор функции видит уже зафиксированные данные)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_refresh(organization_ids integer[]) RETURNS void AS $$
+        BEGIN
+            IF cardinality(organization_ids) = 0 THEN
+                RETURN;
+            END IF;
+
+            PERFORM 1 FROM organizations
+            WHERE id IN (SELECT unnest(organization_ids))
+            ORDER BY id
+            FOR NO KEY UPDATE;
+
+            INSERT INTO organization_cards (organization_id, name, address, phones, activities)
+            SELECT o.id, o.name, b.address, p.phones, a.activities
+            FROM (SELECT DISTINCT unnest(organization_ids) AS id) AS ids
+            JOIN organizations o ON o.id = ids.id
+            JOIN buildings b ON b.id = o.building_id
+            CROSS JOIN LATERAL (
+                SELECT array_agg(phones.number ORDER BY phones.id) AS phones
+                FROM organization_phones JOIN phones ON phones.id = organization_phones.phone_id
+                WHERE organization_phones.organization_id = o.id
+            ) AS p
+            CROSS JOIN LATERAL (
+                SELECT array_agg(activities.name ORDER BY activities.id) AS activities
+                FROM organization_activities JOIN activities ON activities.id = organization_activities.activity_id
+                WHERE organization_activities.organization_id = o.id
+            ) AS a
+            ON CONFLICT (organization_id) DO UPDATE
+            SET name = EXCLUDED.name, address = EXCLUDED.address,
+                phones = EXCLUDED.phones, activities = EXCLUDED.activities;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Триггеры не пересчитывают карточки в транзакции массовой загрузки (SET LOCAL secunda.bulk_load = on,
+    # postgres_init/bulk_load.py): загрузка пересчитывает карточки один раз в конце, не блокируя таблицы
+    # через ALTER TABLE ... DISABLE TRIGGER.
+    # Удаленные организации убираются из карточек каскадно по внешнему ключу
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_organizations_changed() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('secunda.bulk_load', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                PERFORM organization_cards_refresh(ARRAY(SELECT id FROM new_rows));
+            ELSE
+                PERFORM organization_cards_refresh(ARRAY(
+                    SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                    WHERE (n.name, n.building_id) IS DISTINCT FROM (o.name, o.building_id)
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_links_changed() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('secunda.bulk_load', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                PERFORM organization_cards_refresh(ARRAY(SELECT organization_id FROM new_rows));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM organization_cards_refresh(ARRAY(SELECT organization_id FROM old_rows));
+            ELSE
+                PERFORM organization_cards_refresh(ARRAY(
+                    SELECT organization_id FROM new_rows UNION SELECT organization_id FROM old_rows
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_buildings_changed() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('secunda.bulk_load', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM organization_cards_refresh(ARRAY(
+                SELECT organizations.id
+                FROM new_rows n JOIN old_rows o ON o.id = n.id
+                JOIN organizations ON organizations.building_id = n.id
+                WHERE n.address IS DISTINCT FROM o.address
+            ));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_phones_changed() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('secunda.bulk_load', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM organization_cards_refresh(ARRAY(
+                SELECT organization_phones.organization_id
+                FROM new_rows n JOIN old_rows o ON o.id = n.id
+                JOIN organization_phones ON organization_phones.phone_id = n.id
+                WHERE n.number IS DISTINCT FROM o.number
+            ));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION organization_cards_activities_changed() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('secunda.bulk_load', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM organization_cards_refresh(ARRAY(
+                SELECT organization_activities.organization_id
+                FROM new_rows n JOIN old_rows o ON o.id = n.id
+                JOIN organization_activities ON organization_activities.activity_id = n.id
+                WHERE n.name IS DISTINCT FROM o.name
+            ));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    for name, table, event, function in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        op.execute(f"""
+            CREATE TRIGGER {name}
+            AFTER {event} ON {table}
+            REFERENCING {transition_tables(event)}
+            FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+        """)
+
+    # Заполняем карточки для уже существующих организаций
+    op.execute("TRUNCATE organization_cards")
+    op.execute("SELECT organization_cards_refresh(ARRAY(SELECT id FROM organizations))")
+    op.execute("ANALYZE organization_cards")
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    for function in FUNCTIONS:
+        op.execute(f"DROP FUNCTION IF EXISTS {function}")
+    op.drop_table('organization_cards')
@@ -0,0 +1,40 @@
+"""API keys
+
+Revision ID: 0006_api_keys
+Revises: 0005_organization_cards
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_api_keys'
+down_revision: Union[str, None] = '0005_organization_cards'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    # Таблица могла быть уже создана через init_db.py (Base.metadata.create_all)
+    if not inspector.has_table('api_keys'):
+        op.create_table(
+            'api_keys',
+            sa.Column('id', sa.Integer(), primary_key=True, index=True),
+            sa.Column('name', sa.String(), nullable=False, comment="Владелец или назначение ключа"),
+            sa.Column('key_hash', sa.String(64), nullable=False, unique=True,
+                      comment="SHA-256 ключа в шестнадцатеричном виде"),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now(),
+                      comment="Дата выпуска"),
+            sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True,
+                      comment="Дата отзыва, NULL - ключ действует"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('api_keys')
@@ -0,0 +1,128 @@
+"""Data version counter
+
+Revision ID: 0007_data_version
+Revises: 0006_api_keys
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_data_version'
+down_revision: Union[str, None] = '0006_api_keys'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Таблицы справочника, любое изменение которых увеличивает версию данных
+TABLES = ['buildings', 'organizations', 'phones', 'activities', 'organization_phones', 'organization_activities']
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    # Таблица могла быть уже создана через init_db.py (Base.metadata.create_all)
+    if not inspector.has_table('data_version'):
+        op.create_table(
+            'data_version',
+            sa.Column('id', sa.SmallInteger(), sa.CheckConstraint('id = 1'), primary_key=True, server_default='1'),
+            sa.Column('version', sa.BigInteger(), nullable=False, server_default='1',
+                      comment="Версия данных справочника, увеличивается при каждом изменении"),
+        )
+    op.execute("INSERT INTO data_version (id, version) VALUES (1, 1) ON CONFLICT (id) DO NOTHING")
+
+    # Транзакции, изменившие справочник, до фиксации. Таблица не журналируется: строки живут до конца транзакции
+    if not inspector.has_table('data_version_pending'):
+        op.create_table(
+            'data_version_pending',
+            sa.Column('transaction_id', sa.BigInteger(), primary_key=True, server_default=sa.text('txid_current()')),
+            prefixes=['UNLOGGED'],
+        )
+
+    # Версия хранится в строке таблицы, а не в последовательности: новое значение становится видно вместе
+    # с изменениями транзакции, а конкурирующие транзакции получают версии в порядке фиксации.
+    # NOTIFY доставляется слушателям только после фиксации транзакции
+    op.execute("""
+        CREATE OR REPLACE FUNCTION data_version_bump(source text) RETURNS bigint AS $$
+        DECLARE
+            new_version bigint;
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING version INTO new_version;
+            PERFORM pg_notify('data_version', new_version || ' ' || source);
+            RETURN new_version;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Строка data_version блокируется до конца транзакции, поэтому версия увеличивается не в триггерах изменений,
+    # а один раз при фиксации: иначе все пишущие транзакции ждали бы друг друга с первого изменения, а блокировка,
+    # взятая раньше блокировок строк организаций (триггеры organization_cards), могла приводить к взаимоблокировкам.
+    # Триггеры только запоминают измененные таблицы в локальной для транзакции настройке data_version.sources
+    # и при первом изменении добавляют строку в data_version_pending. Откат до точки сохранения отменяет и то и другое.
+    # Фиксации пишущих транзакций по-прежнему выстраиваются в очередь на строке data_version, но только на время
+    # от отложенного триггера до конца фиксации
+    op.execute("""
+        CREATE OR REPLACE FUNCTION data_version_mark(source text) RETURNS void AS $$
+        DECLARE
+            sources text := COALESCE(current_setting('data_version.sources', true), '');
+        BEGIN
+            IF sources = '' THEN
+                INSERT INTO data_version_pending DEFAULT VALUES;
+                PERFORM set_config('data_version.sources', source, true);
+            ELSIF NOT source = ANY(string_to_array(sources, ',')) THEN
+                PERFORM set_config('data_version.sources', sources || ',' || source, true);
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION data_version_commit() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM data_version_pending WHERE transaction_id = NEW.transaction_id;
+            PERFORM data_version_bump(COALESCE(NULLIF(current_setting('data_version.sources', true), ''), 'unknown'));
+            PERFORM set_config('data_version.sources', '', true);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION data_version_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM data_version_mark(TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("DROP TRIGGER IF EXISTS data_version_pending_commit ON data_version_pending")
+    op.execute("""
+        CREATE CONSTRAINT TRIGGER data_version_pending_commit
+        AFTER INSERT ON data_version_pending
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION data_version_commit()
+    """)
+
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_data_version ON {table}")
+        op.execute(f"""
+            CREATE TRIGGER {table}_data_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION data_version_changed()
+        """)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_data_version ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS data_version_changed()")
+    op.drop_table('data_version_pending')
+    op.execute("DROP FUNCTION IF EXISTS data_version_commit()")
+    op.execute("DROP FUNCTION IF EXISTS data_version_mark(text)")
+    op.execute("DROP FUNCTION IF EXISTS data_version_bump(text)")
+    op.drop_table('data_version')
@@ -0,0 +1,84 @@
+"""
+Управление ключами доступа к API.
+
+Ключ показывается один раз при выпуске, в БД хранится только его хеш. Отозванный ключ перестает приниматься
+приложением не позже, чем через API_KEY_CACHE_TTL секунд.
+
+Использование (из корня проекта):
+  python -m postgres_init.api_keys create "Название клиента"
+  python -m postgres_init.api_keys create demo --key ABC123   # заданный ключ, например для test.http
+  python -m postgres_init.api_keys list
+  python -m postgres_init.api_keys revoke 3
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import sys
+
+import asyncpg
+
+# Добавляем корневую директорию проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from postgres_init.database import DATABASE_URL
+from postgres_init.DBModels import ApiKey
+
+
+# Количество случайных байт ключа (в base64url ключ получается длиной 43 символа)
+API_KEY_BYTES = 32
+
+
+async def create_key(connection, name: str, key: str = None) -> None:
+    key = key or secrets.token_urlsafe(API_KEY_BYTES)
+    key_id = await connection.fetchval(
+        "INSERT INTO api_keys (name, key_hash) VALUES ($1, $2) RETURNING id", name, ApiKey.hash_key(key)
+    )
+    print(f"Выпущен ключ ID {key_id} для '{name}'. Сохраните его, повторно ключ не показывается:\n{key}")
+
+
+async def list_keys(connection) -> None:
+    rows = await connection.fetch("SELECT id, name, created_at, revoked_at FROM api_keys ORDER BY id")
+    for row in rows:
+        status = f"отозван {row['revoked_at']:%Y-%m-%d %H:%M}" if row["revoked_at"] else "действует"
+        print(f"{row['id']:>5}  {row['created_at']:%Y-%m-%d %H:%M}  {status:<24}  {row['name']}")
+
+
+async def revoke_key(connection, key_id: int) -> None:
+    result = await connection.execute(
+        "UPDATE api_keys SET revoked_at = now() WHERE id = $1 AND revoked_at IS NULL", key_id
+    )
+    if result.split()[-1] == "0":
+        print(f"Действующий ключ с ID {key_id} не найден")
+    else:
+        print(f"Ключ ID {key_id} отозван")
+
+
+async def main(args) -> None:
+    connection = await asyncpg.connect(DATABASE_URL.replace("+asyncpg", ""))
+    try:
+        if args.command == "create":
+            await create_key(connection, args.name, args.key)
+        elif args.command == "list":
+            await list_keys(connection)
+        else:
+            await revoke_key(connection, args.id)
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Управление ключами доступа к API")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Выпустить новый ключ")
+    create.add_argument("name", help="Владелец или назначение ключа")
+    create.add_argument("--key", help="Зарегистрировать заданный ключ вместо случайного")
+    commands.add_parser("list", help="Список ключей")
+    commands.add_parser("revoke", help="Отозвать ключ").add_argument("id", type=int, help="ID ключа")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
@@ -0,0 +1,308 @@
+"""
+Массовая загрузка справочника из файлов CSV/JSONL через COPY.
+
+Файлы читаются потоково и передаются в БД порциями, поэтому расход памяти не зависит от объема данных.
+Ссылки организаций на телефоны и виды деятельности сначала копируются во временные таблицы,
+а затем разрешаются в БД одним запросом на каждую связь. Карточки организаций (organization_cards)
+пересчитываются один раз после загрузки связей.
+
+Форматы (определяются по расширению: .csv, .jsonl/.ndjson, допускается сжатие .gz):
+  buildings:     id, address, latitude, longitude
+  activities:    id, name, parent_id (родительская деятельность должна идти в файле раньше дочерней)
+  organizations: id, name, building_id, phones, activities
+                 phones - номера телефонов, activities - ID или названия видов деятельности.
+                 В JSONL это списки, в CSV - значения через ";".
+
+Использование (из корня проекта):
+  python -m postgres_init.bulk_load --buildings buildings.csv --activities activities.csv \
+      --organizations organizations.jsonl.gz
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from typing import Iterator
+
+import asyncpg
+
+# Добавляем корневую директорию проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from postgres_init.database import DATABASE_URL
+
+
+# Количество записей в одной порции COPY
+BULK_LOAD_CHUNK_SIZE = int(os.getenv("BULK_LOAD_CHUNK_SIZE", default=50000))
+
+# Разделитель списков (телефоны, виды деятельности) в ячейке CSV
+CSV_LIST_SEPARATOR = ";"
+
+
+def open_input(path: str):
+    """
+    Открывает входной файл на чтение, распаковывая .gz на лету.
+
+    :param path: Путь к файлу
+    :return: Текстовый файловый объект
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "rt", encoding="utf-8", newline="")
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Построчно читает записи из файла CSV (с заголовком) или JSONL.
+
+    :param path: Путь к файлу
+    :return: Итератор записей-словарей
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_input(path) as file:
+        if name.endswith(".csv"):
+            yield from csv.DictReader(file)
+        elif name.endswith((".jsonl", ".ndjson")):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"Неизвестный формат файла '{path}', ожидается .csv или .jsonl")
+
+
+def as_list(value) -> list:
+    """
+    Приводит значение поля-списка к списку: JSON-список остается как есть, строка CSV делится по разделителю.
+
+    :param value: Значение поля
+    :return: Список непустых значений
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in str(value).split(CSV_LIST_SEPARATOR) if item.strip()]
+
+
+def as_optional_int(value) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def chunked(rows: Iterator, size: int) -> Iterator[list]:
+    """
+    Разбивает поток записей на порции фиксированного размера.
+
+    :param rows: Итератор записей
+    :param size: Размер порции
+    :return: Итератор порций
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def report(table: str, rows: int, started: float) -> None:
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"{table}: {rows} строк за {elapsed:.1f} с ({rows / elapsed:.0f} строк/с)")
+
+
+async def copy_chunks(connection, table: str, columns: list, rows: Iterator, chunk_size: int) -> int:
+    """
+    Загружает поток записей в таблицу порциями через COPY.
+
+    :param connection: Соединение asyncpg
+    :param table: Имя таблицы
+    :param columns: Колонки таблицы в порядке значений записей
+    :param rows: Итератор кортежей значений
+    :param chunk_size: Размер порции
+    :return: Количество загруженных записей
+    """
+    started = time.monotonic()
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        await connection.copy_records_to_table(table, records=chunk, columns=columns)
+        total += len(chunk)
+    report(table, total, started)
+    return total
+
+
+def building_rows(path: str) -> Iterator[tuple]:
+    for record in read_records(path):
+        yield int(record["id"]), record["address"], float(record["latitude"]), float(record["longitude"])
+
+
+def activity_rows(path: str) -> Iterator[tuple]:
+    for record in read_records(path):
+        yield int(record["id"]), record["name"], as_optional_int(record.get("parent_id"))
+
+
+async def load_organizations(connection, path: str, chunk_size: int) -> None:
+    """
+    Загружает организации напрямую в таблицу, а их телефоны и виды деятельности - во временные таблицы.
+    Связи разрешаются после загрузки всех организаций.
+
+    :param connection: Соединение asyncpg
+    :param path: Путь к файлу организаций
+    :param chunk_size: Размер порции
+    """
+    await connection.execute("""
+        CREATE TEMP TABLE stage_organization_phones (organization_id integer NOT NULL, number text NOT NULL)
+        ON COMMIT DROP
+    """)
+    await connection.execute("""
+        CREATE TEMP TABLE stage_organization_activities (organization_id integer NOT NULL, activity_id integer,
+                                                         activity_name text)
+        ON COMMIT DROP
+    """)
+
+    started = time.monotonic()
+    total = links = 0
+    for chunk in chunked(read_records(path), chunk_size):
+        organizations, phones, activities = [], [], []
+        for record in chunk:
+            organization_id = int(record["id"])
+            organizations.append((organization_id, record["name"], int(record["building_id"])))
+            phones.extend((organization_id, str(number)) for number in as_list(record.get("phones")))
+            for activity in as_list(record.get("activities")):
+                # Числовые ссылки считаются ID вида деятельности, остальные - названием
+                if isinstance(activity, int) or str(activity).isdigit():
+                    activities.append((organization_id, int(activity), None))
+                else:
+                    activities.append((organization_id, None, activity))
+
+        await connection.copy_records_to_table("organizations", records=organizations,
+                                               columns=["id", "name", "building_id"])
+        await connection.copy_records_to_table("stage_organization_phones", records=phones,
+                                               columns=["organization_id", "number"])
+        await connection.copy_records_to_table("stage_organization_activities", records=activities,
+                                               columns=["organization_id", "activity_id", "activity_name"])
+        total += len(organizations)
+        links += len(phones) + len(activities)
+    report("organizations", total, started)
+
+    started = time.monotonic()
+    # Без статистики по временным таблицам планировщик выбирает вложенные циклы вместо хеш-соединений
+    await connection.execute("ANALYZE stage_organization_phones, stage_organization_activities")
+    await connection.execute("""
+        INSERT INTO phones (number)
+        SELECT DISTINCT number FROM stage_organization_phones
+        ON CONFLICT (number) DO NOTHING
+    """)
+    phone_links = await connection.execute("""
+        INSERT INTO organization_phones (organization_id, phone_id)
+        SELECT DISTINCT s.organization_id, p.id
+        FROM stage_organization_phones s JOIN phones p ON p.number = s.number
+        ON CONFLICT DO NOTHING
+    """)
+    activity_links = await connection.execute("""
+        INSERT INTO organization_activities (organization_id, activity_id)
+        SELECT DISTINCT s.organization_id, a.id
+        FROM stage_organization_activities s
+        JOIN activities a ON a.id = s.activity_id
+        UNION
+        SELECT DISTINCT s.organization_id, a.id
+        FROM stage_organization_activities s
+        JOIN activities a ON a.name = s.activity_name
+        WHERE s.activity_id IS NULL
+        ON CONFLICT DO NOTHING
+    """)
+    report("organization links", links, started)
+    print(f"Связей с телефонами: {phone_links.split()[-1]}, с видами деятельности: {activity_links.split()[-1]}")
+
+    unresolved = await connection.fetchval("""
+        SELECT count(*) FROM stage_organization_activities s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM activities a
+            WHERE a.id = s.activity_id OR (s.activity_id IS NULL AND a.name = s.activity_name)
+        )
+    """)
+    if unresolved:
+        print(f"Не найдены виды деятельности для {unresolved} ссылок, эти связи пропущены")
+
+
+async def bulk_load(buildings: str = None, activities: str = None, organizations: str = None,
+                    chunk_size: int = BULK_LOAD_CHUNK_SIZE) -> None:
+    """
+    Загружает справочник в одной транзакции: при ошибке в БД не остается частично загруженных данных.
+
+    :param buildings: Путь к файлу зданий
+    :param activities: Путь к файлу видов деятельности
+    :param organizations: Путь к файлу организаций
+    :param chunk_size: Размер порции COPY
+    """
+    connection = await asyncpg.connect(DATABASE_URL.replace("+asyncpg", ""))
+    started = time.monotonic()
+    try:
+        async with connection.transaction():
+            if buildings:
+                await copy_chunks(connection, "buildings", ["id", "address", "latitude", "longitude"],
+                                  building_rows(buildings), chunk_size)
+            if activities:
+                # Таблица замыкания заполняется триггером на каждую строку, поэтому родитель должен идти раньше потомков
+                await copy_chunks(connection, "activities", ["id", "name", "parent_id"],
+                                  activity_rows(activities), chunk_size)
+            if organizations:
+                # Триггеры пересчитали бы карточки после каждой порции и каждого вида связей, поэтому в транзакции
+                # загрузки они пропускают пересчет, а карточки загруженных организаций пересчитываются один раз
+                # в конце. Настройка действует только в этой транзакции и, в отличие от отключения триггеров
+                # через ALTER TABLE, не блокирует чтение таблиц. Триггеры версии данных продолжают работать
+                cards = await connection.fetchval("SELECT to_regprocedure('organization_cards_refresh(integer[])')")
+                if cards:
+                    await connection.execute("SET LOCAL secunda.bulk_load = on")
+
+                await load_organizations(connection, organizations, chunk_size)
+
+                if cards:
+                    started_cards = time.monotonic()
+                    # Загружаются только новые организации, поэтому пересчитываются организации без карточки
+                    await connection.execute("""
+                        SELECT organization_cards_refresh(ARRAY(
+                            SELECT id FROM organizations
+                            WHERE NOT EXISTS (SELECT 1 FROM organization_cards WHERE organization_id = organizations.id)
+                        ))
+                    """)
+                    report("organization_cards", await connection.fetchval("SELECT count(*) FROM organization_cards"),
+                           started_cards)
+
+            # ID загружены явно, поэтому последовательности сдвигаем за максимальный ID
+            for table in ("buildings", "activities", "organizations", "phones"):
+                await connection.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+                )
+
+        # Статистика планировщика после массовой загрузки устарела
+        await connection.execute("ANALYZE buildings, activities, activity_closure, organizations, phones, "
+                                 "organization_phones, organization_activities, organization_cards")
+    finally:
+        await connection.close()
+
+    print(f"Загрузка завершена за {time.monotonic() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая загрузка справочника из файлов CSV/JSONL через COPY")
+    parser.add_argument("--buildings", help="Файл зданий")
+    parser.add_argument("--activities", help="Файл видов деятельности")
+    parser.add_argument("--organizations", help="Файл организаций")
+    parser.add_argument("--chunk-size", type=int, default=BULK_LOAD_CHUNK_SIZE, help="Размер порции COPY")
+    args = parser.parse_args()
+
+    if not (args.buildings or args.activities or args.organizations):
+        parser.error("Не указан ни один файл для загрузки")
+
+    try:
+        asyncio.run(bulk_load(args.buildings, args.activities, args.organizations, args.chunk_size))
+    except Exception as e:
+        print(f"Ошибка при загрузке данных: {e}")
+        sys.exit(1)
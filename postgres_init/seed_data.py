@@ -1,6 +1,6 @@
 from sqlalchemy.orm import sessionmaker
 from database import engine
-from DBModels import Building, Phone, Activity, Organization
+from DBModels import Building, Phone, Activity, Organization, ApiKey
 
 Session = sessionmaker(bind=engine)
 
@@ -80,6 +80,10 @@ def seed_data():
         session.add_all([org1, org2])
         session.commit()
 
+        # Демонстрационный ключ доступа из test.http
+        session.add(ApiKey(name="demo", key_hash=ApiKey.hash_key("ABC123")))
+        session.commit()
+
         print("Тестовые данные успешно добавлены!")
 
     except Exception as e: